@@ -22,6 +22,15 @@ export const fetchPipes = async (projectId) => {
   return response.data;
 };
 
+// Узлы и трубы проекта одним запросом: { revision, nodes, pipes }.
+// Ответ с ETag: браузер сам отправляет If-None-Match и при 304 берет данные из кэша
+export const fetchNetwork = async (projectId, { nodeFields, pipeFields } = {}) => {
+  const response = await api.get(`/projects/${projectId}/network/`, {
+    params: { node_fields: nodeFields?.join(","), pipe_fields: pipeFields?.join(",") },
+  });
+  return response.data;
+};
+
 // --- УЗЛЫ ---
 
 // Создание узла (POST)
@@ -62,13 +71,87 @@ export const deletePipe = async (id) => {
   return id;
 };
 
+// Пакет правок одной транзакцией: { nodes: { create, update, delete }, pipes: {...} }.
+// Создаваемые элементы получают temp_id, трубы могут ссылаться на temp_id узлов.
+// Возвращает { created: { nodes: { temp_id: id }, pipes }, updated, deleted, revision }
+export const batchEdit = async (projectId, operations) => {
+  const response = await api.post(`/projects/${projectId}/batch/`, operations);
+  return response.data;
+};
+
 // Запуск гидравлического расчета
-export const calculateNetwork = async (projectId) => {
-  // Отправляем POST запрос на /api/projects/{id}/calculate/
+export const calculateNetwork = async (projectId, pollInterval = 1000) => {
+  // POST /api/projects/{id}/calculate/ ставит расчет в очередь
+  // и сразу возвращает задачу: { id, status: "queued", ... }
   const response = await api.post(`/projects/${projectId}/calculate/`);
+  let job = response.data;
+
+  // Опрашиваем статус задачи, пока расчет не завершится
+  // mode=results - только id и результаты, без геометрии и повторного чтения сети
+  while (job.status === "queued" || job.status === "running") {
+    await new Promise((resolve) => setTimeout(resolve, pollInterval));
+    job = (await api.get(`/calculations/${job.id}/`, { params: { mode: "results" } })).data;
+  }
+
+  if (job.status !== "success") {
+    throw new Error(job.message || "Расчет не выполнен");
+  }
+  if (!job.data) {
+    // Расчет завершился сразу (синхронный режим) - результаты отдельным запросом
+    job = (await api.get(`/calculations/${job.id}/`, { params: { mode: "results" } })).data;
+  }
 
   // Бэкенд возвращает структуру:
-  // { status: "success", data: { nodes: FeatureCollection, pipes: FeatureCollection } }
+  // { status: "success", data: { nodes: { ids, head, pressure },
+  //                              pipes: { ids, flow_rate, velocity, head_loss } } }
+  return job;
+};
+
+// Результаты расчета столбцами (без геометрии): GET /api/projects/{id}/results/
+// Возвращает { ids: Int32Array, values: { calculated_pressure: Float32Array, ... } }
+// (NaN - нет результата). Формат пакета описан в network_api/results.py
+export const fetchResults = async (projectId, layer = "nodes", fields = []) => {
+  const response = await api.get(`/projects/${projectId}/results/`, {
+    params: { layer, fields: fields.join(",") || undefined },
+    responseType: "arraybuffer",
+  });
+  const buffer = response.data;
+  const view = new DataView(buffer);
+  const itemSize = view.getUint8(5);
+  const count = view.getUint32(8, true);
+  const namesLength = view.getUint32(12, true);
+  const align8 = (n) => n + ((8 - (n % 8)) % 8);
+
+  const names = namesLength
+    ? new TextDecoder().decode(new Uint8Array(buffer, 16, namesLength)).split(",")
+    : [];
+  let offset = 16 + align8(namesLength);
+  const ids = new Int32Array(buffer, offset, count);
+  offset += align8(4 * count);
+
+  const FloatArray = itemSize === 4 ? Float32Array : Float64Array;
+  const values = {};
+  for (const name of names) {
+    values[name] = new FloatArray(buffer, offset, count);
+    offset += itemSize * count;
+  }
+  return { ids, values };
+};
+
+// История расчетов: разность расчета runId и расчета baseId по слою
+// { ids, values: { flow_rates: [...] }, summary, added, removed }
+export const fetchRunDiff = async (runId, baseId, layer = "nodes") => {
+  const response = await api.get(`/runs/${runId}/diff/`, { params: { base: baseId, layer } });
+  return response.data;
+};
+
+// Шаблон URL векторных тайлов проекта (слои "nodes" и "pipes" с результатами расчета)
+// для слоя карты MVT, например L.vectorGrid.protobuf(tileUrl(projectId), ...)
+export const tileUrl = (projectId) => `/api/projects/${projectId}/tiles/{z}/{x}/{y}.mvt`;
+
+// Отмена расчета
+export const cancelCalculation = async (jobId) => {
+  const response = await api.post(`/calculations/${jobId}/cancel/`);
   return response.data;
 };
 
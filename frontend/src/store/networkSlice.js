@@ -10,6 +10,19 @@ import {
   calculateNetwork as apiCalculateNetwork,
 } from "../services/api";
 
+// Результаты расчета ({ ids, <поле>: [...] }) -> в свойства calculated_* объектов слоя
+const mergeResults = (features, results, fields) => {
+  if (!results) return;
+  const position = new Map(results.ids.map((id, i) => [id, i]));
+  for (const feature of features) {
+    const i = position.get(feature.id);
+    if (i === undefined) continue;
+    for (const [source, property] of fields) {
+      feature.properties[property] = results[source][i];
+    }
+  }
+};
+
 // 1. Загрузка всей сети (GET)
 export const loadNetwork = createAsyncThunk(
   "network/loadNetwork",
@@ -155,32 +168,17 @@ const networkSlice = createSlice({
       .addCase(runCalculation.fulfilled, (state, action) => {
         state.calculationStatus = "success";
 
-        // 1. Извлекаем данные из ответа
-        const incomingNodes = action.payload.data.nodes;
-        const incomingPipes = action.payload.data.pipes;
-
-        // 2. Безопасная проверка: это FeatureCollection или уже массив?
-        // Это исправит проблему с исчезающими трубами
-
-        // Обработка УЗЛОВ
-        if (incomingNodes && incomingNodes.features) {
-          state.nodes = incomingNodes.features;
-        } else if (Array.isArray(incomingNodes)) {
-          state.nodes = incomingNodes;
-        } else {
-          console.warn("Непонятный формат узлов от сервера", incomingNodes);
-          state.nodes = [];
-        }
-
-        // Обработка ТРУБ
-        if (incomingPipes && incomingPipes.features) {
-          state.pipes = incomingPipes.features;
-        } else if (Array.isArray(incomingPipes)) {
-          state.pipes = incomingPipes;
-        } else {
-          console.warn("Непонятный формат труб от сервера", incomingPipes);
-          state.pipes = [];
-        }
+        // Ответ содержит только id и результаты - дописываем их в уже загруженные объекты
+        const { nodes, pipes } = action.payload.data || {};
+        mergeResults(state.nodes, nodes, [
+          ["head", "calculated_head"],
+          ["pressure", "calculated_pressure"],
+        ]);
+        mergeResults(state.pipes, pipes, [
+          ["flow_rate", "calculated_flow_rate"],
+          ["velocity", "calculated_velocity"],
+          ["head_loss", "calculated_head_loss"],
+        ]);
 
         alert(`Расчет выполнен успешно! Обновлено труб: ${state.pipes.length}`);
       })
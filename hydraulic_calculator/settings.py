@@ -170,4 +170,70 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.SessionAuthentication',
     ],
-}
\ No newline at end of file
+}
+
+# === НАСТРОЙКИ ГИДРАВЛИЧЕСКОГО РАСЧЕТА ===
+
+# Макс. число одновременных расчетов: размер пула процессов в каждом веб-процессе
+# (не на хост!) или число процессов calculation_worker по умолчанию
+HYDRAULIC_MAX_CONCURRENT_SOLVES = 2
+
+# True - выполнять задачу расчета сразу, в потоке запроса (удобно для тестов)
+HYDRAULIC_JOBS_EAGER = False
+
+# True - задачи из очереди в БД выполняет отдельный процесс
+# (python manage.py calculation_worker --processes N); N - предел расчетов на хосте
+HYDRAULIC_JOBS_WORKER = False
+
+# Задачи, которые выполняются (или, для пула в веб-процессе, стоят в очереди)
+# дольше этого времени (с), считаются брошенными остановленным процессом и
+# отмечаются ошибкой при запуске пула или воркера
+HYDRAULIC_JOB_STALE_AFTER = 3600
+
+# Число процессов для пакетов Монте-Карло (по умолчанию - все ядра)
+HYDRAULIC_MONTE_CARLO_WORKERS = os.cpu_count() or 1
+
+# Пиковая память расчета (tracemalloc) в блоке diagnostics - замедляет расчет
+HYDRAULIC_TRACK_MEMORY = False
+
+# Счетчики расчетов в формате Prometheus: GET /api/metrics/
+HYDRAULIC_METRICS_ENABLED = True
+
+# Потоковая выдача слоев /api/nodes/, /api/pipes/: строк в пачке курсора и
+# геометрия через ST_AsGeoJSON (False - через GEOS, например без PostGIS)
+HYDRAULIC_GEOJSON_CHUNK_SIZE = 2000
+HYDRAULIC_GEOJSON_POSTGIS = True
+
+# Каждый расчет пишется в историю (/api/runs/) одной строкой; False - поля
+# calculated_* узлов и труб не обновляются (без UPDATE по строкам сети)
+HYDRAULIC_WRITE_ELEMENT_RESULTS = True
+
+# Векторные тайлы /api/projects/{id}/tiles/{z}/{x}/{y}.mvt: время жизни тайла
+# в кэше Django (с); ключ включает версию сети, устаревшие тайлы не выдаются
+HYDRAULIC_TILE_CACHE_TIMEOUT = 24 * 3600
+
+# Метод 'auto': стратегии решения по очереди (newton - GGA, hybr / lm -
+# scipy.optimize.root с плотным якобианом, krylov - без матрицы якобиана) и
+# общий бюджет расчета - время (с) и число вычислений невязок
+HYDRAULIC_SOLVER_STRATEGIES = ('newton', 'hybr', 'lm', 'krylov')
+HYDRAULIC_SOLVER_TIME_BUDGET = 60.0
+HYDRAULIC_SOLVER_EVALUATION_BUDGET = 20000
+
+# Отмена задачи проверяется и в итерациях решателя - не чаще раза в столько секунд
+# (каждая проверка - запрос к БД)
+HYDRAULIC_CANCEL_CHECK_INTERVAL = 0.5
+
+# Журнал расчетов (network_api) - в консоль; DEBUG - подробности по этапам решателя
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'simple': {'format': '%(asctime)s %(levelname)s %(name)s: %(message)s'},
+    },
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler', 'formatter': 'simple'},
+    },
+    'loggers': {
+        'network_api': {'handlers': ['console'], 'level': 'INFO'},
+    },
+}
@@ -1,6 +1,10 @@
 from django.contrib.gis import admin
-from .models import Project, Node, Pipe
+from .models import Project, Node, Pipe, CalculationJob, DemandPattern, ExtendedPeriodRun, CalculationRun
 
 admin.site.register(Project)
 admin.site.register(Node, admin.GISModelAdmin)  # Используем GISModelAdmin
-admin.site.register(Pipe, admin.GISModelAdmin)
\ No newline at end of file
+admin.site.register(Pipe, admin.GISModelAdmin)
+admin.site.register(CalculationJob)
+admin.site.register(DemandPattern)
+admin.site.register(ExtendedPeriodRun)
+admin.site.register(CalculationRun)
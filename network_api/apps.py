@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class NetworkApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'network_api'
+
+    def ready(self):
+        from . import signals  # noqa: F401 - обработчики изменения узлов и труб
@@ -0,0 +1,279 @@
+# network_api/batch.py
+#
+# Пакетное редактирование сети проекта одним запросом (POST /api/projects/{id}/batch/):
+# создание, изменение и удаление узлов и труб в одной транзакции.
+#
+#   {"nodes": {"create": [{"temp_id": "n1", "elevation": 10, "geometry": {...}}, ...],
+#              "update": [{"id": 5, "base_demand": 0.01}, ...],
+#              "delete": [7, 8]},
+#    "pipes": {"create": [{"temp_id": "p1", "from_node": "n1", "to_node": 5, ...}, ...],
+#              "update": [...], "delete": [...]}}
+#
+# Ссылки на узлы (from_node, to_node) - id из БД (число) или temp_id узла,
+# создаваемого в этом же пакете (строка). Проверка всего пакета - один проход
+# с запросами по множествам id (а не по элементам); при ошибках ничего не
+# записывается и возвращается список всех ошибок. Запись - bulk_create /
+# bulk_update / delete по множеству id; версия сети растет один раз на пакет.
+
+import json
+
+from django.contrib.gis.geos import GEOSException, GEOSGeometry
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Q
+
+from .models import DemandPattern, Node, Pipe, Project
+from .signals import revision_signals_suppressed
+
+# Поля, доступные для записи, по слоям
+EDITABLE_FIELDS = {
+    'nodes': ('name', 'elevation', 'node_type', 'base_demand', 'demand_pattern', 'fixed_head', 'geometry'),
+    'pipes': ('name', 'from_node', 'to_node', 'length', 'diameter', 'roughness_coefficient', 'material', 'geometry'),
+}
+MODELS = {'nodes': Node, 'pipes': Pipe}
+OPERATIONS = ('create', 'update', 'delete')
+
+
+class BatchEdit:
+    """
+    Пакет правок проекта. Использование:
+        batch = BatchEdit(project, payload)
+        if batch.validate():  # список ошибок
+            ...
+        report = batch.apply()
+    """
+
+    def __init__(self, project, payload):
+        self.project = project
+        self.payload = payload if isinstance(payload, dict) else {}
+        self.errors = []
+        self.ops = {layer: {'create': [], 'update': [], 'delete': []} for layer in MODELS}
+        self.temp_ids = {layer: set() for layer in MODELS}
+
+    def error(self, layer, op, index, message):
+        self.errors.append({"layer": layer, "op": op, "index": index, "message": message})
+
+    # ------------------------------------------------------------------
+    # Проверка
+    # ------------------------------------------------------------------
+    def validate(self):
+        """Проверка всего пакета; возвращает список ошибок (пустой - пакет корректен)."""
+        if not isinstance(self.payload, dict) or set(self.payload) - set(MODELS):
+            self.error(None, None, None, "Ожидается объект с ключами nodes и/или pipes")
+            return self.errors
+
+        for layer in MODELS:
+            section = self.payload.get(layer) or {}
+            if not isinstance(section, dict) or set(section) - set(OPERATIONS):
+                self.error(layer, None, None, "Ожидается объект с ключами create, update, delete")
+                continue
+            for op in OPERATIONS:
+                items = section.get(op) or []
+                if not isinstance(items, list):
+                    self.error(layer, op, None, "Ожидается список")
+                    continue
+                self.ops[layer][op] = items
+
+        if self.errors:
+            return self.errors
+
+        self.validate_deletes()
+        for layer in MODELS:
+            self.validate_items(layer, 'create')
+            self.validate_items(layer, 'update')
+        if not self.errors:
+            self.validate_references()
+        return self.errors
+
+    def project_ids(self, model, ids):
+        """Какие из ids есть в проекте (один запрос)."""
+        return set(model.objects.filter(project=self.project, pk__in=ids).values_list('pk', flat=True))
+
+    def validate_deletes(self):
+        for layer, model in MODELS.items():
+            ids = self.ops[layer]['delete']
+            if not all(isinstance(pk, int) for pk in ids):
+                self.error(layer, 'delete', None, "Ожидается список id")
+                continue
+            missing = set(ids) - self.project_ids(model, ids)
+            if missing:
+                self.error(layer, 'delete', None, f"Нет в проекте: {sorted(missing)}")
+
+    def validate_items(self, layer, op):
+        model = MODELS[layer]
+        editable = EDITABLE_FIELDS[layer]
+        items = self.ops[layer][op]
+        cleaned = []
+
+        update_ids = [
+            item.get('id') for item in items if isinstance(item, dict) and isinstance(item.get('id'), int)
+        ] if op == 'update' else []
+        existing = self.project_ids(model, update_ids) if update_ids else set()
+        deleted = set(self.ops[layer]['delete'])
+
+        for index, item in enumerate(items):
+            if not isinstance(item, dict):
+                self.error(layer, op, index, "Ожидается объект")
+                continue
+            unknown = set(item) - set(editable) - {'id', 'temp_id'}
+            if unknown:
+                self.error(layer, op, index, f"Неизвестные поля: {', '.join(sorted(unknown))}")
+                continue
+
+            if op == 'create':
+                temp_id = item.get('temp_id')
+                if not isinstance(temp_id, str) or not temp_id:
+                    self.error(layer, op, index, "Нужен temp_id (строка)")
+                    continue
+                if temp_id in self.temp_ids[layer]:
+                    self.error(layer, op, index, f"Повторный temp_id: {temp_id}")
+                    continue
+                self.temp_ids[layer].add(temp_id)
+                required = [
+                    field.name for field in model._meta.concrete_fields
+                    if field.name in editable and not field.null and not field.has_default() and field.name not in item
+                ]
+                if required:
+                    self.error(layer, op, index, f"Не заданы поля: {', '.join(required)}")
+                    continue
+            else:
+                pk = item.get('id')
+                if not isinstance(pk, int) or pk not in existing or pk in deleted:
+                    self.error(layer, op, index, f"Элемент {pk} не найден в проекте")
+                    continue
+
+            values = {}
+            for name, value in item.items():
+                if name in ('id', 'temp_id'):
+                    continue
+                try:
+                    values[name] = self.clean_value(model._meta.get_field(name), value)
+                except (ValidationError, ValueError, TypeError, GEOSException) as e:
+                    message = '; '.join(e.messages) if isinstance(e, ValidationError) else str(e)
+                    self.error(layer, op, index, f"{name}: {message}")
+            cleaned.append((index, item.get('temp_id') if op == 'create' else item['id'], values))
+
+        self.ops[layer][op] = cleaned
+
+    def clean_value(self, field, value):
+        """Значение поля модели; внешние ключи - как есть (проверяются в validate_references)."""
+        if field.is_relation:
+            if value is None and field.null:
+                return None
+            if not isinstance(value, (int, str)) or isinstance(value, bool):
+                raise ValueError("ожидается id или temp_id")
+            return value
+        if hasattr(field, 'geom_type'):
+            geometry = GEOSGeometry(json.dumps(value) if isinstance(value, dict) else value)
+            if geometry.geom_type.upper() != field.geom_type.upper():
+                raise ValueError(f"ожидается геометрия {field.geom_type}")
+            if geometry.srid is None:
+                geometry.srid = field.srid
+            return geometry
+        return field.clean(value, None)
+
+    def validate_references(self):
+        """Ссылки труб на узлы и узлов на шаблоны - по множествам id, по запросу на таблицу."""
+        deleted_nodes = set(self.ops['nodes']['delete'])
+        node_refs = {
+            value for op in ('create', 'update') for _, _, values in self.ops['pipes'][op]
+            for name, value in values.items() if name in ('from_node', 'to_node') and isinstance(value, int)
+        }
+        existing_nodes = self.project_ids(Node, node_refs) - deleted_nodes
+
+        pattern_refs = {
+            values['demand_pattern'] for op in ('create', 'update') for _, _, values in self.ops['nodes'][op]
+            if values.get('demand_pattern') is not None
+        }
+        # Трубы удаляемых узлов удаляются вместе с ними (CASCADE) - изменять их нельзя
+        updated_pipes = [pk for _, pk, _ in self.ops['pipes']['update']]
+        cascaded = set(
+            Pipe.objects.filter(pk__in=updated_pipes)
+            .filter(Q(from_node__in=deleted_nodes) | Q(to_node__in=deleted_nodes))
+            .values_list('pk', flat=True)
+        ) if updated_pipes and deleted_nodes else set()
+        for index, pk, _ in self.ops['pipes']['update']:
+            if pk in cascaded:
+                self.error('pipes', 'update', index, f"Труба {pk} удаляется вместе с удаляемым узлом")
+
+        existing_patterns = set(
+            DemandPattern.objects.filter(project=self.project, pk__in=[p for p in pattern_refs if isinstance(p, int)])
+            .values_list('pk', flat=True)
+        )
+
+        for op in ('create', 'update'):
+            for index, _, values in self.ops['pipes'][op]:
+                for name in ('from_node', 'to_node'):
+                    ref = values.get(name)
+                    if ref is None:
+                        continue
+                    if isinstance(ref, str) and ref not in self.temp_ids['nodes']:
+                        self.error('pipes', op, index, f"{name}: нет узла с temp_id {ref}")
+                    elif isinstance(ref, int) and ref not in existing_nodes:
+                        self.error('pipes', op, index, f"{name}: узел {ref} не найден в проекте")
+            for index, _, values in self.ops['nodes'][op]:
+                ref = values.get('demand_pattern')
+                if ref is not None and ref not in existing_patterns:
+                    self.error('nodes', op, index, f"demand_pattern: шаблон {ref} не найден в проекте")
+
+    # ------------------------------------------------------------------
+    # Запись
+    # ------------------------------------------------------------------
+    def apply(self):
+        """Запись пакета одной транзакцией (после validate без ошибок). Возвращает отчет."""
+        if self.errors:
+            raise ValueError("Пакет содержит ошибки")
+
+        with transaction.atomic(), revision_signals_suppressed():
+            deleted = {}
+            for layer in ('pipes', 'nodes'):
+                ids = self.ops[layer]['delete']
+                deleted[layer] = len(ids)
+                if ids:
+                    # post_delete на каждую строку (и каскадные трубы) - без UPDATE версии, она растет ниже один раз
+                    MODELS[layer].objects.filter(project=self.project, pk__in=ids).delete()
+
+            created = {'nodes': self.create('nodes', {}), 'pipes': {}}
+            temp_map = created['nodes']
+            updated = {'nodes': self.update('nodes', temp_map)}
+            created['pipes'] = self.create('pipes', temp_map)
+            updated['pipes'] = self.update('pipes', temp_map)
+
+            Project.bump_revision(self.project.pk)  # Одна новая версия на пакет (см. signals.py)
+
+        revision = Project.objects.filter(pk=self.project.pk).values_list('revision', flat=True).first()
+        return {"created": created, "updated": updated, "deleted": deleted, "revision": revision}
+
+    def attributes(self, values, temp_map):
+        """Значения полей -> атрибуты модели (ссылки на узлы и шаблоны - через *_id)."""
+        attrs = {}
+        for name, value in values.items():
+            if name in ('from_node', 'to_node', 'demand_pattern'):
+                attrs[f'{name}_id'] = temp_map[value] if isinstance(value, str) else value
+            else:
+                attrs[name] = value
+        return attrs
+
+    def create(self, layer, temp_map):
+        """bulk_create; возвращает {temp_id: id}."""
+        model = MODELS[layer]
+        items = self.ops[layer]['create']
+        objects = [model(project=self.project, **self.attributes(values, temp_map)) for _, _, values in items]
+        model.objects.bulk_create(objects, batch_size=1000)
+        return {temp_id: obj.pk for (_, temp_id, _), obj in zip(items, objects)}
+
+    def update(self, layer, temp_map):
+        """Изменение: один SELECT изменяемых объектов и bulk_update по объединению полей."""
+        model = MODELS[layer]
+        items = self.ops[layer]['update']
+        if not items:
+            return 0
+        instances = model.objects.in_bulk([pk for _, pk, _ in items])
+        fields = set()
+        for _, pk, values in items:
+            for attr, value in self.attributes(values, temp_map).items():
+                setattr(instances[pk], attr, value)
+            fields.update(values)
+        if fields:
+            model.objects.bulk_update(list(instances.values()), sorted(fields), batch_size=1000)
+        return len(items)
@@ -0,0 +1,312 @@
+# network_api/benchmark.py
+#
+# Набор синтетических сетей для замеров HydraulicSolver: сетка, дерево,
+# кольцевая магистраль с ответвлениями и случайный геометрический граф.
+# Сети строятся в памяти (несохраненные объекты Node/Pipe) - БД не нужна.
+# Генерация воспроизводима: одинаковые (вид, размер, seed) дают одну сеть.
+# Запуск: python manage.py benchmark_solver (см. management/commands).
+
+import platform
+import time
+import tracemalloc
+
+import numpy as np
+import scipy
+from scipy import sparse
+from scipy.sparse import csgraph
+from scipy.spatial import cKDTree
+
+from .models import Node, Pipe
+from .network import NetworkArrays
+from .services import HydraulicSolver
+
+KINDS = ('grid', 'tree', 'ring', 'geometric')
+
+# Стандартные диаметры (мм); трубы подбираются по скорости ~1 м/с
+STANDARD_DIAMETERS = np.array([100, 150, 200, 250, 300, 400, 500, 600, 800, 1000, 1200])
+
+NODE_DEMAND = 1e-4          # Потребление узла, м3/с (0.1 л/с)
+NODES_PER_SOURCE = 1000     # Один источник на столько узлов
+SOURCE_HEAD = 60.0          # Напор источников, м
+SPACING = 100.0             # Характерная длина трубы, м
+
+
+def grid_edges(n, rng):
+    """Прямоугольная сетка ~n узлов (k x k) с шагом SPACING."""
+    k = max(2, int(round(np.sqrt(n))))
+    idx = np.arange(k * k).reshape(k, k)
+    edges = np.concatenate([
+        np.column_stack([idx[:, :-1].ravel(), idx[:, 1:].ravel()]),
+        np.column_stack([idx[:-1, :].ravel(), idx[1:, :].ravel()]),
+    ])
+    lengths = np.full(len(edges), SPACING)
+    return k * k, edges, lengths
+
+
+def tree_edges(n, rng):
+    """Случайное дерево: каждый новый узел подключается к одному из предыдущих."""
+    n = max(n, 2)
+    parents = (rng.random(n - 1) * np.arange(1, n)).astype(np.int64)
+    edges = np.column_stack([parents, np.arange(1, n)])
+    return n, edges, rng.uniform(0.2, 2.0, n - 1) * SPACING
+
+
+def ring_edges(n, rng):
+    """
+    Кольцевая магистраль из ~n/10 узлов, несколько перемычек через кольцо,
+    остальные узлы - короткие тупиковые ответвления (по 1-3 узла) от магистрали.
+    """
+    n = max(n, 4)
+    ring = max(3, n // 10)
+    edges = [np.column_stack([np.arange(ring), (np.arange(ring) + 1) % ring])]
+    chords = max(1, ring // 20)
+    a = rng.integers(0, ring, chords)
+    edges.append(np.column_stack([a, (a + ring // 2) % ring]))
+
+    branch_edges = []
+    node = ring
+    while node < n:
+        attach = int(rng.integers(0, ring))
+        for _ in range(min(int(rng.integers(1, 4)), n - node)):
+            branch_edges.append((attach, node))
+            attach, node = node, node + 1
+    if branch_edges:
+        edges.append(np.array(branch_edges))
+
+    edges = np.concatenate(edges)
+    edges = edges[edges[:, 0] != edges[:, 1]]
+    return n, edges, rng.uniform(0.5, 3.0, len(edges)) * SPACING
+
+
+def geometric_edges(n, rng):
+    """
+    Случайный геометрический граф: точки равномерно в квадрате (плотность
+    постоянная, шаг ~SPACING), трубы между точками ближе радиуса связности.
+    Отдельные компоненты связности соединяются с ближайшей точкой основной.
+    """
+    n = max(n, 2)
+    side = np.sqrt(n) * SPACING
+    points = rng.random((n, 2)) * side
+    radius = SPACING * np.sqrt(1.5 * np.log(n) / np.pi) + SPACING
+    tree = cKDTree(points)
+    edges = tree.query_pairs(radius, output_type='ndarray')
+
+    graph = sparse.coo_matrix((np.ones(len(edges)), (edges[:, 0], edges[:, 1])), shape=(n, n))
+    count, labels = csgraph.connected_components(graph, directed=False)
+    if count > 1:
+        main = np.argmax(np.bincount(labels))
+        main_points = np.flatnonzero(labels == main)
+        main_tree = cKDTree(points[main_points])
+        extra = []
+        for component in range(count):
+            if component == main:
+                continue
+            first = np.flatnonzero(labels == component)[0]
+            extra.append((first, main_points[main_tree.query(points[first])[1]]))
+        edges = np.concatenate([edges, np.array(extra)])
+
+    lengths = np.linalg.norm(points[edges[:, 0]] - points[edges[:, 1]], axis=1)
+    return n, edges, np.maximum(lengths, 1.0)
+
+
+GENERATORS = {
+    'grid': grid_edges,
+    'tree': tree_edges,
+    'ring': ring_edges,
+    'geometric': geometric_edges,
+}
+
+
+def size_diameters(n, edges, sources, demands):
+    """
+    Диаметры по расходу: дерево обхода в ширину от источников, по нему
+    накапливается потребление к источнику; D - ближайший стандартный
+    диаметр для скорости 1 м/с. Трубы вне дерева (кольца) - минимальные.
+    """
+    # Виртуальный узел n соединен со всеми источниками
+    rows = np.concatenate([edges[:, 0], edges[:, 1], np.full(len(sources), n)])
+    cols = np.concatenate([edges[:, 1], edges[:, 0], sources])
+    graph = sparse.coo_matrix((np.ones(rows.size), (rows, cols)), shape=(n + 1, n + 1)).tocsr()
+    order, predecessors = csgraph.breadth_first_order(graph, n, directed=False)
+
+    carried = np.append(demands, 0.0)
+    for node in order[::-1][:-1]:
+        carried[predecessors[node]] += carried[node]
+
+    # Труба дерева = (предшественник, узел); расход трубы - накопленный у узла
+    flows = np.zeros(len(edges))
+    a, b = edges[:, 0], edges[:, 1]
+    tree_ab = predecessors[b] == a
+    tree_ba = predecessors[a] == b
+    flows[tree_ab] = carried[b[tree_ab]]
+    flows[tree_ba] = carried[a[tree_ba]]
+
+    needed = np.sqrt(4.0 * flows / np.pi) * 1000.0  # мм при v = 1 м/с
+    pos = np.minimum(np.searchsorted(STANDARD_DIAMETERS, needed), STANDARD_DIAMETERS.size - 1)
+    return STANDARD_DIAMETERS[pos].astype(float)
+
+
+def generate_network(kind, size, seed=0):
+    """
+    Синтетическая сеть в памяти: (nodes, pipes) - несохраненные Node и Pipe
+    с id по порядку. Источники - случайные узлы (один на NODES_PER_SOURCE).
+    """
+    if kind not in GENERATORS:
+        raise ValueError(f"Неизвестный вид сети: {kind}")
+    rng = np.random.default_rng([seed, KINDS.index(kind), size])
+    n, edges, lengths = GENERATORS[kind](int(size), rng)
+
+    sources = rng.choice(n, size=max(1, n // NODES_PER_SOURCE), replace=False)
+    is_source = np.zeros(n, dtype=bool)
+    is_source[sources] = True
+    demands = np.where(is_source, 0.0, NODE_DEMAND * rng.uniform(0.5, 1.5, n))
+    elevations = rng.uniform(0.0, 20.0, n)
+    diameters = size_diameters(n, edges, sources, demands)
+
+    nodes = [
+        Node(
+            id=i + 1,
+            node_type='Reservoir' if is_source[i] else 'Junction',
+            elevation=float(elevations[i]),
+            base_demand=float(demands[i]),
+            fixed_head=SOURCE_HEAD if is_source[i] else None,
+        )
+        for i in range(n)
+    ]
+    pipes = [
+        Pipe(
+            id=p + 1,
+            from_node_id=int(a) + 1,
+            to_node_id=int(b) + 1,
+            length=float(length),
+            diameter=float(diameter),
+            roughness_coefficient=0.1,
+        )
+        for p, (a, b, length, diameter) in enumerate(zip(edges[:, 0], edges[:, 1], lengths, diameters))
+    ]
+    return nodes, pipes
+
+
+def convergence_order(step_norms):
+    """Оценка порядка сходимости по трем последним шагам: log(e3/e2) / log(e2/e1)."""
+    e = [x for x in step_norms if x > 0]
+    if len(e) < 3:
+        return None
+    e1, e2, e3 = e[-3:]
+    if e1 == e2:
+        return None
+    return float(np.log(e3 / e2) / np.log(e2 / e1))
+
+
+def run_case(kind, size, method='gga', seed=0, linear_solver='superlu', preconditioner='jacobi',
+             topology_reduction=True, track_memory=True):
+    """
+    Один замер: генерация сети, подготовка массивов, начальное приближение,
+    расчет и итоговые расходы/давления (как в save_results, без записи в БД).
+    Возвращает словарь с временем по этапам (с), итерациями, вычислениями
+    невязок, пиковой памятью (МБ, tracemalloc) и невязкой решения
+    (по сохраняемым расходам, см. HydraulicSolver.solution_residuals).
+    """
+    phases = {}
+
+    started = time.perf_counter()
+    network = NetworkArrays.from_objects(*generate_network(kind, size, seed))
+    phases['generate'] = time.perf_counter() - started
+
+    if track_memory:
+        tracemalloc.start()
+
+    solver = HydraulicSolver(project_id=None)
+    solver.use_cache = False
+    solver.linear_solver = linear_solver
+    solver.preconditioner = preconditioner
+    solver.use_topology_reduction = topology_reduction
+
+    started = time.perf_counter()
+    solver.set_network(network)
+    phases['build'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    initial_heads = solver.initial_guess(warm=False)
+    phases['initial_guess'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    heads, converged, message = solver.run_method(method, initial_heads)
+    phases['solve'] = time.perf_counter() - started
+    residual_evaluations = solver.counters["residual_evaluations"]  # До проверки невязки решения ниже
+
+    started = time.perf_counter()
+    flows = solver.solution_flows(heads)
+    residual = float(np.abs(solver.solution_residuals(heads, flows)).max())
+    pressures = heads - solver.elevations
+    phases['results'] = time.perf_counter() - started
+
+    peak_memory = None
+    if track_memory:
+        peak_memory = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        tracemalloc.stop()
+
+    return {
+        "kind": kind,
+        "size": int(size),
+        "seed": seed,
+        "method": method,
+        "linear_solver": linear_solver if method == 'gga' else None,
+        "preconditioner": preconditioner if method == 'gga' and linear_solver == 'cg' else None,
+        "nodes": network.node_count,
+        "pipes": network.pipe_count,
+        "core_nodes": solver.reduction["core_nodes"] if solver.reduction else network.node_count,
+        "converged": bool(converged),
+        "message": str(message),
+        "iterations": solver.iterations,
+        "residual_evaluations": residual_evaluations,
+        "flow_for_headloss_calls": solver.counters["flow_for_headloss_calls"],
+        "convergence_order": convergence_order(solver.step_norms) if method == 'gga' else None,
+        "attempts": [attempt["strategy"] for attempt in solver.attempts] if method == 'auto' else None,
+        "max_residual": residual,
+        "min_pressure": float(pressures.min()),
+        "max_flow": float(np.abs(flows).max()) if flows.size else 0.0,
+        "phases": {name: round(value, 6) for name, value in phases.items()},
+        "wall_time": round(sum(value for name, value in phases.items() if name != 'generate'), 6),
+        "peak_memory_mb": round(peak_memory, 3) if peak_memory is not None else None,
+    }
+
+
+def run_suite(kinds=KINDS, sizes=(10, 100, 1000, 10000), methods=('gga',), seeds=(0,),
+              fsolve_max_nodes=1000, progress=None, **options):
+    """
+    Полный набор замеров. fsolve (плотный якобиан N x N) пропускается для сетей
+    больше fsolve_max_nodes. progress - необязательная функция для вывода строки о замере.
+    Возвращает отчет (dict) для сохранения в JSON.
+    """
+    results = []
+    for kind in kinds:
+        for size in sizes:
+            for method in methods:
+                if method == 'fsolve' and size > fsolve_max_nodes:
+                    continue
+                for seed in seeds:
+                    result = run_case(kind, size, method=method, seed=seed, **options)
+                    results.append(result)
+                    if progress is not None:
+                        progress(result)
+
+    converged = sum(result["converged"] for result in results)
+    return {
+        "created": time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        "environment": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "scipy": scipy.__version__,
+            "machine": platform.machine(),
+            "processor": platform.processor(),
+        },
+        "options": {"fsolve_max_nodes": fsolve_max_nodes, **options},
+        "summary": {
+            "cases": len(results),
+            "converged": converged,
+            "convergence_rate": converged / len(results) if results else None,
+            "wall_time": round(sum(result["wall_time"] for result in results), 6),
+        },
+        "results": results,
+    }
@@ -0,0 +1,100 @@
+# network_api/diagnostics.py
+#
+# Замеры расчета: таймер этапов (load, index, assemble, solve, save) и
+# счетчики процесса в текстовом формате Prometheus (GET /api/metrics/).
+# Счетчики живут в памяти процесса: каждый процесс веб-сервера считает
+# задачи, которые он поставил (итоги приходят из пула, см. jobs.py).
+
+import threading
+import time
+from contextlib import contextmanager
+
+
+class PhaseTimer:
+    """
+    Время по этапам (с). Этапы могут быть вложенными: время внутреннего этапа
+    не входит во внешний, поэтому сумма этапов равна общему времени.
+    """
+
+    def __init__(self):
+        self.totals = {}
+        self._stack = []  # [имя, время начала текущего отрезка]
+
+    @contextmanager
+    def phase(self, name):
+        now = time.perf_counter()
+        if self._stack:
+            outer = self._stack[-1]
+            self.totals[outer[0]] = self.totals.get(outer[0], 0.0) + now - outer[1]
+        self._stack.append([name, now])
+        try:
+            yield
+        finally:
+            now = time.perf_counter()
+            inner = self._stack.pop()
+            self.totals[name] = self.totals.get(name, 0.0) + now - inner[1]
+            if self._stack:
+                self._stack[-1][1] = now
+
+    def reset(self):
+        self.totals = {}
+        self._stack = []
+
+    def as_dict(self, digits=6):
+        return {name: round(value, digits) for name, value in self.totals.items()}
+
+
+class MetricsRegistry:
+    """Счетчики с метками; render() - текстовый формат Prometheus 0.0.4."""
+
+    HELP = {
+        "hydraulic_jobs_total": "Завершенные задачи расчета по виду и статусу",
+        "hydraulic_iterations_total": "Итерации метода глобального градиента",
+        "hydraulic_function_evaluations_total": "Вычисления невязок fsolve",
+        "hydraulic_residual_evaluations_total": "Все вычисления невязок уравнений баланса",
+        "hydraulic_flow_for_headloss_calls_total": "Вызовы обратной задачи Q(h) по трубам",
+        "hydraulic_phase_seconds_total": "Время расчета по этапам, с",
+    }
+
+    def __init__(self):
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def record_job(self, kind, status, diagnostics=None):
+        """Итог задачи расчета: статус и счетчики из блока diagnostics."""
+        self.inc("hydraulic_jobs_total", kind=kind, status=status)
+        if not diagnostics:
+            return
+        counters = diagnostics.get("counters", {})
+        self.inc("hydraulic_iterations_total", diagnostics.get("iterations") or 0)
+        self.inc("hydraulic_function_evaluations_total", diagnostics.get("function_evaluations") or 0)
+        self.inc("hydraulic_residual_evaluations_total", counters.get("residual_evaluations", 0))
+        self.inc("hydraulic_flow_for_headloss_calls_total", counters.get("flow_for_headloss_calls", 0))
+        for phase, seconds in diagnostics.get("phases", {}).items():
+            self.inc("hydraulic_phase_seconds_total", seconds, phase=phase)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def render(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        lines = []
+        seen = set()
+        for (name, labels), value in values:
+            if name not in seen:
+                seen.add(name)
+                lines.append(f"# HELP {name} {self.HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} counter")
+            label_text = ",".join(f'{key}="{val}"' for key, val in labels)
+            lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
@@ -0,0 +1,250 @@
+# network_api/epanet.py
+#
+# Импорт и экспорт сети в формате EPANET (.inp).
+#
+# Импорт читает файл построчно (секции JUNCTIONS, RESERVOIRS, TANKS, PIPES,
+# COORDINATES, VERTICES, OPTIONS), хранит только компактные кортежи строк
+# и пишет узлы и трубы пакетами bulk_create в одной транзакции; ссылки труб
+# на узлы разрешаются через словарь "ID EPANET -> id в БД". Координаты в .inp
+# обычно идут после узлов и труб, поэтому запись - после чтения всего файла.
+#
+# Перевод в единицы модели: расход - м3/с, длины и отметки - м, диаметр и
+# шероховатость - мм (Дарси-Вейсбах). Для Хазена-Вильямса (H-W, по умолчанию
+# в EPANET) и Маннинга коэффициент пересчитывается в эквивалентную
+# шероховатость по совпадению потерь при скорости 1 м/с (см. equivalent_roughness).
+# Насосы, клапаны, шаблоны и управление не переносятся (решатель их не учитывает);
+# закрытые трубы (Status CLOSED) не создаются. Число пропущенных элементов - в отчете.
+#
+# Экспорт - генератор строк .inp (единицы LPS, потери D-W) по values_list,
+# без объектов моделей.
+
+import re
+from collections import Counter
+
+import numpy as np
+from django.contrib.gis.geos import LineString, Point
+from django.db import transaction
+
+from .models import Node, Pipe, Project
+
+# Расход в единицах EPANET -> м3/с
+FLOW_UNITS = {
+    'LPS': 1e-3, 'LPM': 1e-3 / 60.0, 'MLD': 1e3 / 86400.0, 'CMH': 1.0 / 3600.0, 'CMD': 1.0 / 86400.0,
+    'CFS': 0.0283168, 'GPM': 6.30902e-5, 'MGD': 0.0438126, 'IMGD': 0.0526168, 'AFD': 0.0142764,
+}
+US_UNITS = ('CFS', 'GPM', 'MGD', 'IMGD', 'AFD')
+FOOT = 0.3048
+INCH_MM = 25.4
+
+SUPPORTED_SECTIONS = ('JUNCTIONS', 'RESERVOIRS', 'TANKS', 'PIPES', 'COORDINATES', 'VERTICES', 'OPTIONS')
+SKIPPED_SECTIONS = ('PUMPS', 'VALVES')
+VALID_ID = re.compile(r'^[^\s;"]{1,31}$')
+
+
+def read_sections(lines):
+    """Генератор (секция, поля) по строкам .inp; комментарии (;) и пустые строки пропускаются."""
+    section = None
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode('utf-8', errors='replace')
+        line = line.split(';', 1)[0].strip()
+        if not line:
+            continue
+        if line.startswith('['):
+            section = line.strip('[]').strip().upper()
+            continue
+        yield section, line.split()
+
+
+def equivalent_roughness(formula, coefficient, diameter_m, g=9.81, viscosity=1.004e-6):
+    """
+    Шероховатость Дарси-Вейсбаха (м) с теми же потерями, что у H-W (C) или
+    Маннинга (n), при скорости 1 м/с: f из равенства потерь, eps - из формулы Колбрука.
+    """
+    D = np.asarray(diameter_m, dtype=float)
+    c = np.asarray(coefficient, dtype=float)
+    v = 1.0
+    Q = v * np.pi * D ** 2 / 4.0
+    if formula == 'H-W':
+        slope = 10.67 * Q ** 1.852 / (c ** 1.852 * D ** 4.87)
+    else:  # C-M
+        slope = c ** 2 * v ** 2 / (D / 4.0) ** (4.0 / 3.0)
+    f = slope * 2.0 * g * D / v ** 2
+    Re = v * D / viscosity
+    eps = 3.7 * D * (10.0 ** (-1.0 / (2.0 * np.sqrt(f))) - 2.51 / (Re * np.sqrt(f)))
+    return np.maximum(eps, 0.0)
+
+
+class InpImporter:
+    """
+    Импорт .inp в проект. Использование:
+        importer = InpImporter(project, batch_size=5000)
+        importer.read(lines)       # построчно, файл целиком в память не читается
+        report = importer.save()   # bulk_create в одной транзакции
+    """
+
+    def __init__(self, project, batch_size=5000):
+        self.project = project
+        self.batch_size = batch_size
+        self.options = {'UNITS': 'GPM', 'HEADLOSS': 'H-W'}  # Значения EPANET по умолчанию
+        self.nodes = {}        # ID -> (тип, отметка, потребление, напор)
+        self.pipes = []        # (ID, от, к, длина, диаметр, шероховатость)
+        self.coordinates = {}  # ID узла -> (x, y)
+        self.vertices = {}     # ID трубы -> [(x, y), ...]
+        self.skipped = Counter()
+
+    def read(self, lines):
+        for section, fields in read_sections(lines):
+            try:
+                self.read_row(section, fields)
+            except (IndexError, ValueError) as e:
+                raise ValueError(f"[{section}] {' '.join(fields)}: {e}") from e
+        return self
+
+    def read_row(self, section, fields):
+        if section == 'JUNCTIONS':
+            demand = float(fields[2]) if len(fields) > 2 else 0.0
+            self.nodes[fields[0]] = ('Junction', float(fields[1]), demand, None)
+        elif section == 'RESERVOIRS':
+            self.nodes[fields[0]] = ('Reservoir', 0.0, 0.0, float(fields[1]))
+        elif section == 'TANKS':
+            # Бак - источник с напором "отметка + начальный уровень"
+            elevation = float(fields[1])
+            self.nodes[fields[0]] = ('Tank', elevation, 0.0, elevation + float(fields[2]))
+        elif section == 'PIPES':
+            status = fields[7].upper() if len(fields) > 7 else 'OPEN'
+            if status == 'CLOSED':
+                self.skipped['closed pipes'] += 1
+                return
+            self.pipes.append((fields[0], fields[1], fields[2], float(fields[3]), float(fields[4]), float(fields[5])))
+        elif section == 'COORDINATES':
+            self.coordinates[fields[0]] = (float(fields[1]), float(fields[2]))
+        elif section == 'VERTICES':
+            self.vertices.setdefault(fields[0], []).append((float(fields[1]), float(fields[2])))
+        elif section == 'OPTIONS':
+            key = fields[0].upper()
+            if key in ('UNITS', 'HEADLOSS') and len(fields) > 1:
+                self.options[key] = fields[1].upper()
+        elif section in SKIPPED_SECTIONS:
+            self.skipped[section.lower()] += 1
+
+    def converted(self):
+        """Строки узлов и труб в единицах модели."""
+        units = self.options['UNITS']
+        if units not in FLOW_UNITS:
+            raise ValueError(f"Неизвестные единицы расхода: {units}")
+        us = units in US_UNITS
+        length = FOOT if us else 1.0
+        diameter = INCH_MM if us else 1.0
+
+        nodes = [
+            (node_id, node_type, elevation * length, demand * FLOW_UNITS[units],
+             head * length if head is not None else None)
+            for node_id, (node_type, elevation, demand, head) in self.nodes.items()
+        ]
+
+        lengths = np.array([p[3] for p in self.pipes]) * length
+        diameters = np.array([p[4] for p in self.pipes]) * diameter
+        roughness = np.array([p[5] for p in self.pipes], dtype=float)
+        formula = self.options['HEADLOSS']
+        if formula == 'D-W':
+            roughness = roughness * (FOOT if us else 1.0)  # милли-футы -> мм; в SI уже мм
+        elif formula in ('H-W', 'C-M'):
+            roughness = equivalent_roughness(formula, roughness, diameters / 1000.0) * 1000.0
+        else:
+            raise ValueError(f"Неизвестная формула потерь: {formula}")
+
+        pipes = [
+            (pipe[0], pipe[1], pipe[2], float(L), float(D), float(eps))
+            for pipe, L, D, eps in zip(self.pipes, lengths, diameters, roughness)
+        ]
+        return nodes, pipes
+
+    def save(self):
+        """Запись в БД одной транзакцией. Возвращает отчет о числе созданных и пропущенных элементов."""
+        nodes, pipes = self.converted()
+        missing = [node_id for node_id, *_ in nodes if node_id not in self.coordinates]
+        if missing:
+            raise ValueError(f"Нет координат у узлов: {', '.join(missing[:10])}")
+        unknown = [pipe[0] for pipe in pipes if pipe[1] not in self.nodes or pipe[2] not in self.nodes]
+        if unknown:
+            raise ValueError(f"Трубы ссылаются на несуществующие узлы: {', '.join(unknown[:10])}")
+
+        with transaction.atomic():
+            id_map = {}
+            for start in range(0, len(nodes), self.batch_size):
+                batch = [
+                    Node(
+                        project=self.project, name=node_id, node_type=node_type, elevation=elevation,
+                        base_demand=demand, fixed_head=head, geometry=Point(*self.coordinates[node_id]),
+                    )
+                    for node_id, node_type, elevation, demand, head in nodes[start:start + self.batch_size]
+                ]
+                Node.objects.bulk_create(batch, batch_size=self.batch_size)
+                id_map.update((node.name, node.pk) for node in batch)
+
+            for start in range(0, len(pipes), self.batch_size):
+                Pipe.objects.bulk_create([
+                    Pipe(
+                        project=self.project, name=pipe_id, from_node_id=id_map[a], to_node_id=id_map[b],
+                        length=L, diameter=D, roughness_coefficient=eps,
+                        geometry=LineString([self.coordinates[a], *self.vertices.get(pipe_id, []), self.coordinates[b]]),
+                    )
+                    for pipe_id, a, b, L, D, eps in pipes[start:start + self.batch_size]
+                ], batch_size=self.batch_size)
+
+            Project.bump_revision(self.project.pk)  # bulk_create не вызывает сигналы (см. signals.py)
+
+        return {"nodes": len(nodes), "pipes": len(pipes), "skipped": dict(self.skipped), "options": self.options}
+
+
+def import_inp(project, lines, batch_size=5000):
+    """Импорт строк .inp (файл, итератор строк или байтов) в проект."""
+    return InpImporter(project, batch_size).read(lines).save()
+
+
+def element_labels(rows):
+    """
+    ID EPANET по (id, name): имена, если все они заданы, допустимы и уникальны,
+    иначе - id из БД (чтобы ссылки труб на узлы были однозначны).
+    """
+    names = [name for _, name in rows]
+    if all(name and VALID_ID.match(name) for name in names) and len(set(names)) == len(names):
+        return {pk: name for pk, name in rows}
+    return {pk: str(pk) for pk, _ in rows}
+
+
+def export_inp(project, chunk_size=2000):
+    """Генератор строк .inp для проекта (единицы LPS, потери D-W)."""
+    nodes = Node.objects.filter(project=project).order_by('pk')
+    pipes = Pipe.objects.filter(project=project).order_by('pk')
+    node_labels = element_labels(list(nodes.values_list('pk', 'name')))
+    pipe_labels = element_labels(list(pipes.values_list('pk', 'name')))
+    node_rows = nodes.values_list('pk', 'elevation', 'base_demand', 'fixed_head')
+
+    yield '[TITLE]\n'
+    yield f'{project.name}\n\n'
+
+    yield '[JUNCTIONS]\n;ID\tElev\tDemand\n'
+    for pk, elevation, demand, head in node_rows.filter(fixed_head__isnull=True).iterator(chunk_size=chunk_size):
+        yield f'{node_labels[pk]}\t{elevation or 0.0:.6g}\t{(demand or 0.0) / FLOW_UNITS["LPS"]:.9g}\n'
+
+    yield '\n[RESERVOIRS]\n;ID\tHead\n'
+    for pk, elevation, demand, head in node_rows.filter(fixed_head__isnull=False).iterator(chunk_size=chunk_size):
+        yield f'{node_labels[pk]}\t{head:.6g}\n'
+
+    yield '\n[PIPES]\n;ID\tNode1\tNode2\tLength\tDiameter\tRoughness\tMinorLoss\tStatus\n'
+    pipe_rows = pipes.values_list('pk', 'from_node_id', 'to_node_id', 'length', 'diameter', 'roughness_coefficient')
+    for pk, a, b, L, D, eps in pipe_rows.iterator(chunk_size=chunk_size):
+        yield f'{pipe_labels[pk]}\t{node_labels[a]}\t{node_labels[b]}\t{L:.6g}\t{D:.6g}\t{eps:.6g}\t0\tOpen\n'
+
+    yield '\n[COORDINATES]\n;Node\tX\tY\n'
+    for pk, geometry in nodes.values_list('pk', 'geometry').iterator(chunk_size=chunk_size):
+        yield f'{node_labels[pk]}\t{geometry.x:.10g}\t{geometry.y:.10g}\n'
+
+    yield '\n[VERTICES]\n;Link\tX\tY\n'
+    for pk, geometry in pipes.values_list('pk', 'geometry').iterator(chunk_size=chunk_size):
+        for x, y in geometry.coords[1:-1]:
+            yield f'{pipe_labels[pk]}\t{x:.10g}\t{y:.10g}\n'
+
+    yield '\n[OPTIONS]\nUnits\tLPS\nHeadloss\tD-W\n\n[END]\n'
@@ -0,0 +1,75 @@
+# network_api/geojson.py
+#
+# Потоковая выдача слоев проекта (узлы, трубы) в GeoJSON FeatureCollection.
+# Строки читаются курсором пачками (.iterator(chunk_size)) и сразу отдаются
+# клиенту: время до первого байта и память не растут с размером проекта.
+# На PostGIS геометрия приходит готовым текстом из ST_AsGeoJSON - объекты
+# GEOS в Python не создаются. Формат совпадает с GeoFeatureModelSerializer:
+# {"id", "type": "Feature", "geometry", "properties"}, внешние ключи - их id.
+
+import json
+
+from django.contrib.gis.db.models.functions import AsGeoJSON
+from django.db import connections
+
+GEOJSON_ALIAS = '_geojson'
+
+
+def property_fields(model, geo_field, names=None):
+    """
+    (имя свойства, столбец) для полей модели, кроме pk и геометрии:
+    все или только names (ValueError, если такого поля нет).
+    """
+    fields = [
+        (field.name, field.attname)
+        for field in model._meta.concrete_fields
+        if not field.primary_key and field.name != geo_field
+    ]
+    if names is None:
+        return fields
+    available = dict(fields)
+    unknown = [name for name in names if name not in available]
+    if unknown:
+        raise ValueError(f"Неизвестные поля {model.__name__}: {', '.join(unknown)}")
+    return [(name, available[name]) for name in names]
+
+
+def stream_feature_collection(queryset, geo_field='geometry', chunk_size=2000, use_postgis=True, fields=None):
+    """
+    Поток байтов FeatureCollection по queryset (генератор; поля проверяются сразу).
+    use_postgis=True (и база PostGIS) - геометрия через ST_AsGeoJSON,
+    иначе - GEOS-объект поля geo_field, пачками по chunk_size строк.
+    fields - имена свойств (по умолчанию все поля модели).
+    """
+    fields = property_fields(queryset.model, geo_field, fields)
+    names = [name for name, _ in fields]
+    columns = ['pk', *(column for _, column in fields)]
+
+    if use_postgis and getattr(connections[queryset.db].ops, 'postgis', False):
+        rows = queryset.annotate(**{GEOJSON_ALIAS: AsGeoJSON(geo_field)}).values_list(*columns, GEOJSON_ALIAS)
+        geometry_text = lambda value: value or 'null'
+    else:
+        rows = queryset.values_list(*columns, geo_field)
+        geometry_text = lambda value: value.json if value is not None else 'null'
+
+    return write_features(rows, names, geometry_text, chunk_size)
+
+
+def write_features(rows, names, geometry_text, chunk_size):
+    """Генератор: строки (pk, свойства..., геометрия) -> куски FeatureCollection."""
+    dumps = json.JSONEncoder(ensure_ascii=False, separators=(',', ':')).encode
+
+    yield b'{"type":"FeatureCollection","features":['
+    chunk = []
+    first = True
+    for row in rows.iterator(chunk_size=chunk_size):
+        chunk.append('{"id":%s,"type":"Feature","geometry":%s,"properties":%s}' % (
+            dumps(row[0]), geometry_text(row[-1]), dumps(dict(zip(names, row[1:-1]))),
+        ))
+        if len(chunk) >= chunk_size:
+            yield ((',' if not first else '') + ','.join(chunk)).encode()
+            first = False
+            chunk = []
+    if chunk:
+        yield ((',' if not first else '') + ','.join(chunk)).encode()
+    yield b']}'
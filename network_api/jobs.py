@@ -0,0 +1,241 @@
+# network_api/jobs.py
+#
+# Асинхронный запуск гидравлических расчетов.
+# Задача (CalculationJob) создается в запросе; внешний брокер (Redis/RabbitMQ)
+# не нужен - очередь задач хранится в самой таблице CalculationJob.
+#
+# Два режима выполнения:
+#   - HYDRAULIC_JOBS_WORKER = True - задачи выполняет отдельный процесс
+#     manage.py calculation_worker: задача захватывается из очереди в БД
+#     (select_for_update(skip_locked=True)), так что воркеров может быть
+#     несколько, а задачи остановленного веб-процесса не теряются. Число
+#     одновременных расчетов на хосте - число процессов воркера (--processes);
+#   - иначе - пул процессов внутри веб-процесса. Пул у каждого процесса
+#     gunicorn/uwsgi свой: HYDRAULIC_MAX_CONCURRENT_SOLVES ограничивает расчеты
+#     одного веб-процесса, а не хоста, а задачи остановленного процесса
+#     остаются в очереди - их отмечает ошибкой fail_stale_jobs.
+
+import logging
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.utils import timezone
+
+from .models import CalculationJob
+from .services import HydraulicSolver
+from .diagnostics import metrics
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+_futures = {}  # job_id -> Future (только для задач, отправленных этим процессом)
+
+
+def _init_worker():
+    """Инициализация процесса пула: в режиме 'spawn' Django нужно поднять заново."""
+    import django
+    django.setup()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            fail_stale_jobs()  # Задачи процессов, остановленных до завершения расчетов
+            _executor = ProcessPoolExecutor(
+                max_workers=getattr(settings, 'HYDRAULIC_MAX_CONCURRENT_SOLVES', 2),
+                # 'spawn' - чистый процесс без унаследованных соединений с БД (и работает в Windows)
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker,
+            )
+        return _executor
+
+
+def submit_job(job):
+    """Ставит задачу в очередь. Отправка в пул - только после коммита транзакции."""
+    if getattr(settings, 'HYDRAULIC_JOBS_EAGER', False):
+        record_metrics(execute_job(job.id))
+        return
+    if getattr(settings, 'HYDRAULIC_JOBS_WORKER', False):
+        return  # Задачу захватит calculation_worker из очереди в БД
+    transaction.on_commit(lambda: _submit(job.id))
+
+
+def _submit(job_id):
+    future = get_executor().submit(run_job, job_id)
+    _futures[job_id] = future
+    future.add_done_callback(lambda f: _futures.pop(job_id, None))
+    future.add_done_callback(_record_future)
+
+
+def _record_future(future):
+    """Итог задачи из пула - в счетчики этого процесса (diagnostics.metrics)."""
+    if future.cancelled() or future.exception() is not None:
+        return
+    record_metrics(future.result())
+
+
+def record_metrics(outcome):
+    if outcome is not None:
+        metrics.record_job(*outcome)
+
+
+def run_job(job_id):
+    """Точка входа в процессе пула: свежие соединения с БД до и после расчета."""
+    close_old_connections()
+    try:
+        return execute_job(job_id)
+    finally:
+        close_old_connections()
+
+
+def execute_job(job_id):
+    """
+    Расчет одной задачи и запись ее статуса.
+    Возвращает (вид, статус, diagnostics) для счетчиков или None, если задача не запускалась.
+    """
+    # Атомарно "захватываем" задачу: отмененная в очереди задача не стартует
+    claimed = CalculationJob.objects.filter(pk=job_id, status=CalculationJob.STATUS_QUEUED).update(
+        status=CalculationJob.STATUS_RUNNING, started_at=timezone.now()
+    )
+    if not claimed:
+        return None
+    return perform_job(CalculationJob.objects.get(pk=job_id))
+
+
+def perform_job(job):
+    """Расчет захваченной задачи (статус running) и запись итога; результат - как у execute_job."""
+    job_id = job.pk
+    solver = HydraulicSolver(job.project_id)
+    solver.cancel_check = lambda: CalculationJob.objects.filter(pk=job_id, cancel_requested=True).exists()
+
+    try:
+        if job.kind == CalculationJob.KIND_EXTENDED:
+            result = solver.solve_extended(**(job.params or {}))
+        elif job.kind == CalculationJob.KIND_MONTE_CARLO:
+            result = solver.solve_monte_carlo(**(job.params or {}))
+        else:
+            result = solver.solve(method=job.method or None)
+    except Exception as e:
+        logger.exception("Ошибка расчета задачи %s", job_id)
+        result = {"success": False, "message": f"Internal error: {e}"}
+
+    if result.get('cancelled'):
+        status = CalculationJob.STATUS_CANCELLED
+    elif result['success']:
+        status = CalculationJob.STATUS_SUCCESS
+    else:
+        status = CalculationJob.STATUS_FAILED
+
+    # В задаче - только сводка: поэлементные результаты уже записаны в историю расчетов
+    # (details.run - id CalculationRun), по ним отвечает GET /api/calculations/{id}/?mode=results
+    details = {key: value for key, value in result.items() if key not in ('success', 'message')}
+    CalculationJob.objects.filter(pk=job_id).update(
+        status=status, message=result['message'], details=details or None, finished_at=timezone.now()
+    )
+    return job.kind, status, result.get('diagnostics')
+
+
+def claim_next_job():
+    """
+    Захват самой старой задачи из очереди (queued -> running) или None, если очередь пуста.
+    Строки, захватываемые другими воркерами, пропускаются (skip_locked) - без ожидания блокировок.
+    """
+    with transaction.atomic():
+        job = (
+            CalculationJob.objects.select_for_update(skip_locked=True)
+            .filter(status=CalculationJob.STATUS_QUEUED)
+            .exclude(params__has_key='batch')  # Пакеты пересчета выполняет recalculate_projects
+            .order_by('created_at', 'id').first()
+        )
+        if job is None:
+            return None
+        job.status = CalculationJob.STATUS_RUNNING
+        job.started_at = timezone.now()
+        job.save(update_fields=['status', 'started_at'])
+    return job
+
+
+def worker_loop(poll_interval=1.0, once=False):
+    """
+    Цикл воркера: задачи из очереди по одной. once - выйти, когда очередь опустеет.
+    Возвращает число выполненных задач.
+    """
+    processed = 0
+    while True:
+        if not connection.in_atomic_block:  # Транзакция вызывающего (например, тест) - не закрываем
+            close_old_connections()  # Долгоживущий процесс: соединения с истекшим сроком и после ошибок
+        job = claim_next_job()
+        if job is None:
+            if once:
+                return processed
+            time.sleep(poll_interval)
+            continue
+        record_metrics(perform_job(job))
+        processed += 1
+
+
+def run_worker(processes=1, poll_interval=1.0, once=False):
+    """
+    Воркер расчетов (manage.py calculation_worker): processes процессов с общим
+    циклом worker_loop. Перед стартом - fail_stale_jobs. Возвращает число выполненных задач.
+    """
+    fail_stale_jobs(include_queued=False)  # Задачи в очереди воркер выполнит сам
+    if processes <= 1:
+        return worker_loop(poll_interval, once)
+    executor = ProcessPoolExecutor(
+        max_workers=processes, mp_context=multiprocessing.get_context('spawn'), initializer=_init_worker
+    )
+    with executor:
+        futures = [executor.submit(worker_loop, poll_interval, once) for _ in range(processes)]
+        return sum(future.result() for future in futures)
+
+
+def fail_stale_jobs(max_age=None, include_queued=True):
+    """
+    Задачи, оставшиеся от остановленных процессов: running (и queued - для пула в
+    веб-процессе, где очередь живет только в памяти процесса) дольше max_age секунд
+    (по умолчанию HYDRAULIC_JOB_STALE_AFTER) - в ошибку. Возвращает число таких задач.
+    """
+    if max_age is None:
+        max_age = getattr(settings, 'HYDRAULIC_JOB_STALE_AFTER', 3600)
+    cutoff = timezone.now() - timedelta(seconds=max_age)
+    message = "Расчет прерван: процесс расчета был остановлен"
+    stale = CalculationJob.objects.filter(status=CalculationJob.STATUS_RUNNING, started_at__lt=cutoff).update(
+        status=CalculationJob.STATUS_FAILED, message=message, finished_at=timezone.now()
+    )
+    if include_queued:
+        queued = CalculationJob.objects.filter(status=CalculationJob.STATUS_QUEUED, created_at__lt=cutoff)
+        stale += queued.exclude(params__has_key='batch').update(
+            status=CalculationJob.STATUS_FAILED, message=message, finished_at=timezone.now()
+        )
+    if stale:
+        logger.warning("Задачи прерванных процессов отмечены ошибкой: %d", stale)
+    return stale
+
+
+def cancel_job(job):
+    """
+    Отмена задачи. Задача в очереди отменяется сразу; у выполняющейся
+    выставляется флаг, и воркер не будет записывать результаты.
+    Возвращает False, если задача уже завершена.
+    """
+    if job.status in CalculationJob.FINISHED_STATUSES:
+        return False
+
+    CalculationJob.objects.filter(pk=job.pk).update(cancel_requested=True)
+
+    future = _futures.get(job.pk)
+    if future is not None:
+        future.cancel()
+
+    CalculationJob.objects.filter(pk=job.pk, status=CalculationJob.STATUS_QUEUED).update(
+        status=CalculationJob.STATUS_CANCELLED, message="Расчет отменен", finished_at=timezone.now()
+    )
+    return True
@@ -0,0 +1,207 @@
+# network_api/linalg.py
+#
+# Разреженные симметричные положительно определенные системы (матрица GGA
+# Aj D^-1 Aj^T и подобные). Шаблон разреженности неизменен для топологии,
+# поэтому символьная часть - шаблон, позиции вкладов и порядок исключения
+# (MMD) - считается один раз и кэшируется по структуре; на итерациях
+# меняются только числа.
+#
+# Бэкенды:
+#   'superlu' - прямой LU (scipy SuperLU) в готовом порядке, без перестановок строк;
+#   'cg'      - метод сопряженных градиентов с предобуславливателем
+#               'jacobi' (диагональ) или 'ilu' (неполное LU, scipy spilu -
+#               в scipy нет неполного Холецкого). Если CG не сошелся за maxiter,
+#               эта система решается прямым методом.
+
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from scipy import sparse
+from scipy.sparse.linalg import LinearOperator, cg, spilu, splu
+
+BACKENDS = ('superlu', 'cg')
+PRECONDITIONERS = ('jacobi', 'ilu')
+
+
+class SymbolicCache:
+    """
+    Кэш символьного анализа (LRU) по отпечатку структуры матрицы.
+    Общий для процесса: повторные расчеты той же топологии не повторяют MMD.
+    """
+
+    def __init__(self, maxsize=32):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_build(self, n, rows, cols):
+        digest = hashlib.sha256()
+        for arr in (np.array([n], dtype=np.int64), rows, cols):
+            digest.update(np.ascontiguousarray(arr, dtype=np.int64).tobytes())
+            digest.update(b'|')
+        key = digest.hexdigest()
+
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+
+        pattern = symbolic_analysis(n, rows, cols)
+        with self._lock:
+            self._data[key] = pattern
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+        return pattern
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            return {"size": len(self._data), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses}
+
+
+symbolic_cache = SymbolicCache()
+
+
+def symbolic_analysis(n, rows, cols):
+    """
+    Символьная часть для матрицы n x n, заданной вкладами (rows[k], cols[k]):
+    - порядок исключения MMD (по структуре A + A^T), уменьшающий заполнение;
+    - шаблон CSC в перенумерованных индексах (indptr, indices);
+    - scatter: номер позиции в data для каждого вклада (суммирование через bincount).
+    """
+    rows = np.asarray(rows, dtype=np.int64)
+    cols = np.asarray(cols, dtype=np.int64)
+
+    perm = np.arange(n, dtype=np.int64)
+    if n > 1:
+        # Диагональное преобладание - факторизация шаблона без выбора ведущих элементов.
+        # SymmetricMode: порядок MMD дополняется обходом дерева исключения симметричной
+        # матрицы, и SuperLU в готовом порядке собирает суперузлы; без него заполнение
+        # то же, но факторизация в порядке NATURAL в разы медленнее
+        structure = sparse.csc_matrix((np.ones(rows.size), (rows, cols)), shape=(n, n))
+        structure = (structure + sparse.identity(n) * (rows.size + 1)).tocsc()
+        try:
+            perm = splu(
+                structure, permc_spec='MMD_AT_PLUS_A', diag_pivot_thresh=0.0, options={"SymmetricMode": True}
+            ).perm_c.astype(np.int64)
+        except RuntimeError:
+            pass  # Вырожденная структура - ошибка проявится при решении
+
+    # perm[i] - новая позиция неизвестной i; ключи в int64 (perm_c SuperLU - int32,
+    # произведение на n переполнилось бы уже при n ~ 46 000)
+    keys = perm[rows] * n + perm[cols]
+    unique_keys, scatter = np.unique(keys, return_inverse=True)
+    indptr = np.concatenate([[0], np.cumsum(np.bincount(unique_keys // max(n, 1), minlength=n))])
+    return {
+        "n": n,
+        "perm": perm,
+        "indptr": indptr,
+        "indices": unique_keys % max(n, 1),
+        "scatter": scatter,
+    }
+
+
+class SPDSystem:
+    """
+    Симметричная положительно определенная система с неизменным шаблоном.
+    Матрица задается значениями вкладов в порядке (rows, cols) конструктора;
+    решение solve(entries, rhs) - в исходной нумерации неизвестных.
+    """
+
+    def __init__(self, n, rows, cols, backend='superlu', preconditioner='jacobi', tol=1e-10, maxiter=None):
+        if backend not in BACKENDS:
+            raise ValueError(f"Неизвестный линейный решатель: {backend}")
+        if preconditioner not in PRECONDITIONERS:
+            raise ValueError(f"Неизвестный предобуславливатель: {preconditioner}")
+        self.n = n
+        self.backend = backend
+        self.preconditioner = preconditioner
+        self.tol = tol
+        self.maxiter = maxiter
+        self.pattern = symbolic_cache.get_or_build(n, rows, cols)
+
+        # Статистика: число решений, суммарные итерации CG, переходы на прямой метод
+        self.solves = 0
+        self.cg_iterations = 0
+        self.fallbacks = 0
+
+    def matrix(self, entries):
+        """Матрица в перенумерованных индексах (CSC) по значениям вкладов."""
+        pattern = self.pattern
+        data = np.bincount(pattern["scatter"], weights=entries, minlength=pattern["indices"].size)
+        # Матрица симметрична, поэтому строки CSR можно считать столбцами CSC
+        return sparse.csc_matrix((data, pattern["indices"], pattern["indptr"]), shape=(self.n, self.n))
+
+    def solve(self, entries, rhs):
+        """Решение системы; None, если матрица вырождена или CG не сошелся."""
+        perm = self.pattern["perm"]
+        M = self.matrix(entries)
+        rhs_perm = np.empty_like(rhs)
+        rhs_perm[perm] = rhs
+
+        if self.backend == 'cg':
+            x = self.solve_cg(M, rhs_perm)
+            if x is None:
+                self.fallbacks += 1
+                x = self.solve_superlu(M, rhs_perm)
+        else:
+            x = self.solve_superlu(M, rhs_perm)
+        self.solves += 1
+        if x is None:
+            return None
+        x = x[perm]
+        return x if np.all(np.isfinite(x)) else None
+
+    def solve_superlu(self, M, rhs):
+        """Прямое решение; None, если матрица вырождена."""
+        # Порядок уже учтен нумерацией: численная факторизация без перестановок строк
+        try:
+            lu = splu(M, permc_spec='NATURAL', diag_pivot_thresh=0.0, options={"SymmetricMode": True})
+        except RuntimeError:
+            return None
+        return lu.solve(rhs)
+
+    def solve_cg(self, M, rhs):
+        """CG с предобуславливателем; None, если не сошелся."""
+        if self.preconditioner == 'ilu':
+            try:
+                # Порог отбрасывания меньше стандартного (1e-4): с ним предобуславливатель
+                # для плохо обусловленных матриц GGA бывает незнакоопределенным
+                ilu = spilu(
+                    M, drop_tol=1e-5, permc_spec='NATURAL', diag_pivot_thresh=0.0,
+                    options={"SymmetricMode": True},
+                )
+            except RuntimeError:
+                return None
+            precond = LinearOperator(M.shape, matvec=ilu.solve)
+        else:
+            diag = M.diagonal()
+            if np.any(diag <= 0):
+                return None
+            inv_diag = 1.0 / diag
+            precond = LinearOperator(M.shape, matvec=lambda v: inv_diag * v)
+
+        iterations = 0
+
+        def count(_):
+            nonlocal iterations
+            iterations += 1
+
+        # Для сеточных графов число итераций CG растет примерно как sqrt(n);
+        # сверх этого предела проще перейти на прямой метод
+        maxiter = self.maxiter or int(50 * np.sqrt(self.n)) + 100
+        x, info = cg(M, rhs, rtol=self.tol, atol=0.0, maxiter=maxiter, M=precond, callback=count)
+        self.cg_iterations += iterations
+        return x if info == 0 else None
@@ -0,0 +1,64 @@
+# network_api/management/commands/benchmark_solver.py
+
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from network_api.benchmark import KINDS, run_suite
+from network_api.linalg import BACKENDS, PRECONDITIONERS
+from network_api.services import HydraulicSolver
+
+
+class Command(BaseCommand):
+    help = (
+        "Замеры гидравлического расчета на синтетических сетях (в памяти, без БД). "
+        "Пример: python manage.py benchmark_solver --kinds grid tree --sizes 100 10000 --output bench.json"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--kinds', nargs='+', choices=KINDS, default=list(KINDS))
+        parser.add_argument('--sizes', nargs='+', type=int, default=[10, 100, 1000, 10000])
+        parser.add_argument('--methods', nargs='+', choices=HydraulicSolver.METHODS, default=['gga'])
+        parser.add_argument('--seeds', nargs='+', type=int, default=[0])
+        parser.add_argument('--linear-solver', choices=BACKENDS, default='superlu')
+        parser.add_argument('--preconditioner', choices=PRECONDITIONERS, default='jacobi')
+        parser.add_argument('--no-reduction', action='store_true', help="Без выделения тупиковых ветвей")
+        parser.add_argument('--no-memory', action='store_true', help="Без замера памяти (tracemalloc замедляет расчет)")
+        parser.add_argument('--fsolve-max-nodes', type=int, default=1000)
+        parser.add_argument('--output', help="Файл JSON для отчета (по умолчанию - вывод в консоль)")
+
+    def handle(self, *args, **options):
+        if any(size < 2 for size in options['sizes']):
+            raise CommandError("Размер сети должен быть не меньше 2 узлов")
+
+        def progress(result):
+            status = "OK" if result["converged"] else "FAIL"
+            self.stderr.write(
+                f"{result['kind']:>9} {result['nodes']:>7} узлов {result['method']:>6}: {status} "
+                f"{result['wall_time']:.3f} с, итераций {result['iterations']}, "
+                f"память {result['peak_memory_mb']} МБ"
+            )
+
+        report = run_suite(
+            kinds=options['kinds'],
+            sizes=options['sizes'],
+            methods=options['methods'],
+            seeds=options['seeds'],
+            fsolve_max_nodes=options['fsolve_max_nodes'],
+            progress=progress,
+            linear_solver=options['linear_solver'],
+            preconditioner=options['preconditioner'],
+            topology_reduction=not options['no_reduction'],
+            track_memory=not options['no_memory'],
+        )
+
+        text = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                f.write(text)
+            summary = report['summary']
+            self.stdout.write(self.style.SUCCESS(
+                f"Замеров: {summary['cases']}, сошлось: {summary['converged']} -> {options['output']}"
+            ))
+        else:
+            self.stdout.write(text)
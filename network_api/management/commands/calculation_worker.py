@@ -0,0 +1,30 @@
+# network_api/management/commands/calculation_worker.py
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from network_api.jobs import run_worker
+
+
+class Command(BaseCommand):
+    help = (
+        "Воркер расчетов: задачи CalculationJob из очереди в БД (при HYDRAULIC_JOBS_WORKER = True). "
+        "Воркеров может быть несколько, в том числе на разных хостах. "
+        "Пример: python manage.py calculation_worker --processes 4"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes', type=int,
+            help="Число одновременных расчетов (по умолчанию HYDRAULIC_MAX_CONCURRENT_SOLVES)",
+        )
+        parser.add_argument('--poll', type=float, default=1.0, help="Пауза при пустой очереди, с")
+        parser.add_argument('--once', action='store_true', help="Выйти, когда очередь опустеет")
+
+    def handle(self, *args, **options):
+        processes = options['processes'] or getattr(settings, 'HYDRAULIC_MAX_CONCURRENT_SOLVES', 2)
+        if processes < 1:
+            raise CommandError("Число процессов должно быть не меньше 1")
+        self.stderr.write(f"Воркер расчетов: процессов {processes}")
+        processed = run_worker(processes=processes, poll_interval=options['poll'], once=options['once'])
+        self.stdout.write(f"Выполнено задач: {processed}")
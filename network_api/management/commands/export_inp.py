@@ -0,0 +1,24 @@
+# network_api/management/commands/export_inp.py
+
+from django.core.management.base import BaseCommand, CommandError
+
+from network_api.epanet import export_inp
+from network_api.models import Project
+
+
+class Command(BaseCommand):
+    help = "Экспорт сети проекта в файл EPANET (.inp). Пример: python manage.py export_inp 5 net.inp"
+
+    def add_arguments(self, parser):
+        parser.add_argument('project', type=int, help="id проекта")
+        parser.add_argument('path', help="Файл .inp")
+
+    def handle(self, *args, **options):
+        try:
+            project = Project.objects.get(pk=options['project'])
+        except Project.DoesNotExist:
+            raise CommandError(f"Проект {options['project']} не найден")
+
+        with open(options['path'], 'w', encoding='utf-8') as f:
+            f.writelines(export_inp(project))
+        self.stdout.write(self.style.SUCCESS(f"Проект {project.pk} -> {options['path']}"))
@@ -0,0 +1,41 @@
+# network_api/management/commands/import_inp.py
+
+from django.core.management.base import BaseCommand, CommandError
+
+from network_api.epanet import import_inp
+from network_api.models import Project
+
+
+class Command(BaseCommand):
+    help = (
+        "Импорт сети из файла EPANET (.inp) в проект (узлы и трубы - пакетами bulk_create). "
+        "Пример: python manage.py import_inp net.inp --name \"Город\"  или  --project 5"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Файл .inp")
+        target = parser.add_mutually_exclusive_group(required=True)
+        target.add_argument('--project', type=int, help="id существующего проекта")
+        target.add_argument('--name', help="Название нового проекта")
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--encoding', default='utf-8')
+
+    def handle(self, *args, **options):
+        if options['project'] is not None:
+            try:
+                project = Project.objects.get(pk=options['project'])
+            except Project.DoesNotExist:
+                raise CommandError(f"Проект {options['project']} не найден")
+        else:
+            project = Project.objects.create(name=options['name'])
+
+        try:
+            with open(options['path'], encoding=options['encoding'], errors='replace') as f:
+                report = import_inp(project, f, batch_size=options['batch_size'])
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        skipped = ", ".join(f"{key}: {value}" for key, value in report['skipped'].items()) or "нет"
+        self.stdout.write(self.style.SUCCESS(
+            f"Проект {project.pk}: узлов {report['nodes']}, труб {report['pipes']}, пропущено: {skipped}"
+        ))
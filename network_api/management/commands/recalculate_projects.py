@@ -0,0 +1,63 @@
+# network_api/management/commands/recalculate_projects.py
+
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from network_api.recalculate import default_batch_name, recalculate_projects, select_projects
+from network_api.services import HydraulicSolver
+
+
+class Command(BaseCommand):
+    help = (
+        "Пересчет проектов в пуле процессов (задачи CalculationJob пакета --batch). "
+        "Прерванный пакет продолжается повторным запуском с тем же --batch. "
+        "Пример: python manage.py recalculate_projects --name Город --workers 8 --batch nightly-2026-10-17"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--projects', nargs='+', type=int, help="id проектов (по умолчанию - все)")
+        parser.add_argument('--name', help="Фильтр по названию проекта (без учета регистра)")
+        parser.add_argument('--exclude', nargs='+', type=int, help="id проектов, которые не пересчитывать")
+        parser.add_argument('--method', choices=HydraulicSolver.METHODS, help="Метод решения (по умолчанию - сервиса)")
+        parser.add_argument('--workers', type=int, help="Число процессов (по умолчанию - все ядра; 0 - без пула)")
+        parser.add_argument('--batch', help="Имя пакета (для продолжения прерванного пересчета)")
+        parser.add_argument('--output', help="Файл JSON для отчета")
+
+    def handle(self, *args, **options):
+        if options['workers'] is not None and options['workers'] < 0:
+            raise CommandError("Число процессов не может быть отрицательным")
+
+        projects = select_projects(ids=options['projects'], name=options['name'], exclude=options['exclude'])
+        if not projects.exists():
+            raise CommandError("Нет проектов для пересчета")
+
+        batch = options['batch'] or default_batch_name()
+        self.stderr.write(f"Пакет {batch} (продолжение: --batch {batch})")
+
+        def progress(job, done, total):
+            self.stderr.write(f"[{done}/{total}] Проект {job.project_id}: {job.status} - {job.message}")
+
+        try:
+            report = recalculate_projects(
+                projects, batch=batch, method=options['method'], workers=options['workers'], progress=progress
+            )
+        except KeyboardInterrupt:
+            raise CommandError(f"Пересчет прерван; продолжение: --batch {batch}")
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+
+        for problem in report['problems']:
+            label = "не сошелся" if problem['outcome'] == 'not_converged' else "ошибка"
+            self.stdout.write(self.style.WARNING(
+                f"Проект {problem['project']} ({problem['name']}): {label} - {problem['message']}"
+            ))
+        throughput = f"{report['throughput']} проектов/с" if report['throughput'] is not None else "-"
+        self.stdout.write(self.style.SUCCESS(
+            f"Пакет {batch}: проектов {report['projects']}, выполнено {report['success']}, "
+            f"не сошлось {report['not_converged']}, ошибок {report['failed']} "
+            f"(рассчитано сейчас {report['processed']} за {report['elapsed']} с, {throughput}; "
+            f"ранее {report['resumed']})"
+        ))
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.8 on 2026-10-17 09:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('network_api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CalculationJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('queued', 'В очереди'), ('running', 'Выполняется'), ('success', 'Выполнен'), ('failed', 'Ошибка'), ('cancelled', 'Отменен')], default='queued', max_length=20, verbose_name='Статус')),
+                ('method', models.CharField(blank=True, max_length=20, null=True, verbose_name='Метод расчета')),
+                ('message', models.TextField(blank=True, null=True, verbose_name='Сообщение')),
+                ('cancel_requested', models.BooleanField(default=False, verbose_name='Запрошена отмена')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='Начало расчета')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Окончание расчета')),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='calculation_jobs', to='network_api.project', verbose_name='Проект')),
+            ],
+            options={
+                'verbose_name': 'Задача расчета',
+                'verbose_name_plural': 'Задачи расчета',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
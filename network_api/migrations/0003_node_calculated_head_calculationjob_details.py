@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-17 11:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('network_api', '0002_calculationjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='node',
+            name='calculated_head',
+            field=models.FloatField(blank=True, null=True, verbose_name='Расчетный напор'),
+        ),
+        migrations.AddField(
+            model_name='calculationjob',
+            name='details',
+            field=models.JSONField(blank=True, null=True, verbose_name='Подробности расчета'),
+        ),
+    ]
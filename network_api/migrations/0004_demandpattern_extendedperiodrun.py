@@ -0,0 +1,64 @@
+# Generated by Django 5.2.8 on 2026-10-17 14:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('network_api', '0003_node_calculated_head_calculationjob_details'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DemandPattern',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, verbose_name='Название шаблона')),
+                ('multipliers', models.JSONField(default=list, verbose_name='Множители')),
+                ('timestep', models.PositiveIntegerField(default=3600, verbose_name='Шаг шаблона (с)')),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='demand_patterns', to='network_api.project', verbose_name='Проект')),
+            ],
+            options={
+                'verbose_name': 'Шаблон потребления',
+                'verbose_name_plural': 'Шаблоны потребления',
+            },
+        ),
+        migrations.AddField(
+            model_name='node',
+            name='demand_pattern',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='nodes', to='network_api.demandpattern', verbose_name='Шаблон потребления'),
+        ),
+        migrations.AddField(
+            model_name='calculationjob',
+            name='kind',
+            field=models.CharField(choices=[('steady', 'Установившийся режим'), ('extended', 'Расчет во времени')], default='steady', max_length=20, verbose_name='Вид расчета'),
+        ),
+        migrations.AddField(
+            model_name='calculationjob',
+            name='params',
+            field=models.JSONField(blank=True, null=True, verbose_name='Параметры'),
+        ),
+        migrations.CreateModel(
+            name='ExtendedPeriodRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата расчета')),
+                ('duration', models.PositiveIntegerField(verbose_name='Длительность (с)')),
+                ('timestep', models.PositiveIntegerField(verbose_name='Шаг расчета (с)')),
+                ('step_count', models.PositiveIntegerField(verbose_name='Число шагов')),
+                ('node_ids', models.BinaryField(verbose_name='id узлов')),
+                ('pipe_ids', models.BinaryField(verbose_name='id труб')),
+                ('heads', models.BinaryField(verbose_name='Напоры')),
+                ('pressures', models.BinaryField(verbose_name='Давления')),
+                ('flows', models.BinaryField(verbose_name='Расходы')),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='extended_runs', to='network_api.project', verbose_name='Проект')),
+            ],
+            options={
+                'verbose_name': 'Расчет во времени',
+                'verbose_name_plural': 'Расчеты во времени',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
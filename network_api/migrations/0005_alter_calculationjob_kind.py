@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-17 15:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('network_api', '0004_demandpattern_extendedperiodrun'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='calculationjob',
+            name='kind',
+            field=models.CharField(choices=[('steady', 'Установившийся режим'), ('extended', 'Расчет во времени'), ('montecarlo', 'Неопределенность потребления (Монте-Карло)')], default='steady', max_length=20, verbose_name='Вид расчета'),
+        ),
+    ]
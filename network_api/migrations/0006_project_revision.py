@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-17 18:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('network_api', '0005_alter_calculationjob_kind'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='project',
+            name='revision',
+            field=models.PositiveBigIntegerField(default=0, verbose_name='Версия сети'),
+        ),
+    ]
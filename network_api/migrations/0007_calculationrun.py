@@ -0,0 +1,38 @@
+# Generated by Django 5.2.8 on 2026-10-17 18:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('network_api', '0006_project_revision'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CalculationRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата расчета')),
+                ('method', models.CharField(max_length=20, verbose_name='Метод расчета')),
+                ('revision', models.PositiveBigIntegerField(default=0, verbose_name='Версия сети')),
+                ('node_count', models.PositiveIntegerField(verbose_name='Число узлов')),
+                ('pipe_count', models.PositiveIntegerField(verbose_name='Число труб')),
+                ('node_ids', models.BinaryField(verbose_name='id узлов')),
+                ('pipe_ids', models.BinaryField(verbose_name='id труб')),
+                ('heads', models.BinaryField(verbose_name='Напоры')),
+                ('pressures', models.BinaryField(verbose_name='Давления')),
+                ('flow_rates', models.BinaryField(verbose_name='Расходы')),
+                ('velocities', models.BinaryField(verbose_name='Скорости')),
+                ('head_losses', models.BinaryField(verbose_name='Потери напора')),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='calculation_runs', to='network_api.project', verbose_name='Проект')),
+            ],
+            options={
+                'verbose_name': 'Расчет',
+                'verbose_name_plural': 'История расчетов',
+                'ordering': ['-created_at', '-id'],
+            },
+        ),
+    ]
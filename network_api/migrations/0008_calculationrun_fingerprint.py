@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-17 22:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('network_api', '0007_calculationrun'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='calculationrun',
+            name='fingerprint',
+            field=models.CharField(blank=True, default='', max_length=64, verbose_name='Отпечаток расчета'),
+        ),
+    ]
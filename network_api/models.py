@@ -22,6 +22,12 @@ class Project(models.Model):
         auto_now=True,
         verbose_name="Дата обновления"
     )
+    # Номер версии сети: растет при любой записи узлов и труб (см. signals.py и bump_revision).
+    # По нему строится ETag сети проекта - без просмотра строк узлов и труб
+    revision = models.PositiveBigIntegerField(
+        default=0,
+        verbose_name="Версия сети"
+    )
 
     class Meta:
         verbose_name = "Проект"
@@ -31,6 +37,43 @@ class Project(models.Model):
     def __str__(self):
         return self.name
 
+    @classmethod
+    def bump_revision(cls, project_id):
+        """Новая версия сети проекта (одним UPDATE, без гонок между процессами)."""
+        cls.objects.filter(pk=project_id).update(revision=models.F('revision') + 1)
+
+
+# --- Модель 1а: Шаблон потребления (DemandPattern) ---
+# Суточный/недельный график: множители к базовому расходу узла по интервалам времени.
+class DemandPattern(models.Model):
+    project = models.ForeignKey(
+        Project,
+        on_delete=models.CASCADE,
+        related_name='demand_patterns',
+        verbose_name="Проект"
+    )
+    name = models.CharField(
+        max_length=255,
+        verbose_name="Название шаблона"
+    )
+    # Список множителей [1.0, 0.8, ...]; по окончании повторяется циклически
+    multipliers = models.JSONField(
+        default=list,
+        verbose_name="Множители"
+    )
+    # Длительность одного интервала шаблона, секунды (по умолчанию - час)
+    timestep = models.PositiveIntegerField(
+        default=3600,
+        verbose_name="Шаг шаблона (с)"
+    )
+
+    class Meta:
+        verbose_name = "Шаблон потребления"
+        verbose_name_plural = "Шаблоны потребления"
+
+    def __str__(self):
+        return f"{self.name} (Проект: {self.project_id})"
+
 
 # --- Модель 2: Узел (Node) ---
 # Представляет собой точечный объект в сети: потребитель, источник, перекресток труб и т.д.
@@ -64,6 +107,15 @@ class Node(models.Model):
         default=0,
         verbose_name="Базовый расход"
     )
+    # Шаблон потребления для расчета во времени (без шаблона - множитель 1.0)
+    demand_pattern = models.ForeignKey(
+        DemandPattern,
+        on_delete=models.SET_NULL,
+        blank=True,
+        null=True,
+        related_name='nodes',
+        verbose_name="Шаблон потребления"
+    )
     # Заданный напор для источников (резервуаров)
     fixed_head = models.FloatField(
         blank=True,
@@ -81,6 +133,12 @@ class Node(models.Model):
         null=True,
         verbose_name="Расчетное давление"
     )
+    # Напор последнего сошедшегося расчета - начальное приближение для следующего
+    calculated_head = models.FloatField(
+        blank=True,
+        null=True,
+        verbose_name="Расчетный напор"
+    )
 
     class Meta:
         verbose_name = "Узел"
@@ -163,4 +221,199 @@ class Pipe(models.Model):
         verbose_name_plural = "Участки (Трубы)"
 
     def __str__(self):
-        return f"Участок {self.id} (от Узла {self.from_node_id} к Узлу {self.to_node_id})"
\ No newline at end of file
+        return f"Участок {self.id} (от Узла {self.from_node_id} к Узлу {self.to_node_id})"
+
+# --- Модель 4: Задача расчета (CalculationJob) ---
+# Расчет выполняется асинхронно в пуле процессов; здесь хранится его состояние.
+class CalculationJob(models.Model):
+    KIND_STEADY = 'steady'
+    KIND_EXTENDED = 'extended'
+    KIND_MONTE_CARLO = 'montecarlo'
+
+    KIND_CHOICES = [
+        (KIND_STEADY, 'Установившийся режим'),
+        (KIND_EXTENDED, 'Расчет во времени'),
+        (KIND_MONTE_CARLO, 'Неопределенность потребления (Монте-Карло)'),
+    ]
+
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_SUCCESS = 'success'
+    STATUS_FAILED = 'failed'
+    STATUS_CANCELLED = 'cancelled'
+
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'В очереди'),
+        (STATUS_RUNNING, 'Выполняется'),
+        (STATUS_SUCCESS, 'Выполнен'),
+        (STATUS_FAILED, 'Ошибка'),
+        (STATUS_CANCELLED, 'Отменен'),
+    ]
+    FINISHED_STATUSES = (STATUS_SUCCESS, STATUS_FAILED, STATUS_CANCELLED)
+
+    project = models.ForeignKey(
+        Project,
+        on_delete=models.CASCADE,
+        related_name='calculation_jobs',
+        verbose_name="Проект"
+    )
+    kind = models.CharField(
+        max_length=20,
+        choices=KIND_CHOICES,
+        default=KIND_STEADY,
+        verbose_name="Вид расчета"
+    )
+    # Параметры расчета (для расчета во времени: duration, timestep; для Монте-Карло: samples, distributions, ...)
+    params = models.JSONField(
+        blank=True,
+        null=True,
+        verbose_name="Параметры"
+    )
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default=STATUS_QUEUED,
+        verbose_name="Статус"
+    )
+    # Метод решения ('auto', 'fsolve', 'gga'); пусто - по умолчанию сервиса
+    method = models.CharField(
+        max_length=20,
+        blank=True,
+        null=True,
+        verbose_name="Метод расчета"
+    )
+    message = models.TextField(
+        blank=True,
+        null=True,
+        verbose_name="Сообщение"
+    )
+    # Подробности расчета: кэш, теплый старт, число итераций
+    details = models.JSONField(
+        blank=True,
+        null=True,
+        verbose_name="Подробности расчета"
+    )
+    # Флаг отмены: проверяется воркером перед записью результатов
+    cancel_requested = models.BooleanField(
+        default=False,
+        verbose_name="Запрошена отмена"
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name="Дата создания"
+    )
+    started_at = models.DateTimeField(
+        blank=True,
+        null=True,
+        verbose_name="Начало расчета"
+    )
+    finished_at = models.DateTimeField(
+        blank=True,
+        null=True,
+        verbose_name="Окончание расчета"
+    )
+
+    class Meta:
+        verbose_name = "Задача расчета"
+        verbose_name_plural = "Задачи расчета"
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"Расчет {self.id} (Проект: {self.project_id}, {self.status})"
+
+
+
+# --- Модель 5: Результаты расчета во времени (ExtendedPeriodRun) ---
+# Напоры и расходы по всем шагам хранятся сжатыми массивами (см. storage.py),
+# а не в полях calculated_* узлов и труб.
+class ExtendedPeriodRun(models.Model):
+    project = models.ForeignKey(
+        Project,
+        on_delete=models.CASCADE,
+        related_name='extended_runs',
+        verbose_name="Проект"
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name="Дата расчета"
+    )
+    duration = models.PositiveIntegerField(
+        verbose_name="Длительность (с)"
+    )
+    timestep = models.PositiveIntegerField(
+        verbose_name="Шаг расчета (с)"
+    )
+    step_count = models.PositiveIntegerField(
+        verbose_name="Число шагов"
+    )
+    # Порядок элементов в массивах результатов
+    node_ids = models.BinaryField(verbose_name="id узлов")
+    pipe_ids = models.BinaryField(verbose_name="id труб")
+    # Массивы float32: шаги x узлы (напоры, давления), шаги x трубы (расходы)
+    heads = models.BinaryField(verbose_name="Напоры")
+    pressures = models.BinaryField(verbose_name="Давления")
+    flows = models.BinaryField(verbose_name="Расходы")
+
+    class Meta:
+        verbose_name = "Расчет во времени"
+        verbose_name_plural = "Расчеты во времени"
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"Расчет во времени {self.id} (Проект: {self.project_id}, шагов: {self.step_count})"
+
+
+# --- Модель 6: Результаты установившегося расчета (CalculationRun) ---
+# История расчетов: каждый расчет - одна строка со сжатыми массивами (см. storage.py)
+# в порядке node_ids / pipe_ids; расчеты можно сравнивать (см. runs.py).
+class CalculationRun(models.Model):
+    project = models.ForeignKey(
+        Project,
+        on_delete=models.CASCADE,
+        related_name='calculation_runs',
+        verbose_name="Проект"
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name="Дата расчета"
+    )
+    method = models.CharField(
+        max_length=20,
+        verbose_name="Метод расчета"
+    )
+    # Версия сети проекта на момент расчета (Project.revision)
+    revision = models.PositiveBigIntegerField(
+        default=0,
+        verbose_name="Версия сети"
+    )
+    # Отпечаток сети и настроек решателя (HydraulicSolver.network_fingerprint):
+    # повторный расчет неизмененной сети результаты заново не записывает
+    fingerprint = models.CharField(
+        max_length=64,
+        blank=True,
+        default='',
+        verbose_name="Отпечаток расчета"
+    )
+    node_count = models.PositiveIntegerField(
+        verbose_name="Число узлов"
+    )
+    pipe_count = models.PositiveIntegerField(
+        verbose_name="Число труб"
+    )
+    # Порядок элементов в массивах результатов
+    node_ids = models.BinaryField(verbose_name="id узлов")
+    pipe_ids = models.BinaryField(verbose_name="id труб")
+    # Массивы float32 по узлам и по трубам
+    heads = models.BinaryField(verbose_name="Напоры")
+    pressures = models.BinaryField(verbose_name="Давления")
+    flow_rates = models.BinaryField(verbose_name="Расходы")
+    velocities = models.BinaryField(verbose_name="Скорости")
+    head_losses = models.BinaryField(verbose_name="Потери напора")
+
+    class Meta:
+        verbose_name = "Расчет"
+        verbose_name_plural = "История расчетов"
+        ordering = ['-created_at', '-id']
+
+    def __str__(self):
+        return f"Расчет {self.id} (Проект: {self.project_id}, {self.method})"
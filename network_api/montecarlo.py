@@ -0,0 +1,291 @@
+# network_api/montecarlo.py
+#
+# Анализ неопределенности потребления методом Монте-Карло.
+# Потребление узлов - случайные величины (распределение по узлу, по типу узла
+# или общее). Выборки считаются пакетами через HydraulicSolver.solve_scenarios
+# в пуле процессов, с теплым стартом от решения при средних расходах.
+# Результаты пакетов сразу сворачиваются в потоковую статистику - память
+# не зависит от числа выборок.
+
+import multiprocessing
+import pickle
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+
+DISTRIBUTIONS = ('normal', 'lognormal', 'uniform')
+
+# Параметры распределения по умолчанию: нормальное, коэффициент вариации 10%
+DEFAULT_DISTRIBUTION = {"distribution": "normal", "cv": 0.1}
+
+
+def parse_distribution(spec):
+    """Проверка описания распределения: {"distribution": ..., "cv" | "low"/"high": ...}."""
+    if not isinstance(spec, dict):
+        raise ValueError("Описание распределения должно быть объектом")
+    kind = spec.get('distribution', 'normal')
+    if kind not in DISTRIBUTIONS:
+        raise ValueError(f"Неизвестное распределение: {kind}")
+    if kind == 'uniform':
+        low, high = float(spec.get('low', 0.9)), float(spec.get('high', 1.1))
+        if not 0 <= low <= high:
+            raise ValueError("Для uniform нужно 0 <= low <= high (множители к базовому расходу)")
+        return {"distribution": kind, "low": low, "high": high}
+    cv = float(spec.get('cv', 0.1))
+    if cv < 0:
+        raise ValueError("Коэффициент вариации cv не может быть отрицательным")
+    return {"distribution": kind, "cv": cv}
+
+
+def node_distributions(solver, spec):
+    """
+    Распределение для каждого узла (после load_data). Приоритет:
+    spec["by_node"][id] > spec["by_type"][node_type] > spec["default"].
+    Возвращает {ключ распределения: (параметры, индексы узлов)}.
+    """
+    spec = spec or {}
+    default = parse_distribution(spec.get('default', DEFAULT_DISTRIBUTION))
+    by_type = {key: parse_distribution(value) for key, value in (spec.get('by_type') or {}).items()}
+    by_node = {}
+    for node_id, value in (spec.get('by_node') or {}).items():
+        if int(node_id) not in solver.node_id_to_index:
+            raise ValueError(f"Узел {node_id} не найден в проекте")
+        by_node[int(node_id)] = parse_distribution(value)
+
+    groups = {}
+    node_types = solver.network.node_types
+    for idx, node_id in enumerate(solver.node_ids.tolist()):
+        params = by_node.get(node_id) or by_type.get(node_types[idx]) or default
+        key = tuple(sorted(params.items()))
+        groups.setdefault(key, (params, []))[1].append(idx)
+    return {key: (params, np.array(indices)) for key, (params, indices) in groups.items()}
+
+
+def sample_demands(base_demands, groups, rng, count):
+    """Матрица count x N случайных расходов (отрицательные значения отсекаются в 0)."""
+    demands = np.tile(base_demands, (count, 1))
+    for params, indices in groups.values():
+        base = base_demands[indices]
+        shape = (count, indices.size)
+        if params['distribution'] == 'uniform':
+            factor = rng.uniform(params['low'], params['high'], size=shape)
+        elif params['distribution'] == 'lognormal':
+            # Среднее множителя = 1, коэффициент вариации = cv
+            sigma2 = np.log1p(params['cv'] ** 2)
+            factor = rng.lognormal(-sigma2 / 2.0, np.sqrt(sigma2), size=shape)
+        else:
+            factor = rng.normal(1.0, params['cv'], size=shape)
+        demands[:, indices] = np.maximum(base * factor, 0.0)
+    return demands
+
+
+class StreamingStats:
+    """
+    Потоковая статистика по элементам: среднее и дисперсия (Уэлфорд), min/max
+    и гистограммы для квантилей. Диапазон гистограммы каждого элемента задается
+    по первому пакету с запасом; значения за его пределами попадают в крайние
+    ячейки и учитываются через min/max.
+    Счетчики - int32, 128 ячеек: для 50 000 элементов около 26 МБ на накопитель
+    (до 2^31 выборок); шаг ячейки ~1/40 разброса первого пакета.
+    """
+
+    def __init__(self, size, bins=128):
+        self.size = size
+        self.bins = bins
+        self.count = 0
+        self.mean = np.zeros(size)
+        self.m2 = np.zeros(size)
+        self.min = np.full(size, np.inf)
+        self.max = np.full(size, -np.inf)
+        self.low = None
+        self.width = None
+        self.hist = None
+
+    def update(self, values):
+        """values: пакет (выборки x элементы)."""
+        values = np.asarray(values, dtype=float)
+        if values.size == 0:
+            return
+
+        if self.hist is None:
+            lo, hi = values.min(axis=0), values.max(axis=0)
+            margin = np.maximum(hi - lo, 1e-3)
+            self.low = lo - margin
+            self.width = (hi - lo + 2 * margin) / self.bins
+            self.hist = np.zeros((self.size, self.bins + 2), dtype=np.int32)
+
+        # Среднее/дисперсия: объединение статистик пакета (Chan et al.)
+        n_b = values.shape[0]
+        mean_b = values.mean(axis=0)
+        m2_b = ((values - mean_b) ** 2).sum(axis=0)
+        total = self.count + n_b
+        delta = mean_b - self.mean
+        self.mean += delta * n_b / total
+        self.m2 += m2_b + delta ** 2 * self.count * n_b / total
+        self.count = total
+
+        self.min = np.minimum(self.min, values.min(axis=0))
+        self.max = np.maximum(self.max, values.max(axis=0))
+
+        # Ячейка 0 - ниже диапазона, bins + 1 - выше
+        # (add.at по плоскому виду - без временного массива размером с гистограмму)
+        cells = np.clip(np.floor((values - self.low) / self.width).astype(np.int64) + 1, 0, self.bins + 1)
+        flat = (np.arange(self.size) * (self.bins + 2) + cells).ravel()
+        np.add.at(self.hist.reshape(-1), flat, 1)
+
+    @property
+    def std(self):
+        return np.sqrt(self.m2 / max(self.count - 1, 1))
+
+    def quantile(self, q):
+        """Квантиль q (0..1) по гистограмме с линейной интерполяцией внутри ячейки."""
+        if self.count == 0:
+            return np.full(self.size, np.nan)
+        edges_lo = self.low[:, None] + self.width[:, None] * np.arange(-1, self.bins + 1)
+        edges_lo[:, 0] = np.minimum(self.min, self.low)
+        edges_hi = edges_lo + self.width[:, None]
+        edges_hi[:, 0] = self.low
+        edges_hi[:, -1] = np.maximum(self.max, edges_lo[:, -1])
+
+        cum = np.cumsum(self.hist, axis=1, dtype=np.int64)
+        target = q * self.count
+        cell = np.minimum((cum < target).sum(axis=1), self.bins + 1)
+        rows = np.arange(self.size)
+        before = np.where(cell > 0, cum[rows, np.maximum(cell - 1, 0)], 0)
+        in_cell = np.maximum(self.hist[rows, cell], 1)
+        frac = np.clip((target - before) / in_cell, 0.0, 1.0)
+        value = edges_lo[rows, cell] + frac * (edges_hi[rows, cell] - edges_lo[rows, cell])
+        return np.clip(value, self.min, self.max)
+
+
+# --- Процессы пула ---
+_worker = {}
+
+
+def _init_worker(payload):
+    """Инициализация процесса пула: Django, затем подготовленный решатель (один раз на процесс)."""
+    import django
+    django.setup()
+    _worker.update(pickle.loads(payload))
+
+
+def _solve_batch(batch_index, count):
+    return solve_batch(_worker, batch_index, count)
+
+
+def solve_batch(state, batch_index, count):
+    """Один пакет выборок: (давления S x N, скорости S x P) только сошедшихся выборок, число несошедшихся."""
+    solver = state['solver']
+    rng = np.random.default_rng([state['seed'], batch_index])
+    demands = sample_demands(state['base_demands'], state['groups'], rng, count)
+
+    heads, flows, converged = solver.solve_scenarios(
+        demands, initial_heads=state['mean_heads'], initial_flows=state['mean_flows']
+    )
+    pressures = heads[converged] - solver.elevations
+    velocities = flows[converged] / state['areas']
+    return pressures.astype(np.float32), velocities.astype(np.float32), int((~converged).sum())
+
+
+def run_monte_carlo(solver, samples, distributions=None, batch_size=100, workers=1, seed=None,
+                    quantiles=(0.05, 0.5, 0.95)):
+    """
+    Монте-Карло по потреблению для решателя после load_data (метод GGA).
+    workers > 1 - пакеты считаются в пуле процессов; в работе одновременно
+    не более 2 * workers пакетов, результаты сразу сворачиваются в статистику.
+    Между пакетами проверяется solver.cancel_check - при отмене возвращается None.
+    Возвращает словарь со статистикой давлений по узлам и скоростей по трубам;
+    статистика - только по сошедшимся выборкам, число и доля несошедшихся
+    (failed_samples, failure_rate) возвращаются отдельно.
+    """
+    samples, batch_size, workers = int(samples), int(batch_size), int(workers)
+    if samples <= 0 or batch_size <= 0 or workers <= 0:
+        raise ValueError("samples, batch_size и workers должны быть положительными")
+
+    groups = node_distributions(solver, distributions)
+
+    # Решение при средних расходах - теплый старт для всех выборок
+    mean_heads, converged, msg = solver.run_gga(solver.initial_guess())
+    if not converged:
+        raise ValueError(f"Не сошелся расчет при средних расходах: {msg}")
+
+    areas = solver.pipe_constants["area"]
+    state = {
+        "solver": solver,
+        "seed": int(seed) if seed is not None else int(np.random.SeedSequence().entropy % (2 ** 32)),
+        "base_demands": solver.demands.copy(),
+        "groups": groups,
+        "mean_heads": mean_heads,
+        "mean_flows": solver.gga_flows.copy(),
+        "areas": np.where(areas > 0, areas, np.inf),
+    }
+
+    pressure_stats = StreamingStats(solver.node_ids.size)
+    velocity_stats = StreamingStats(solver.pipe_ids.size)
+    failed = 0
+
+    batches = [(k, min(batch_size, samples - k * batch_size)) for k in range(-(-samples // batch_size))]
+
+    def collect(result):
+        nonlocal failed
+        pressures, velocities, batch_failed = result
+        pressure_stats.update(pressures)
+        velocity_stats.update(velocities)
+        failed += batch_failed
+        return solver.cancel_check is not None and solver.cancel_check()
+
+    cancelled = False
+    if workers == 1:
+        for batch_index, count in batches:
+            cancelled = collect(solve_batch(state, batch_index, count))
+            if cancelled:
+                break
+    else:
+        cancel_check, solver.cancel_check = solver.cancel_check, None  # Функция отмены не переносится в процессы
+        payload = pickle.dumps(state)
+        solver.cancel_check = cancel_check
+        executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+            initargs=(payload,),
+        )
+        try:
+            queue = iter(batches)
+            running = set()
+            while not cancelled:
+                for batch_index, count in queue:
+                    running.add(executor.submit(_solve_batch, batch_index, count))
+                    if len(running) >= 2 * workers:
+                        break
+                if not running:
+                    break
+                done, running = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    cancelled = collect(future.result()) or cancelled
+        finally:
+            executor.shutdown(cancel_futures=True)
+
+    if cancelled:
+        return None
+
+    return {
+        "samples": samples,
+        "converged_samples": pressure_stats.count,
+        "failed_samples": failed,
+        "failure_rate": failed / samples,
+        "seed": state["seed"],
+        "node_ids": solver.node_ids.tolist(),
+        "pipe_ids": solver.pipe_ids.tolist(),
+        "pressure": {
+            "mean": pressure_stats.mean.tolist(),
+            "std": pressure_stats.std.tolist(),
+            **{f"p{round(q * 100)}": pressure_stats.quantile(q).tolist() for q in quantiles},
+        },
+        "velocity": {
+            "min": velocity_stats.min.tolist(),
+            "mean": velocity_stats.mean.tolist(),
+            "max": velocity_stats.max.tolist(),
+            **{f"p{round(q * 100)}": velocity_stats.quantile(q).tolist() for q in quantiles},
+        },
+    }
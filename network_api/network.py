@@ -0,0 +1,96 @@
+# network_api/network.py
+#
+# Компактное представление сети для расчета: только числовые массивы
+# (id, концы труб, длины, диаметры, потребление, напоры, отметки).
+# Из БД читается одним values_list на таблицу без геометрии - объекты
+# моделей и GEOS-геометрия решателю не нужны.
+
+import numpy as np
+
+from .models import Node, Pipe
+
+NODE_COLUMNS = (
+    'id', 'node_type', 'elevation', 'base_demand', 'fixed_head', 'demand_pattern_id',
+    'calculated_head', 'calculated_pressure',
+)
+PIPE_COLUMNS = (
+    'id', 'from_node_id', 'to_node_id', 'length', 'diameter', 'roughness_coefficient',
+    'calculated_flow_rate', 'calculated_velocity', 'calculated_head_loss',
+)
+
+
+def float_column(values, default=0.0):
+    """Столбец чисел (None -> default; default=np.nan - признак отсутствия значения)."""
+    arr = np.array(values, dtype=float)
+    if not np.isnan(default):
+        arr[np.isnan(arr)] = default
+    return arr
+
+
+class NetworkArrays:
+    """
+    Сеть в виде массивов (узлы и трубы в порядке id).
+    Узлы: node_ids, node_types, elevations (м), demands (м3/с), fixed_heads (м, NaN - не задан),
+    pattern_ids (0 - без шаблона).
+    Трубы: pipe_ids, from_ids, to_ids (id узлов), lengths (м), diameters (мм), roughness (мм).
+    Результаты прошлого расчета (NaN - нет расчета): calculated_heads, calculated_pressures
+    по узлам; calculated_flows, calculated_velocities, calculated_head_losses по трубам.
+    """
+
+    def __init__(self, node_rows, pipe_rows):
+        """node_rows / pipe_rows - кортежи в порядке NODE_COLUMNS / PIPE_COLUMNS."""
+        nodes = list(zip(*node_rows)) or [()] * len(NODE_COLUMNS)
+        pipes = list(zip(*pipe_rows)) or [()] * len(PIPE_COLUMNS)
+
+        self.node_ids = np.array(nodes[0], dtype=np.int64)
+        self.node_types = np.array(nodes[1], dtype=object)
+        self.elevations = float_column(nodes[2])
+        self.demands = float_column(nodes[3])
+        self.fixed_heads = float_column(nodes[4], default=np.nan)
+        self.pattern_ids = float_column(nodes[5]).astype(np.int64)
+        self.calculated_heads = float_column(nodes[6], default=np.nan)
+        self.calculated_pressures = float_column(nodes[7], default=np.nan)
+
+        self.pipe_ids = np.array(pipes[0], dtype=np.int64)
+        self.from_ids = np.array(pipes[1], dtype=np.int64)
+        self.to_ids = np.array(pipes[2], dtype=np.int64)
+        self.lengths = float_column(pipes[3])
+        self.diameters = float_column(pipes[4])
+        self.roughness = float_column(pipes[5])
+        self.calculated_flows = float_column(pipes[6], default=np.nan)
+        self.calculated_velocities = float_column(pipes[7], default=np.nan)
+        self.calculated_head_losses = float_column(pipes[8], default=np.nan)
+
+    @classmethod
+    def load(cls, project_id):
+        """Сеть проекта из БД: по одному запросу на узлы и трубы, без геометрии."""
+        node_rows = Node.objects.filter(project_id=project_id).order_by('id').values_list(*NODE_COLUMNS)
+        pipe_rows = Pipe.objects.filter(project_id=project_id).order_by('id').values_list(*PIPE_COLUMNS)
+        return cls(list(node_rows), list(pipe_rows))
+
+    @classmethod
+    def from_objects(cls, nodes, pipes):
+        """Сеть из объектов Node/Pipe (например, несохраненных - см. benchmark.py)."""
+        node_rows = [tuple(getattr(node, column, None) for column in NODE_COLUMNS) for node in nodes]
+        pipe_rows = [tuple(getattr(pipe, column, None) for column in PIPE_COLUMNS) for pipe in pipes]
+        return cls(node_rows, pipe_rows)
+
+    @property
+    def node_count(self):
+        return self.node_ids.size
+
+    @property
+    def pipe_count(self):
+        return self.pipe_ids.size
+
+    def node_index(self, ids):
+        """
+        Индексы узлов по их id (массивом). Для id, которых нет в сети, -1.
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        if self.node_count == 0:
+            return np.full(ids.shape, -1, dtype=np.int64)
+        order = np.argsort(self.node_ids, kind='stable')
+        sorted_ids = self.node_ids[order]
+        pos = np.minimum(np.searchsorted(sorted_ids, ids), sorted_ids.size - 1)
+        return np.where(sorted_ids[pos] == ids, order[pos], -1)
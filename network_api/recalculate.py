@@ -0,0 +1,174 @@
+# network_api/recalculate.py
+#
+# Пересчет многих проектов (manage.py recalculate_projects): после смены
+# констант решателя, допусков или ночной загрузки данных.
+#
+# Каждый проект - задача CalculationJob с params {"batch": имя пакета}, так что
+# пересчет виден в API и истории задач, а прерванный пакет продолжается: при
+# повторном запуске с тем же именем завершенные задачи пропускаются, а
+# зависшие (queued / running - процесс был остановлен) ставятся заново.
+# Расчеты идут в пуле процессов; процесс пула держит свое соединение с БД
+# и переиспользует его для всех своих задач.
+
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.db import DatabaseError, connection
+from django.db.models import Count
+from django.utils import timezone
+
+from .jobs import _init_worker, execute_job
+from .models import CalculationJob, Project
+
+logger = logging.getLogger(__name__)
+
+
+def default_batch_name():
+    return timezone.now().strftime('recalc-%Y%m%d-%H%M%S')
+
+
+def select_projects(ids=None, name=None, exclude=None):
+    """Проекты для пересчета (крупные - первыми, чтобы процессы пула загружались равномерно)."""
+    projects = Project.objects.annotate(node_total=Count('nodes', distinct=True))
+    if ids:
+        projects = projects.filter(pk__in=ids)
+    if name:
+        projects = projects.filter(name__icontains=name)
+    if exclude:
+        projects = projects.exclude(pk__in=exclude)
+    return projects.order_by('-node_total', 'pk')
+
+
+def prepare_jobs(batch, projects, method=None):
+    """
+    Задачи пакета по проектам. Возвращает (id задач к запуску, число уже выполненных).
+    Завершенные задачи пакета не повторяются; незавершенные - снова в очередь.
+    """
+    jobs = CalculationJob.objects.filter(params__batch=batch, kind=CalculationJob.KIND_STEADY)
+    existing = {job.project_id: job for job in jobs}
+
+    pending, done = [], 0
+    for project in projects:
+        job = existing.get(project.pk)
+        if job is None:
+            job = CalculationJob.objects.create(project=project, method=method, params={"batch": batch})
+        elif job.status in CalculationJob.FINISHED_STATUSES:
+            done += 1
+            continue
+        else:
+            CalculationJob.objects.filter(pk=job.pk).update(
+                status=CalculationJob.STATUS_QUEUED, started_at=None, cancel_requested=False
+            )
+        pending.append(job.pk)
+    return pending, done
+
+
+def recalculate_job(job_id):
+    """
+    Точка входа в процессе пула. Соединение с БД процесса не закрывается между
+    задачами; после ошибки БД - закрывается, следующая задача откроет новое.
+    """
+    try:
+        execute_job(job_id)
+    except DatabaseError:
+        connection.close()
+        raise
+    return job_id
+
+
+def job_outcome(job):
+    """Итог задачи для отчета: success | not_converged | failed | cancelled."""
+    if job.status == CalculationJob.STATUS_FAILED and (job.details or {}).get('converged') is False:
+        return 'not_converged'
+    return job.status
+
+
+def run_batch(job_ids, workers=None, progress=None):
+    """
+    Расчет задач в пуле из workers процессов (по умолчанию - все ядра;
+    0 - по очереди в текущем процессе, например в тестах).
+    progress(job, done, total) вызывается по мере завершения задач.
+    KeyboardInterrupt: задачи, не начатые в пуле, отменяются, исключение пробрасывается
+    (пакет продолжится при следующем запуске).
+    """
+    total = len(job_ids)
+    if workers == 0:
+        for done, job_id in enumerate(job_ids, start=1):
+            execute_job(job_id)
+            if progress is not None:
+                progress(CalculationJob.objects.get(pk=job_id), done, total)
+        return
+
+    workers = workers or os.cpu_count() or 1
+    executor = ProcessPoolExecutor(
+        max_workers=min(workers, max(total, 1)),
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=_init_worker,
+    )
+    try:
+        futures = {executor.submit(recalculate_job, job_id): job_id for job_id in job_ids}
+        for done, future in enumerate(as_completed(futures), start=1):
+            job_id = futures[future]
+            error = future.exception()
+            if error is not None:
+                logger.error("Пересчет задачи %s: %s", job_id, error)
+                CalculationJob.objects.filter(pk=job_id).exclude(status__in=CalculationJob.FINISHED_STATUSES).update(
+                    status=CalculationJob.STATUS_FAILED, message=f"Internal error: {error}", finished_at=timezone.now()
+                )
+            if progress is not None:
+                progress(CalculationJob.objects.get(pk=job_id), done, total)
+    except KeyboardInterrupt:
+        executor.shutdown(wait=False, cancel_futures=True)
+        raise
+    executor.shutdown()
+
+
+def batch_report(batch):
+    """Сводка пакета по задачам в БД: счетчики итогов, время расчетов, проблемные проекты."""
+    jobs = list(
+        CalculationJob.objects.filter(params__batch=batch, kind=CalculationJob.KIND_STEADY)
+        .select_related('project').order_by('project_id')
+    )
+    counts = {'success': 0, 'not_converged': 0, 'failed': 0, 'cancelled': 0, 'pending': 0}
+    problems = []
+    solve_time = 0.0
+    for job in jobs:
+        outcome = job_outcome(job) if job.status in CalculationJob.FINISHED_STATUSES else 'pending'
+        counts[outcome] += 1
+        if job.started_at and job.finished_at:
+            solve_time += (job.finished_at - job.started_at).total_seconds()
+        if outcome in ('not_converged', 'failed'):
+            problems.append({
+                "project": job.project_id, "name": job.project.name, "job": job.pk,
+                "outcome": outcome, "message": job.message,
+            })
+
+    return {
+        "batch": batch,
+        "projects": len(jobs),
+        **counts,
+        "solve_time": round(solve_time, 3),
+        "problems": problems,
+    }
+
+
+def recalculate_projects(projects, batch=None, method=None, workers=None, progress=None):
+    """Пересчет проектов пакетом batch (новым или прерванным). Возвращает отчет batch_report."""
+    batch = batch or default_batch_name()
+    pending, done = prepare_jobs(batch, projects, method)
+    logger.info("Пересчет %s: к расчету %d, уже выполнено %d", batch, len(pending), done)
+
+    started = time.perf_counter()
+    if pending:
+        run_batch(pending, workers=workers, progress=progress)
+    elapsed = time.perf_counter() - started
+
+    report = batch_report(batch)
+    report["resumed"] = done        # Выполнены при прошлых запусках пакета
+    report["processed"] = len(pending)
+    report["elapsed"] = round(elapsed, 3)
+    report["throughput"] = round(len(pending) / elapsed, 3) if pending and elapsed > 0 else None  # Проектов в секунду
+    return report
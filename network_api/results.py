@@ -0,0 +1,144 @@
+# network_api/results.py
+#
+# Компактная выдача результатов расчета клиенту (GET /api/projects/{id}/results/):
+# только id и значения, без геометрии и свойств. Основной формат - двоичный,
+# столбцы little-endian, которые браузер читает прямо в Int32Array / Float32Array:
+#
+#   0   4 байта   b'HRES'
+#   4   uint8     версия формата (1)
+#   5   uint8     размер значения в байтах (4 - float32, 8 - float64)
+#   6   uint16    число столбцов значений K
+#   8   uint32    число элементов N
+#   12  uint32    длина списка имен столбцов в байтах (utf-8, через запятую)
+#   16  имена столбцов, дополненные нулями до кратного 8
+#       int32[N]  id элементов (по возрастанию), дополнение нулями до кратного 8
+#       K x float[N] значения столбцов в порядке имен; NaN - нет результата
+#
+# Запасной формат - MessagePack (пакет msgpack, см. requirements.txt): словарь
+# {"layer", "ids": [...], "<столбец>": [...]} с None вместо отсутствующих значений.
+#
+# Источник значений - поля calculated_* узлов и труб; при
+# HYDRAULIC_WRITE_ELEMENT_RESULTS = False они не обновляются, и результаты
+# берутся из последнего расчета в истории (CalculationRun, см. runs.py).
+
+import struct
+
+import numpy as np
+
+try:
+    import msgpack
+except ImportError:  # Установка без msgpack: доступен только двоичный формат (?encoding=msgpack - 400)
+    msgpack = None
+
+from django.conf import settings
+
+from .models import CalculationRun, Node, Pipe
+from .runs import align, run_arrays
+
+MAGIC = b'HRES'
+VERSION = 1
+HEADER = struct.Struct('<4sBBHII')
+
+# Поля результатов по слоям (по умолчанию выдаются все)
+RESULT_FIELDS = {
+    'nodes': (Node, ('calculated_pressure', 'calculated_head')),
+    'pipes': (Pipe, ('calculated_flow_rate', 'calculated_velocity', 'calculated_head_loss')),
+}
+# Поле модели -> поле массива CalculationRun
+RUN_COLUMNS = {
+    'calculated_pressure': 'pressures',
+    'calculated_head': 'heads',
+    'calculated_flow_rate': 'flow_rates',
+    'calculated_velocity': 'velocities',
+    'calculated_head_loss': 'head_losses',
+}
+DTYPES = {'float32': np.float32, 'float64': np.float64}
+ENCODINGS = ('binary', 'msgpack')
+
+
+def pad8(data):
+    return data + b'\x00' * (-len(data) % 8)
+
+
+def load_results(project_id, layer, fields=None):
+    """
+    Результаты слоя проекта одним запросом values_list (при
+    HYDRAULIC_WRITE_ELEMENT_RESULTS = False - из последнего CalculationRun).
+    Возвращает (ids int64, {поле: float64}); None в БД - NaN.
+    """
+    if layer not in RESULT_FIELDS:
+        raise ValueError(f"Неизвестный слой: {layer}")
+    model, available = RESULT_FIELDS[layer]
+    fields = tuple(fields or available)
+    unknown = [field for field in fields if field not in available]
+    if unknown:
+        raise ValueError(f"Неизвестные поля результатов: {', '.join(unknown)}")
+
+    queryset = model.objects.filter(project_id=project_id).order_by('id')
+    if not getattr(settings, 'HYDRAULIC_WRITE_ELEMENT_RESULTS', True):
+        ids = np.array(queryset.values_list('id', flat=True), dtype=np.int64)
+        return ids, load_run_results(project_id, layer, ids, fields)
+
+    rows = list(queryset.values_list('id', *fields))
+    columns = list(zip(*rows)) or [()] * (len(fields) + 1)
+    ids = np.array(columns[0], dtype=np.int64)
+    values = {field: np.array(column, dtype=float) for field, column in zip(fields, columns[1:])}
+    return ids, values
+
+
+def load_run_results(project_id, layer, ids, fields):
+    """
+    Значения полей calculated_* для элементов ids из последнего расчета проекта
+    в истории; NaN - элемента в расчете не было (или расчетов нет).
+    """
+    run = CalculationRun.objects.filter(project_id=project_id).first()
+    if run is None:
+        return {field: np.full(ids.size, np.nan) for field in fields}
+    run_ids, values = run_arrays(run, layer, [RUN_COLUMNS[field] for field in fields])
+    return {field: align(ids, run_ids, values[RUN_COLUMNS[field]]) for field in fields}
+
+
+def encode_binary(ids, values, dtype=np.float32):
+    """Двоичный пакет (формат - в заголовке модуля)."""
+    ids = np.asarray(ids, dtype=np.int64)
+    if ids.size and (ids.min() < np.iinfo(np.int32).min or ids.max() > np.iinfo(np.int32).max):
+        raise ValueError("id элементов не помещаются в int32")
+    dtype = np.dtype(dtype)
+    names = ','.join(values).encode('utf-8')
+
+    parts = [
+        HEADER.pack(MAGIC, VERSION, dtype.itemsize, len(values), ids.size, len(names)),
+        pad8(names),
+        pad8(ids.astype('<i4').tobytes()),
+    ]
+    parts.extend(np.asarray(column).astype(dtype.newbyteorder('<')).tobytes() for column in values.values())
+    return b''.join(parts)
+
+
+def decode_binary(data):
+    """Разбор двоичного пакета: (ids, {поле: значения}) - для тестов и клиентов на Python."""
+    magic, version, itemsize, count, size, names_length = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("Неверный формат пакета результатов")
+    offset = HEADER.size
+    names = data[offset:offset + names_length].decode('utf-8').split(',') if count else []
+    offset += names_length + (-names_length % 8)
+    ids = np.frombuffer(data, dtype='<i4', count=size, offset=offset)
+    offset += 4 * size + (-4 * size % 8)
+    dtype = np.dtype('<f4' if itemsize == 4 else '<f8')
+    values = {}
+    for name in names:
+        values[name] = np.frombuffer(data, dtype=dtype, count=size, offset=offset)
+        offset += itemsize * size
+    return ids, values
+
+
+def encode_msgpack(layer, ids, values, dtype=np.float32):
+    """Пакет MessagePack; ValueError, если msgpack не установлен."""
+    if msgpack is None:
+        raise ValueError("Формат msgpack недоступен: не установлен пакет msgpack")
+    payload = {"layer": layer, "ids": np.asarray(ids).tolist()}
+    for field, column in values.items():
+        column = np.asarray(column, dtype=float)
+        payload[field] = [None if np.isnan(v) else v for v in column.tolist()]
+    return msgpack.packb(payload, use_single_float=np.dtype(dtype) == np.float32)
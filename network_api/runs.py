@@ -0,0 +1,140 @@
+# network_api/runs.py
+#
+# История установившихся расчетов (CalculationRun): запись результатов одной
+# строкой со сжатыми массивами, чтение слоя и сравнение двух расчетов -
+# без запросов к таблицам узлов и труб. Массивы расчета выровнены по его
+# node_ids / pipe_ids (по возрастанию id); сеть между расчетами может
+# меняться, поэтому сравнение идет по общим id.
+
+import numpy as np
+
+from .models import CalculationRun
+from .storage import pack_array, unpack_array
+
+# Поля массивов по слоям: поле модели -> ключ в result_arrays решателя
+RUN_FIELDS = {
+    'nodes': ('node_ids', {'heads': 'head', 'pressures': 'pressure'}),
+    'pipes': ('pipe_ids', {'flow_rates': 'flow_rate', 'velocities': 'velocity', 'head_losses': 'head_loss'}),
+}
+BLOB_FIELDS = ('node_ids', 'pipe_ids', *(field for _, fields in RUN_FIELDS.values() for field in fields))
+
+# Поля NetworkArrays с результатами прошлого расчета
+NETWORK_FIELDS = {
+    'heads': 'calculated_heads',
+    'pressures': 'calculated_pressures',
+    'flow_rates': 'calculated_flows',
+    'velocities': 'calculated_velocities',
+    'head_losses': 'calculated_head_losses',
+}
+
+
+def create_run(project_id, method, revision, node_ids, pipe_ids, results, dtype=np.float32, fingerprint=''):
+    """Один INSERT с результатами расчета (results - см. HydraulicSolver.result_arrays)."""
+    arrays = {}
+    for layer, (_, fields) in RUN_FIELDS.items():
+        for field, key in fields.items():
+            arrays[field] = pack_array(results[layer][key], dtype=dtype)
+    return CalculationRun.objects.create(
+        project_id=project_id,
+        method=method,
+        revision=revision,
+        fingerprint=fingerprint or '',
+        node_count=len(node_ids),
+        pipe_count=len(pipe_ids),
+        node_ids=pack_array(node_ids, dtype=np.int64),
+        pipe_ids=pack_array(pipe_ids, dtype=np.int64),
+        **arrays,
+    )
+
+
+def run_arrays(run, layer, fields=None):
+    """
+    Массивы слоя расчета: (ids int64, {поле: float64}).
+    fields - поля слоя (по умолчанию все), ValueError при неизвестном слое или поле.
+    """
+    if layer not in RUN_FIELDS:
+        raise ValueError(f"Неизвестный слой: {layer}")
+    ids_field, available = RUN_FIELDS[layer]
+    fields = tuple(fields or available)
+    unknown = [field for field in fields if field not in available]
+    if unknown:
+        raise ValueError(f"Неизвестные поля расчета: {', '.join(unknown)}")
+    ids = unpack_array(getattr(run, ids_field))
+    return ids, {field: unpack_array(getattr(run, field)).astype(float) for field in fields}
+
+
+def align(ids, source_ids, values):
+    """Значения values (по source_ids, по возрастанию) для ids; NaN - нет в source_ids."""
+    ids = np.asarray(ids, dtype=np.int64)
+    result = np.full(ids.shape, np.nan)
+    if source_ids.size == 0:
+        return result
+    pos = np.minimum(np.searchsorted(source_ids, ids), source_ids.size - 1)
+    found = source_ids[pos] == ids
+    result[found] = values[pos[found]]
+    return result
+
+
+def apply_previous_results(network, run):
+    """Результаты прошлого расчета в NetworkArrays (calculated_*) из записи истории."""
+    for layer, (_, fields) in RUN_FIELDS.items():
+        ids, values = run_arrays(run, layer)
+        target_ids = network.node_ids if layer == 'nodes' else network.pipe_ids
+        for field, column in values.items():
+            setattr(network, NETWORK_FIELDS[field], align(target_ids, ids, column))
+
+
+def run_results(run, previous=None, tolerance=0.0):
+    """
+    Результаты расчета по слоям в формате ответа решателя:
+    {"nodes": {"ids", "head", "pressure"}, "pipes": {"ids", "flow_rate", "velocity", "head_loss"}}.
+    С previous - только элементы, изменившиеся относительно previous больше чем на
+    tolerance (по любому полю), и элементы, которых в previous не было.
+    """
+    results = {}
+    for layer, (_, fields) in RUN_FIELDS.items():
+        ids, values = run_arrays(run, layer)
+        keep = np.ones(ids.size, dtype=bool)
+        if previous is not None:
+            previous_ids, previous_values = run_arrays(previous, layer)
+            change = np.zeros(ids.size)
+            for field, column in values.items():
+                change = np.maximum(change, np.abs(column - align(ids, previous_ids, previous_values[field])))
+            keep = np.isnan(change) | (change > tolerance)  # NaN - элемента не было
+        results[layer] = {
+            "ids": ids[keep].tolist(),
+            **{key: values[field][keep].tolist() for field, key in fields.items()},
+        }
+    return results
+
+
+def previous_run(run):
+    """Предыдущий расчет проекта (по порядку записи) или None."""
+    return CalculationRun.objects.filter(project_id=run.project_id, id__lt=run.id).order_by('-id').first()
+
+
+def diff_runs(base, run, layer, fields=None):
+    """
+    Сравнение расчета run с расчетом base по слою.
+    Возвращает {"ids": общие id, "values": {поле: run - base}, "summary": {поле: {max_abs, mean_abs}},
+    "added": id только в run, "removed": id только в base}.
+    """
+    base_ids, base_values = run_arrays(base, layer, fields)
+    ids, values = run_arrays(run, layer, fields)
+
+    common, in_run, in_base = np.intersect1d(ids, base_ids, assume_unique=True, return_indices=True)
+    deltas = {field: values[field][in_run] - base_values[field][in_base] for field in values}
+    summary = {
+        field: {
+            "max_abs": float(np.abs(delta).max()) if delta.size else 0.0,
+            "mean_abs": float(np.abs(delta).mean()) if delta.size else 0.0,
+        }
+        for field, delta in deltas.items()
+    }
+    return {
+        "ids": common,
+        "values": deltas,
+        "summary": summary,
+        "added": np.setdiff1d(ids, base_ids, assume_unique=True),
+        "removed": np.setdiff1d(base_ids, ids, assume_unique=True),
+    }
@@ -2,7 +2,7 @@
 
 from rest_framework import serializers
 from rest_framework_gis.serializers import GeoFeatureModelSerializer
-from .models import Project, Node, Pipe
+from .models import Project, Node, Pipe, CalculationJob, DemandPattern, ExtendedPeriodRun, CalculationRun
 
 # --- Сериализатор для Проекта ---
 # Проекты не имеют геометрии, поэтому используем обычный ModelSerializer
@@ -10,6 +10,7 @@ class ProjectSerializer(serializers.ModelSerializer):
     class Meta:
         model = Project
         fields = '__all__' # Включаем все поля (id, name, description...)
+        read_only_fields = ['revision'] # Версия сети меняется только при записи узлов и труб
 
 # --- Сериализатор для Узла ---
 # Узлы имеют геометрию, используем GeoFeatureModelSerializer.
@@ -25,4 +26,47 @@ class PipeSerializer(GeoFeatureModelSerializer):
     class Meta:
         model = Pipe
         geo_field = "geometry"
-        fields = '__all__'
\ No newline at end of file
+        fields = '__all__'
+
+# --- Сериализатор для Задачи расчета ---
+class CalculationJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = CalculationJob
+        fields = '__all__'
+        read_only_fields = [f.name for f in CalculationJob._meta.fields]
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        # Замеры расчета (этапы, счетчики, невязка) - отдельным блоком "diagnostics";
+        # массивы результатов - только по запросу (см. CalculationJobViewSet.retrieve)
+        details = dict(data.get('details') or {})
+        data['diagnostics'] = details.pop('diagnostics', None)
+        details.pop('results', None)
+        data['details'] = details or None
+        return data
+
+
+# --- Сериализатор для Шаблона потребления ---
+class DemandPatternSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = DemandPattern
+        fields = '__all__'
+
+    def validate_multipliers(self, value):
+        if not isinstance(value, list) or not all(isinstance(v, (int, float)) for v in value):
+            raise serializers.ValidationError("Ожидается список чисел")
+        return value
+
+
+# --- Сериализатор для Расчета во времени (без массивов результатов) ---
+class ExtendedPeriodRunSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ExtendedPeriodRun
+        fields = ['id', 'project', 'created_at', 'duration', 'timestep', 'step_count']
+
+
+# --- Сериализатор для Истории расчетов (без массивов результатов) ---
+class CalculationRunSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = CalculationRun
+        fields = ['id', 'project', 'created_at', 'method', 'revision', 'node_count', 'pipe_count']
@@ -1,16 +1,161 @@
+import copy
+import functools
+import hashlib
+import logging
+import threading
+import time
+import tracemalloc
+from collections import OrderedDict
+
 import numpy as np
-from scipy.optimize import fsolve
+from scipy import sparse
+from scipy.sparse import csgraph
+from scipy.optimize import fsolve, root
+from django.conf import settings
 from django.db import transaction
-from .models import Node, Pipe
-import traceback
+from .models import Project, Node, Pipe, DemandPattern, ExtendedPeriodRun, CalculationRun
+from .storage import pack_array
+from .network import NetworkArrays
+from .runs import apply_previous_results, create_run
+from .linalg import SPDSystem
+from .montecarlo import run_monte_carlo
+from .diagnostics import PhaseTimer
+from .strategies import DENSE_METHODS, STRATEGIES, ResidualMonitor, SolveBudget, SolveStopped, attempt_report, run_strategies
+
+logger = logging.getLogger(__name__)
+
+
+def timed(phase):
+    """Декоратор метода HydraulicSolver: время метода учитывается в этапе phase."""
+    def decorate(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with self.timer.phase(phase):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def instrumented(method):
+    """
+    Декоратор расчета верхнего уровня (solve, solve_extended, ...): сброс замеров,
+    при track_memory - пиковая память (tracemalloc), итоговый блок "diagnostics"
+    в результате и строка в лог.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        self.reset_diagnostics()
+        tracing = self.track_memory and not tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.start()
+        try:
+            result = method(self, *args, **kwargs)
+        finally:
+            if tracing:
+                self.peak_memory = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+
+        diagnostics = self.diagnostics()
+        result["diagnostics"] = diagnostics
+        logger.info(
+            "%s project=%s success=%s time=%.3f phases=%s iterations=%s residual_evaluations=%s "
+            "flow_for_headloss_calls=%s residual_norm=%s",
+            method.__name__, self.project_id, result.get("success"), diagnostics["total_time"],
+            diagnostics["phases"], diagnostics["iterations"], diagnostics["counters"]["residual_evaluations"],
+            diagnostics["counters"]["flow_for_headloss_calls"], diagnostics["residual_norm"],
+        )
+        return result
+    return wrapper
+
+
+class SolutionCache:
+    """
+    Кэш решений с вытеснением давно не использованных (LRU).
+    Ключ - отпечаток сети (см. HydraulicSolver.network_fingerprint), значение - напоры
+    и расходы решения (None, если решение получено не GGA, см. solution_flows).
+    Кэш общий для процесса; в пуле расчетов (jobs.py) у каждого процесса свой.
+    """
+
+    def __init__(self, maxsize=32):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """(напоры, расходы или None) или None, если решения нет."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            heads, flows = entry
+            return heads.copy(), (flows.copy() if flows is not None else None)
+
+    def put(self, key, heads, flows=None):
+        with self._lock:
+            self._data[key] = (
+                np.array(heads, dtype=float), np.array(flows, dtype=float) if flows is not None else None
+            )
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+solution_cache = SolutionCache()
+
+
+# Границы переходного режима по числу Рейнольдса (см. HydraulicSolver.friction_factor)
+LAMINAR_RE = 2000.0
+TURBULENT_RE = 4000.0
+
 
 class HydraulicSolver:
+    METHODS = ('auto', 'fsolve', 'gga')  # Доступные методы решения
+
     def __init__(self, project_id):
         self.project_id = project_id
-        self.nodes = []
-        self.pipes = []
+        self.network = None        # Массивы сети (см. network.py)
+        self.node_ids = None       # id узлов в порядке индексов
+        self.pipe_ids = None       # id труб в порядке индексов
         self.node_id_to_index = {}
-        self.index_to_node_id = {}
+
+        # Предвычисленные массивы (заполняются в build_incidence_matrix)
+        self.incidence = None      # Разреженная матрица инцидентности узлы x трубы
+        self.from_idx = None       # Индексы начальных узлов труб
+        self.to_idx = None         # Индексы конечных узлов труб
+        self.fixed_mask = None     # Маска узлов с фиксированным напором
+        self.fixed_heads = None    # Заданные напоры (0 для обычных узлов)
+        self.demands = None        # Потребление в узлах
+        self.elevations = None     # Отметки узлов (м)
+        self.previous_heads = None # Напоры прошлого расчета (NaN - нет данных)
+        self.gga_setup = None      # Неизменная часть GGA (см. prepare_gga)
+        self.gga_flows = None      # Расходы по трубам последнего запуска GGA
+        self.lengths = None        # Длины труб (м)
+        self.diameters_m = None    # Диаметры труб (м)
+        self.roughness_m = None    # Шероховатость труб (м)
+        self.pipe_constants = None # Постоянные труб для h(Q) и Q(h) (см. compute_pipe_constants)
+        self.results = None        # Массивы результатов последнего save_results (см. result_arrays)
+        self.run = None            # Запись истории последнего save_results (CalculationRun)
 
         # Физические константы
         self.G = 9.81  # Ускорение свободного падения, м/с^2
@@ -21,271 +166,1377 @@ class HydraulicSolver:
         self.pipe_q_maxiter = 100 # Макс итераций для подбора расхода
         self.equation_tol = 1e-6  # Точность решения системы уравнений
         self.maxfev = 5000        # Макс итераций fsolve
+        self.gga_maxiter = 200    # Макс итераций метода глобального градиента
+        self.gga_min_step = 1.0 / 256  # Наименьший шаг линейного поиска GGA (доля шага Ньютона)
+        self.gga_line_search_memory = 5   # Шаг принимается, если невязка меньше наибольшей за столько итераций
+        self.stagnation_iterations = 10   # GGA: итераций без уменьшения невязки до остановки
+        self.stagnation_evaluations = 200 # krylov: вычислений невязок без уменьшения невязки
+        self.root_ftol = 1e-7     # Допустимая невязка баланса для krylov (м3/с)
+        self.head_tol = 1e-3      # Допустимое отклонение напора источника в принятом решении (м)
+
+        # Линейный решатель GGA (см. linalg.py): 'superlu' (прямой) или 'cg'
+        # с предобуславливателем 'jacobi' / 'ilu'
+        self.linear_solver = 'superlu'
+        self.preconditioner = 'jacobi'
+        self.save_batch_size = 2000  # Размер пакета при записи результатов в БД
+
+        # Каждый расчет сохраняется в историю (CalculationRun) - одна строка на расчет.
+        # False в write_element_results - поля calculated_* узлов и труб не обновляются,
+        # результаты прошлого расчета (теплый старт, change) берутся из истории
+        self.record_runs = True
+        self.write_element_results = getattr(settings, 'HYDRAULIC_WRITE_ELEMENT_RESULTS', True)
+
+        # Метод решения: 'auto' (цепочка стратегий, см. strategies.py),
+        # 'fsolve' (scipy, численный якобиан) или 'gga' (Тодини-Пилати, аналитический разреженный якобиан)
+        self.method = 'auto'
+
+        # Метод 'auto': стратегии по порядку и бюджет расчета на все попытки
+        # (время, с; вычисления невязок; None - без ограничения). hybr и lm строят
+        # плотный якобиан N x N и для больших сетей пропускаются
+        self.strategies = tuple(getattr(settings, 'HYDRAULIC_SOLVER_STRATEGIES', STRATEGIES))
+        self.time_budget = getattr(settings, 'HYDRAULIC_SOLVER_TIME_BUDGET', 60.0)
+        self.evaluation_budget = getattr(settings, 'HYDRAULIC_SOLVER_EVALUATION_BUDGET', 20000)
+        self.dense_max_nodes = 2000
+        self.budget = None                # Бюджет текущего расчета (SolveBudget)
+
+        # Повторный расчет неизмененной сети берется из solution_cache
+        self.use_cache = True
+
+        # Начальное приближение из напоров прошлого расчета (Node.calculated_head)
+        self.use_warm_start = True
+
+        # Тупиковые ветви (деревья) считаются напрямую, итерации - только по кольцевому ядру
+        self.use_topology_reduction = True
+
+        # Статистика последнего запуска (заполняется в solve)
+        self.iterations = None            # Итерации GGA
+        self.function_evaluations = None  # Вычисления невязок fsolve
+        self.warm_start = {"used": False, "reused": 0, "interpolated": 0}
+        self.reduction = None             # Размеры ядра и деревьев (см. reduce_topology)
+        self.step_norms = []              # |dH| по итерациям GGA (оценка скорости сходимости)
+        self.attempts = []                # Попытки решения: стратегия, итог, вычисления, время
+
+        # Замеры (см. diagnostics.py): время по этапам, счетчики, итоговая невязка, память
+        self.timer = PhaseTimer()
+        self.counters = {"residual_evaluations": 0, "flow_for_headloss_calls": 0}
+        self.residual_norm = None
+        self.peak_memory = None
+        self.track_memory = getattr(settings, 'HYDRAULIC_TRACK_MEMORY', False)
+
+        # Необязательная функция без аргументов: вернет True, если расчет отменен
+        # (проверяется между этапами и в итерациях решателя через SolveBudget -
+        # не чаще раза в cancel_interval секунд, см. jobs.py)
+        self.cancel_check = None
+        self.cancel_interval = getattr(settings, 'HYDRAULIC_CANCEL_CHECK_INTERVAL', 0.5)
 
     # ------------------------------------------------------------------
     # 1. ЗАГРУЗКА ДАННЫХ
     # ------------------------------------------------------------------
+    @timed('load')
     def load_data(self):
-        print(f"--- [DEBUG] Загрузка данных для проекта {self.project_id} ---")
-        self.nodes = list(Node.objects.filter(project_id=self.project_id))
-        self.pipes = list(Pipe.objects.filter(project_id=self.project_id))
+        logger.debug("Загрузка данных для проекта %s", self.project_id)
+        network = NetworkArrays.load(self.project_id)
+        if not self.write_element_results:
+            previous = CalculationRun.objects.filter(project_id=self.project_id).first()
+            if previous is not None:
+                apply_previous_results(network, previous)
+        self.set_network(network)
 
-        print(f"--- [DEBUG] Найдено узлов: {len(self.nodes)}, труб: {len(self.pipes)}")
+    @timed('index')
+    def set_network(self, network):
+        """
+        Сеть из массивов NetworkArrays (из БД или собранных в памяти,
+        например в benchmark.py): индексация, проверки и массивы для расчета.
+        """
+        self.network = network
+        self.node_ids = network.node_ids
+        self.pipe_ids = network.pipe_ids
+
+        logger.debug("Найдено узлов: %d, труб: %d", self.node_ids.size, self.pipe_ids.size)
 
-        if not self.nodes:
+        if self.node_ids.size == 0:
             raise ValueError("В проекте нет узлов для расчёта")
 
         # Индексация для матриц
-        for idx, node in enumerate(self.nodes):
-            self.node_id_to_index[node.id] = idx
-            self.index_to_node_id[idx] = node.id
+        self.from_idx = network.node_index(network.from_ids)
+        self.to_idx = network.node_index(network.to_ids)
 
         # Проверка целостности графа
-        for pipe in self.pipes:
-            if pipe.from_node_id not in self.node_id_to_index or pipe.to_node_id not in self.node_id_to_index:
-                raise ValueError(f"Труба {pipe.id} ссылается на несуществующий узел")
+        broken = (self.from_idx < 0) | (self.to_idx < 0)
+        if broken.any():
+            raise ValueError(f"Труба {self.pipe_ids[np.argmax(broken)]} ссылается на несуществующий узел")
 
         # Проверка источников
-        fixed_nodes = [n for n in self.nodes if getattr(n, 'fixed_head', None) is not None]
-        if not fixed_nodes:
+        if np.isnan(network.fixed_heads).all():
             raise ValueError("Сеть должна содержать хотя бы один узел с фиксированным напором (Источник/Резервуар)")
 
+        self.node_id_to_index = dict(zip(self.node_ids.tolist(), range(self.node_ids.size)))
+        self.build_incidence_matrix()
+
+    def build_incidence_matrix(self):
+        """
+        Строит разреженную матрицу инцидентности A (узлы x трубы) и массивы,
+        нужные для векторного расчета невязок (индексы концов труб - из set_network).
+        A[i, p] = +1, если труба p входит в узел i (узел "to"),
+        A[i, p] = -1, если труба p выходит из узла i (узел "from").
+        Тогда A @ q - сумма притоков минус сумма оттоков для каждого узла.
+        """
+        network = self.network
+        n = self.node_ids.size
+        m = self.pipe_ids.size
+        self.gga_setup = None
+
+        rows = np.concatenate([self.to_idx, self.from_idx])
+        cols = np.concatenate([np.arange(m), np.arange(m)])
+        data = np.concatenate([np.ones(m), -np.ones(m)])
+        # Дубликаты (труба-петля from == to) суммируются в 0
+        self.incidence = sparse.coo_matrix((data, (rows, cols)), shape=(n, m)).tocsr()
+
+        self.fixed_mask = ~np.isnan(network.fixed_heads)
+        self.fixed_heads = np.where(self.fixed_mask, network.fixed_heads, 0.0)
+        self.demands = network.demands.copy()
+        self.elevations = network.elevations
+        self.previous_heads = network.calculated_heads
+
+        # Параметры труб в СИ: L (м), D (мм -> м), Eps (мм -> м)
+        self.lengths = network.lengths
+        self.diameters_m = network.diameters / 1000.0
+        self.roughness_m = network.roughness / 1000.0
+        self.pipe_constants = self.compute_pipe_constants(self.lengths, self.diameters_m, self.roughness_m)
+
+    def compute_pipe_constants(self, L, D, eps):
+        """
+        Постоянные по трубам, не зависящие от расхода (считаются один раз на сеть):
+        active - труба участвует в расчете (L > 0 и D > 0), area - площадь сечения,
+        re_coef - Re = re_coef * |Q|, rel_rough - eps / D / 3.7 (для формулы Свами-Джейна),
+        k_turb - h = k_turb * f * Q^2, r_lam - h = r_lam * Q (ламинарный режим),
+        f_start - коэффициент трения при v = 1 м/с (начальное приближение Q(h)).
+        Величины неактивных труб - заглушки (D = 1, L = 1), в расчет они не попадают.
+        """
+        active = (L > 0) & (D > 0)
+        D = np.where(active, D, 1.0)
+        L = np.where(active, L, 1.0)
+        area = np.pi * (D ** 2) / 4.0
+        return {
+            "active": active,
+            "area": np.where(active, area, 0.0),
+            "re_coef": D / (area * self.VISCOSITY),
+            "rel_rough": eps / D / 3.7,
+            "k_turb": 8.0 * L / (self.G * np.pi ** 2 * D ** 5),
+            "r_lam": 128.0 * self.VISCOSITY * L / (self.G * np.pi * D ** 4),
+            "f_start": self.swamee_jain_f_array(D, eps, np.ones_like(D)),
+        }
+
+    def network_fingerprint(self, method):
+        """
+        Отпечаток (sha256) гидравлически значимых данных сети и настроек решателя:
+        id, топология, длины, диаметры, шероховатость, потребление, напоры, отметки.
+        Геометрия не входит - перетаскивание узла на карте не меняет отпечаток.
+        """
+        digest = hashlib.sha256()
+        for arr in (self.node_ids, self.fixed_mask, self.fixed_heads, self.demands, self.elevations,
+                    self.pipe_ids, self.from_idx, self.to_idx, self.lengths, self.diameters_m, self.roughness_m):
+            digest.update(np.ascontiguousarray(arr).tobytes())
+            digest.update(b'|')
+
+        solver_settings = (
+            method, self.G, self.VISCOSITY, self.pipe_q_tol, self.pipe_q_maxiter,
+            self.equation_tol, self.maxfev, self.gga_maxiter, self.linear_solver, self.preconditioner,
+            self.strategies if method == 'auto' else None,
+        )
+        digest.update(repr(solver_settings).encode())
+        return digest.hexdigest()
+
     # ------------------------------------------------------------------
     # 2. ГИДРАВЛИЧЕСКИЕ ФОРМУЛЫ
     # ------------------------------------------------------------------
     
-    def swamee_jain_f(self, D, eps, v):
+    def friction_factor(self, Re, rel_rough):
         """
-        Расчет коэффициента трения Дарси-Вейсбаха (f).
-        Используется формула Свами-Джейна для турбулентного режима.
-        
-        Параметры:
-        D: диаметр (метры)
-        eps: шероховатость (метры)
-        v: скорость (м/с)
-        """
-        if D <= 0: return 0.02
-        if v <= 0: return 0.02 # Защита от деления на ноль
-        
-        Re = abs(v) * D / self.VISCOSITY
-        
-        # Ламинарный режим (Re < 2300)
-        if Re < 2300: 
-            if Re == 0: return 0.02
-            return 64.0 / Re
-            
-        # Турбулентный и переходный режим (Swamee-Jain)
-        rel_rough = eps / D
-        
-        # Защита от логарифма нуля или отрицательного числа
-        a = rel_rough / 3.7
-        b = 5.74 / (Re ** 0.9)
-        
-        denom = np.log10(a + b)
-        if denom == 0: denom = 1e-12
-        
-        f = 0.25 / (denom ** 2)
-        return f
+        Коэффициент трения Дарси-Вейсбаха f(Re) и Re * df/dRe (массивы, Re > 0):
+        ламинарный режим 64/Re при Re <= 2000, формула Свами-Джейна при Re >= 4000,
+        между ними - кубическая интерполяция Данлопа (как в EPANET). f и df/dRe
+        непрерывны на обеих границах: иначе у Re = 2300 h(Q) имела скачок, и итерации
+        GGA и подбор расхода перескакивали между ветвями.
+        rel_rough: eps / D / 3.7 (см. compute_pipe_constants).
+        """
+        Re = np.asarray(Re, dtype=float)
+        a = np.broadcast_to(rel_rough, Re.shape)
+        with np.errstate(divide='ignore'):
+            f = 64.0 / Re
+        re_df = -f
+
+        turb = Re >= TURBULENT_RE
+        if turb.any():
+            Re_t = Re[turb]
+            x = a[turb] + 5.74 / (Re_t ** 0.9)
+            lg = np.log10(x)
+            lg = np.where(lg == 0, 1e-12, lg)
+            f[turb] = 0.25 / (lg ** 2)
+            # Re * df/dRe (аналитически из формулы Свами-Джейна), отрицательна
+            re_df[turb] = 0.5 * 0.9 * 5.74 * Re_t ** -0.9 / (lg ** 3 * x * np.log(10.0))
 
-    def flow_for_headloss(self, abs_delta_h, pipe):
+        transition = (Re > LAMINAR_RE) & ~turb
+        if transition.any():
+            # Узлы интерполяции: f = 0.032 и Re * df/dRe = -0.032 при Re = 2000,
+            # fa и fb - 2 * fa = Re * df/dRe по Свами-Джейну при Re = 4000
+            y = a[transition] + 5.74 / TURBULENT_RE ** 0.9
+            lg = np.log10(y)
+            fa = 0.25 / (lg ** 2)
+            fb = 2.0 * fa + 0.5 * 0.9 * 5.74 * TURBULENT_RE ** -0.9 / (lg ** 3 * y * np.log(10.0))
+            x1 = 7.0 * fa - fb
+            x2 = 0.128 - 17.0 * fa + 2.5 * fb
+            x3 = -0.128 + 13.0 * fa - 2.0 * fb
+            x4 = 0.032 - 3.0 * fa + 0.5 * fb
+            r = Re[transition] / LAMINAR_RE
+            f[transition] = x1 + r * (x2 + r * (x3 + r * x4))
+            re_df[transition] = r * (x2 + r * (2.0 * x3 + r * 3.0 * x4))
+        return f, re_df
+
+    def swamee_jain_f_array(self, D, eps, v):
         """
-        Вычисляет РАСХОД (Q, м3/с) по известной потере напора (abs_delta_h).
-        Метод итерационный, так как коэффициент трения (f) зависит от скорости (а значит и от Q).
+        Коэффициент трения (f) для массивов труб по скорости (см. friction_factor).
+        D <= 0 или v <= 0 - 0.02. D: диаметр (м), eps: шероховатость (м), v: скорость (м/с).
         """
-        if abs_delta_h <= 0: return 0.0
+        D = np.asarray(D, dtype=float)
+        eps = np.asarray(eps, dtype=float)
+        v = np.asarray(v, dtype=float)
+
+        f = np.full(np.broadcast(D, eps, v).shape, 0.02)
+        ok = (D > 0) & (v > 0)
+        if not ok.any():
+            return f
+
+        D_ok = np.broadcast_to(D, f.shape)[ok]
+        Re = np.abs(np.broadcast_to(v, f.shape)[ok]) * D_ok / self.VISCOSITY
+        f[ok] = self.friction_factor(Re, np.broadcast_to(eps, f.shape)[ok] / D_ok / 3.7)[0]
+        return f
 
-        # Входные данные: L (м), D (мм -> м), Eps (мм -> м)
-        L = float(pipe.length)
-        D_m = float(pipe.diameter) / 1000.0
-        eps_m = float(pipe.roughness_coefficient) / 1000.0
+    def flow_for_headloss_array(self, abs_delta_h, L=None, D_m=None, eps_m=None):
+        """
+        РАСХОДЫ (Q, м3/с) всех труб по известным потерям напора за один вызов.
+        Коэффициент трения зависит от скорости, поэтому расход уточняется итерацией
+        Q -> v -> f -> Q от приближения при v = 1 м/с; на каждом шаге
+        пересчитываются только еще не сошедшиеся трубы.
 
-        if L <= 0 or D_m <= 0: return 0.0
+        Параметры (массивы одной длины):
+        abs_delta_h: модуль потерь напора (м)
+        L: длина (м), D_m: диаметр (м), eps_m: шероховатость (м);
+        если не заданы - трубы сети (постоянные из compute_pipe_constants).
+        """
+        self.counters["flow_for_headloss_calls"] += 1
+        h = np.asarray(abs_delta_h, dtype=float)
+        if L is None:
+            constants = self.pipe_constants
+        else:
+            constants = self.compute_pipe_constants(
+                np.asarray(L, dtype=float), np.asarray(D_m, dtype=float), np.asarray(eps_m, dtype=float)
+            )
 
-        area = np.pi * (D_m ** 2) / 4.0
+        Q = np.zeros(h.shape)
+        # Нулевой перепад и вырожденные трубы - расход 0
+        idx = np.flatnonzero((h > 0) & constants["active"])
+        if idx.size == 0:
+            return Q
 
-        # --- [ИСПРАВЛЕНИЕ 2.2] Улучшенное начальное приближение ---
-        # Предполагаем типичную скорость для водопровода v = 1.0 м/с для старта
-        v_guess = 1.0 
-        f = self.swamee_jain_f(D_m, eps_m, v_guess)
+        # Постоянные по трубам для итераций: Re = re_coef * Q, R = r_coef * f
+        h = h[idx]
+        a = constants["rel_rough"][idx]
+        re_coef = constants["re_coef"][idx]
+        r_coef = constants["k_turb"][idx]
 
-        # Вычисляем первое приближение Q
-        # Формула: h = f * (L/D) * (v^2 / 2g)  =>  h = (8 * f * L * Q^2) / (g * pi^2 * D^5)
-        # Отсюда R = (8 * f * L) / (g * pi^2 * D^5)
-        
-        denom_const = self.G * (np.pi ** 2) * (D_m ** 5)
-        R = (8.0 * f * L) / denom_const
-        
-        if R <= 0: return 0.0
-        Q = np.sqrt(abs_delta_h / R)
+        # Начальное приближение при v = 1.0 м/с
+        q = np.sqrt(h / (r_coef * constants["f_start"][idx]))
 
-        # --- Итерационное уточнение Q ---
-        # Мы нашли Q, теперь уточним Re и f, и снова найдем Q
+        # Рабочие массивы сжимаются по мере сходимости труб
+        pos = np.arange(idx.size)
         for _ in range(self.pipe_q_maxiter):
-            if Q <= 0: return 0.0
-            
-            v = Q / area
-            f_new = self.swamee_jain_f(D_m, eps_m, v)
-            
-            # Ограничиваем f снизу, чтобы не улететь в бесконечность
-            if f_new <= 1e-5: f_new = 1e-5
-            
-            R_new = (8.0 * f_new * L) / denom_const
-            
-            if R_new <= 0: return 0.0
-            
-            Q_new = np.sqrt(abs_delta_h / R_new)
-            
-            # Проверка сходимости
-            if abs(Q_new - Q) < self.pipe_q_tol:
-                Q = Q_new
+            f_new = np.maximum(self.friction_factor(q[pos] * re_coef, a)[0], 1e-5)
+            q_new = np.sqrt(h / (r_coef * f_new))
+
+            keep = np.abs(q_new - q[pos]) >= self.pipe_q_tol
+            q[pos] = q_new
+            if not keep.any():
                 break
-            Q = Q_new
-            
+            pos, h, a, re_coef, r_coef = pos[keep], h[keep], a[keep], re_coef[keep], r_coef[keep]
+
+        Q[idx] = q
         return Q
 
+    def pipe_flows(self, heads):
+        """
+        Расходы со знаком по всем трубам для заданного вектора напоров.
+        (+) - течет от from к to. Возвращает (q_signed, delta_h).
+        """
+        heads = np.asarray(heads, dtype=float)
+        delta_h = heads[self.from_idx] - heads[self.to_idx]
+        q_mag = self.flow_for_headloss_array(np.abs(delta_h))
+        return np.where(delta_h >= 0, q_mag, -q_mag), delta_h
+
+    def headloss_for_flow(self, q):
+        """
+        Прямая задача для всех труб сразу: потери напора h(Q) и производная dh/dQ.
+        Формула Дарси-Вейсбаха, f - см. friction_factor.
+
+        Параметры:
+        q: массив расходов по трубам (м3/с, со знаком)
+
+        Возвращает: (h, dh_dq), h - со знаком расхода, dh_dq > 0.
+        """
+        q = np.asarray(q, dtype=float)
+        constants = self.pipe_constants
+        active = constants["active"]
+
+        h = np.zeros_like(q)
+        dh_dq = np.ones_like(q)  # Для неактивных труб (L или D <= 0) - заглушка
+        if not active.any():
+            return h, dh_dq
+
+        # q может быть двумерным (сценарии x трубы): параметры труб - по последней оси
+        q_act = q[..., active]
+        q_abs = np.abs(q_act)
+        Re = q_abs * constants["re_coef"][active]
+
+        # Ламинарный режим: h = 128 * nu * L * Q / (g * pi * D^4) - линейно по Q
+        r_lam = constants["r_lam"][active]
+        h_act = r_lam * q_abs
+        dh_act = np.broadcast_to(r_lam, q_abs.shape).copy()
+
+        # Переходный и турбулентный режимы: h = k * f(Re) * Q^2, k = 8L / (g * pi^2 * D^5)
+        turb = Re > LAMINAR_RE
+        if turb.any():
+            a = np.broadcast_to(constants["rel_rough"][active], q_abs.shape)[turb]
+            f, re_df = self.friction_factor(Re[turb], a)
+
+            k = np.broadcast_to(constants["k_turb"][active], q_abs.shape)[turb]
+            qt = q_abs[turb]
+            h_act[turb] = k * f * qt ** 2
+            # dh/dQ = k * Q * (2f + Re * df/dRe)
+            dh_act[turb] = k * qt * (2.0 * f + re_df)
+
+        h[..., active] = np.sign(q_act) * h_act
+        dh_dq[..., active] = dh_act
+        return h, dh_dq
+
     # ------------------------------------------------------------------
     # 3. СИСТЕМА УРАВНЕНИЙ (БАЛАНСЫ)
     # ------------------------------------------------------------------
     def equations(self, heads_unknown):
-        n = len(self.nodes)
-        residuals = np.zeros(n)
-
-        for i, node in enumerate(self.nodes):
-            # Если узел с фиксированным напором (Источник)
-            node_fixed_head = getattr(node, 'fixed_head', None)
-            if node_fixed_head is not None:
-                # Уравнение: H_calc - H_fixed = 0
-                residuals[i] = heads_unknown[i] - node_fixed_head
-                continue
+        """
+        Невязки уравнений баланса для всех узлов за один векторный проход:
+        перепады напора -> расходы в трубах -> A @ q - потребление.
+        Для узлов с фиксированным напором: H_calc - H_fixed = 0.
+        """
+        self.counters["residual_evaluations"] += 1
+        heads = np.asarray(heads_unknown, dtype=float)
+
+        # Расход по каждой трубе со знаком по направлению перепада напора
+        q_signed, _ = self.pipe_flows(heads)
 
-            # Для обычного узла: Сумма притоков - Сумма оттоков - Потребление = 0
-            net_inflow = 0.0
-            
-            # Ищем смежные трубы (оптимизация: в реальном проекте лучше предвычислить список смежности)
-            related = [p for p in self.pipes if p.from_node_id == node.id or p.to_node_id == node.id]
-
-            for pipe in related:
-                idx_from = self.node_id_to_index[pipe.from_node_id]
-                idx_to = self.node_id_to_index[pipe.to_node_id]
-                
-                h_from = heads_unknown[idx_from]
-                h_to = heads_unknown[idx_to]
-                
-                delta_h = h_from - h_to # Если > 0, течет от from к to
-                abs_dh = abs(delta_h)
-                
-                # Вычисляем модуль расхода
-                q_mag = self.flow_for_headloss(abs_dh, pipe)
-                
-                # Придаем знак: (+) если течет от from к to
-                q_signed = q_mag if delta_h >= 0 else -q_mag
-
-                # Баланс для текущего узла:
-                if node.id == pipe.to_node_id:
-                    # Мы "to", значит поток q_signed втекает к нам (+)
-                    net_inflow += q_signed
-                elif node.id == pipe.from_node_id:
-                    # Мы "from", значит поток q_signed утекает от нас (-)
-                    net_inflow -= q_signed
-
-            demand = getattr(node, 'base_demand', 0.0) or 0.0
-            # Уравнение неразрывности (Кирхгофа)
-            residuals[i] = net_inflow - demand
+        # Уравнение неразрывности (Кирхгофа): приток - отток - потребление = 0
+        residuals = self.incidence @ q_signed - self.demands
+
+        # Узлы с фиксированным напором (Источники)
+        residuals[self.fixed_mask] = heads[self.fixed_mask] - self.fixed_heads[self.fixed_mask]
 
         return residuals
 
     # ------------------------------------------------------------------
     # 4. ЗАПУСК И СОХРАНЕНИЕ
     # ------------------------------------------------------------------
-    def solve(self):
-        print("\n=== START SOLVER (IMPROVED) ===")
+    @timed('assemble')
+    def initial_guess(self, warm=True):
+        """
+        Начальное приближение напоров.
+        Теплый старт: напоры прошлого сошедшегося расчета (по id узла);
+        для новых узлов - среднее по соседям с известным напором (волной от известных).
+        Холодный старт (или оставшиеся узлы): средний напор источников.
+        """
+        # --- [ИСПРАВЛЕНИЕ 3.1] Умное начальное приближение ---
+        # 1. Найдем средний напор источников
+        avg_source_head = float(self.fixed_heads[self.fixed_mask].mean()) if self.fixed_mask.any() else 20.0
+        logger.debug("Средний напор источников: %.2f м", avg_source_head)
+
+        heads = np.where(self.fixed_mask, self.fixed_heads, np.nan)
+        self.warm_start = {"used": False, "reused": 0, "interpolated": 0}
+
+        junctions = ~self.fixed_mask
+        known_prev = junctions & ~np.isnan(self.previous_heads)
+        if warm and self.use_warm_start and known_prev.any():
+            heads[known_prev] = self.previous_heads[known_prev]
+            self.warm_start["used"] = True
+            self.warm_start["reused"] = int(known_prev.sum())
+
+            # Новые узлы: интерполяция по соседям (матрица смежности узел-узел)
+            B = abs(self.incidence)
+            adjacency = (B @ B.T).tolil()
+            adjacency.setdiag(0)
+            adjacency = adjacency.tocsr()
+
+            known = ~np.isnan(heads)
+            while not known.all():
+                counts = adjacency @ known.astype(float)
+                sums = adjacency @ np.where(known, heads, 0.0)
+                fill = ~known & (counts > 0)
+                if not fill.any():
+                    break
+                heads[fill] = sums[fill] / counts[fill]
+                known |= fill
+                self.warm_start["interpolated"] += int(fill.sum())
+
+        # Всем остальным ставим напор источников (вода заполнила систему)
+        # Это лучше, чем "земля + 20м", так как ближе к финальному распределению давления
+        heads[np.isnan(heads)] = avg_source_head
+
+        return heads
+
+    @instrumented
+    def solve(self, method=None, include_results=False):
+        """
+        Установившийся режим: расчет и запись результатов (см. save_results).
+        include_results - поэлементные результаты в ответе ("results", см. results_payload);
+        задачам (jobs.py) они не нужны - результаты отдаются из истории расчетов.
+        """
+        logger.info("Расчет проекта %s: старт", self.project_id)
         try:
             self.load_data()
         except Exception as e:
-            print(f"[ERROR] Ошибка загрузки: {e}")
+            logger.warning("Ошибка загрузки проекта %s: %s", self.project_id, e)
             return {"success": False, "message": str(e)}
 
-        n = len(self.nodes)
-        initial_heads = np.zeros(n)
-        
-        # --- [ИСПРАВЛЕНИЕ 3.1] Умное начальное приближение ---
-        # 1. Найдем средний напор источников
-        sources = [n for n in self.nodes if getattr(n, 'fixed_head', None) is not None]
-        avg_source_head = sum([s.fixed_head for s in sources]) / len(sources) if sources else 20.0
-        
-        print(f"--- [DEBUG] Средний напор источников: {avg_source_head:.2f} м")
-
-        for i, node in enumerate(self.nodes):
-            if getattr(node, 'fixed_head', None) is not None:
-                initial_heads[i] = node.fixed_head
-            else:
-                # Всем остальным ставим напор источников (вода заполнила систему)
-                # Это лучше, чем "земля + 20м", так как ближе к финальному распределению давления
-                initial_heads[i] = avg_source_head
-
-        # print(f"--- [DEBUG] Начальные напоры: {initial_heads}")
-
-        # Запуск решателя
-        solution_heads, info, ier, msg = fsolve(
-            self.equations,
-            initial_heads,
-            full_output=True,
-            xtol=self.equation_tol,
-            maxfev=self.maxfev
-        )
+        method = method or self.method
+        if method not in self.METHODS:
+            return {"success": False, "message": f"Неизвестный метод расчета: {method}"}
+
+        # Неизмененная сеть - берем готовое решение из кэша
+        fingerprint = self.network_fingerprint(method) if self.use_cache else None
+        solution = solution_cache.get(fingerprint) if self.use_cache else None
+        cached = solution is not None
 
-        print(f"--- [DEBUG] Результат fsolve: ier={ier}, msg={msg}")
-        # print(f"--- [DEBUG] Найденные напоры: {solution_heads}")
+        self.attempts = []
+        self.gga_flows = None
+        if cached:
+            solution_heads, self.gga_flows = solution
+            logger.debug("Решение взято из кэша")
+        else:
+            # Запуск решателя; бюджет - общий для всех попыток, включая повтор с холодного старта
+            budget = self.budget = SolveBudget(
+                self.counters, self.time_budget, self.evaluation_budget,
+                cancel_check=self.cancel_check, cancel_interval=self.cancel_interval,
+            )
+            try:
+                initial_heads = self.initial_guess()
+                solution_heads, converged, msg = self.run_method(method, initial_heads)
 
-        if ier != 1:
-            return {"success": False, "message": f"Расчет не сошелся: {msg}"}
+                if not converged and self.warm_start["used"] and self.budget.exhausted() is None:
+                    # Теплый старт не помог (например, fsolve застрял у старого решения) - холодный старт
+                    logger.debug("Теплый старт не сошелся (%s), повтор с холодного старта", msg)
+                    solution_heads, converged, msg = self.run_method(method, self.initial_guess(warm=False))
+                    self.warm_start["fallback"] = True
+            finally:
+                self.budget = None
+
+            if budget.cancelled:
+                return {"success": False, "cancelled": True, "message": "Расчет отменен"}
+            if not converged:
+                return {
+                    "success": False,
+                    "converged": False,
+                    "message": f"Расчет не сошелся: {msg}",
+                    "attempts": self.attempts,
+                }
+            if self.use_cache:
+                solution_cache.put(fingerprint, solution_heads, self.gga_flows)
+
+        # Итоговая невязка баланса (м3/с; для источников - отклонение напора)
+        self.residual_norm = float(np.abs(self.solution_residuals(solution_heads)).max())
+
+        if self.cancel_check is not None and self.cancel_check():
+            return {"success": False, "cancelled": True, "message": "Расчет отменен"}
 
         try:
-            self.save_results(solution_heads)
-            print("=== SUCCESS: Результаты сохранены ===")
-            return {"success": True, "message": "Расчет выполнен успешно"}
+            stored = self.current_run(fingerprint) if cached else None
+            if stored is not None:
+                # Это решение уже записано: без UPDATE узлов и труб и новой версии сети
+                # (ETag слоев и тайлы остаются действительными)
+                self.results = self.result_arrays(solution_heads)
+                self.run = stored
+                logger.debug("Результаты уже сохранены расчетом %s", stored.id)
+            else:
+                self.save_results(solution_heads, method, fingerprint)
+                logger.debug("Результаты сохранены")
+            result = {
+                "success": True,
+                "message": "Расчет выполнен успешно",
+                "cached": cached,
+                "warm_start": self.warm_start,
+                "reduction": self.reduction,
+                "iterations": self.iterations,
+                "function_evaluations": self.function_evaluations,
+                "attempts": self.attempts,
+                "run": self.run.id if self.run is not None else None,
+            }
+            if include_results:
+                result["results"] = self.results_payload()
+            return result
         except Exception as e:
-            print("!!! EXCEPTION IN SAVE !!!")
-            traceback.print_exc()
+            logger.exception("Ошибка сохранения результатов проекта %s", self.project_id)
             return {"success": False, "message": f"Ошибка сохранения: {e}"}
 
-    def save_results(self, heads):
-        print("--- [DEBUG] Сохранение результатов в БД... ---")
+    def reset_diagnostics(self):
+        """Сброс замеров перед расчетом."""
+        self.timer.reset()
+        self.counters = {"residual_evaluations": 0, "flow_for_headloss_calls": 0}
+        self.residual_norm = None
+        self.peak_memory = None
+
+    def diagnostics(self):
+        """Блок "diagnostics" результата: время по этапам (с), счетчики, невязка, память."""
+        phases = self.timer.as_dict()
+        return {
+            "phases": phases,
+            "total_time": round(sum(phases.values()), 6),
+            "counters": dict(self.counters),
+            "iterations": self.iterations,
+            "function_evaluations": self.function_evaluations,
+            "residual_norm": self.residual_norm,
+            "peak_memory_mb": round(self.peak_memory / 2 ** 20, 3) if self.peak_memory is not None else None,
+        }
+
+    @timed('assemble')
+    def reduce_topology(self):
+        """
+        Выделение тупиковых деревьев: узлы степени 1 (кроме источников) снимаются
+        слоями, пока такие есть. Расход в трубе к снятому узлу равен потреблению
+        всего его поддерева, потребление поддерева переносится на узел-родитель.
+        Трубы с нулевой длиной или диаметром не снимаются (расчет по ним невозможен).
+
+        Возвращает словарь: core_nodes, core_pipes (индексы ядра), core_demands
+        (потребление узлов ядра с учетом деревьев), tree_flows (расходы со знаком
+        по всем трубам, заданы для труб деревьев) и layers - слои снятия
+        [(узлы, трубы, родители), ...] в порядке снятия.
+        """
+        n, m = self.node_ids.size, self.pipe_ids.size
+        active = self.pipe_constants["active"]
+        pipe_ids = np.arange(m, dtype=np.int64)
+
+        # Степень узла и XOR индексов его труб: у узла степени 1 это и есть его труба
+        degree = np.bincount(self.from_idx, minlength=n) + np.bincount(self.to_idx, minlength=n)
+        pipe_xor = np.zeros(n, dtype=np.int64)
+        np.bitwise_xor.at(pipe_xor, self.from_idx, pipe_ids)
+        np.bitwise_xor.at(pipe_xor, self.to_idx, pipe_ids)
+
+        peelable = ~self.fixed_mask
+        removed_nodes = np.zeros(n, dtype=bool)
+        removed_pipes = np.zeros(m, dtype=bool)
+        accumulated = self.demands.astype(float).copy()
+        tree_flows = np.zeros(m)
+        layers = []
+
+        candidates = np.arange(n)
+        while candidates.size:
+            leaves = candidates[(degree[candidates] == 1) & peelable[candidates]]
+            pipes = pipe_xor[leaves]
+            parents = self.from_idx[pipes] + self.to_idx[pipes] - leaves
+
+            # Через неактивную трубу не снимаем; из изолированной пары снимаем один узел
+            ok = active[pipes]
+            peelable[leaves[~ok]] = False
+            pair = ok & (degree[parents] == 1) & peelable[parents]
+            ok &= ~pair | (leaves > parents)
+            leaves, pipes, parents = leaves[ok], pipes[ok], parents[ok]
+            if leaves.size == 0:
+                break
+
+            sign = np.where(self.to_idx[pipes] == leaves, 1.0, -1.0)
+            tree_flows[pipes] = sign * accumulated[leaves]
+            np.add.at(accumulated, parents, accumulated[leaves])
+            np.subtract.at(degree, parents, 1)
+            np.bitwise_xor.at(pipe_xor, parents, pipes)
+            degree[leaves] = 0
+            removed_nodes[leaves] = True
+            removed_pipes[pipes] = True
+            layers.append((leaves, pipes, parents))
+            candidates = np.unique(parents)
+
+        core_nodes = np.flatnonzero(~removed_nodes)
+        return {
+            "core_nodes": core_nodes,
+            "core_pipes": np.flatnonzero(~removed_pipes),
+            "core_demands": accumulated[core_nodes],
+            "tree_flows": tree_flows,
+            "layers": layers,
+        }
+
+    @timed('assemble')
+    def subnetwork(self, node_idx, pipe_idx):
+        """
+        Решатель для подсети (узлы node_idx, трубы pipe_idx с концами в этих узлах)
+        с теми же настройками; массивы берутся срезами, без повторной загрузки из БД.
+        """
+        sub = copy.copy(self)
+        remap = np.full(self.node_ids.size, -1, dtype=np.int64)
+        remap[node_idx] = np.arange(node_idx.size)
+
+        sub.node_ids = self.node_ids[node_idx]
+        sub.pipe_ids = self.pipe_ids[pipe_idx]
+        sub.node_id_to_index = dict(zip(sub.node_ids.tolist(), range(node_idx.size)))
+        sub.from_idx = remap[self.from_idx[pipe_idx]]
+        sub.to_idx = remap[self.to_idx[pipe_idx]]
+        sub.incidence = self.incidence[node_idx][:, pipe_idx].tocsr()
+        for name in ('fixed_mask', 'fixed_heads', 'demands', 'elevations', 'previous_heads'):
+            setattr(sub, name, getattr(self, name)[node_idx])
+        for name in ('lengths', 'diameters_m', 'roughness_m'):
+            setattr(sub, name, getattr(self, name)[pipe_idx])
+        sub.pipe_constants = {name: value[pipe_idx] for name, value in self.pipe_constants.items()}
+        sub.gga_setup = None
+        sub.gga_flows = None
+        sub.warm_start = dict(self.warm_start)
+        return sub
+
+    def run_reduced(self, method, initial_heads, reduction):
+        """
+        Расчет через ядро: нелинейная задача решается только для кольцевого ядра,
+        напоры деревьев восстанавливаются от родителя к листьям по h(Q) трубы.
+        """
+        core_nodes, core_pipes = reduction["core_nodes"], reduction["core_pipes"]
+        core = self.subnetwork(core_nodes, core_pipes)
+        core.use_topology_reduction = False
+        core.demands = reduction["core_demands"]
+
+        core_heads, converged, msg = core.run_method(method, np.asarray(initial_heads, dtype=float)[core_nodes])
+        self.iterations = core.iterations
+        self.function_evaluations = core.function_evaluations
+        self.step_norms = core.step_norms
+
+        heads = np.array(initial_heads, dtype=float)
+        heads[core_nodes] = core_heads
+
+        # Энергия по трубе: H_to = H_from - h(q); слои - в обратном порядке снятия
+        flows = reduction["tree_flows"].copy()
+        if core.gga_flows is not None:
+            flows[core_pipes] = core.gga_flows
+        losses = self.headloss_for_flow(flows)[0]
+        for leaves, pipes, parents in reversed(reduction["layers"]):
+            sign = np.where(self.to_idx[pipes] == leaves, 1.0, -1.0)
+            heads[leaves] = heads[parents] - sign * losses[pipes]
+
+        # Ядро решено GGA (в том числе стратегией newton метода 'auto') - расходы по всей сети
+        self.gga_flows = flows if core.gga_flows is not None else None
+        return heads, converged, msg
+
+    def run_method(self, method, initial_heads):
+        if self.use_topology_reduction:
+            reduction = self.reduce_topology()
+            self.reduction = {
+                "core_nodes": int(reduction["core_nodes"].size),
+                "tree_nodes": self.node_ids.size - int(reduction["core_nodes"].size),
+            }
+            if reduction["layers"]:
+                logger.debug("Деревья: %d узлов, ядро: %d", self.reduction['tree_nodes'], self.reduction['core_nodes'])
+                return self.run_reduced(method, initial_heads, reduction)
+
+        if method == 'auto':
+            return run_strategies(self, initial_heads)
+
+        started = time.perf_counter()
+        evaluations = self.counters["residual_evaluations"]
+        if method == 'fsolve':
+            heads, converged, msg = self.run_fsolve(initial_heads)
+        else:
+            heads, converged, msg = self.run_gga(initial_heads)
+        self.attempts.append(attempt_report(
+            method, converged, msg, started, self.counters["residual_evaluations"] - evaluations,
+            iterations=self.iterations if method == 'gga' else None,
+        ))
+        return heads, converged, msg
+
+    def monitored_equations(self, monitor):
+        """equations() под наблюдением ResidualMonitor (бюджет и застой, см. strategies.py)."""
+        def fun(heads):
+            residuals = self.equations(heads)
+            monitor.observe(heads, residuals)
+            return residuals
+        return fun
+
+    def equations_jacobian(self, heads):
+        """
+        Аналитический якобиан невязок equations() (плотная матрица N x N):
+        J = -A diag(dQ/dh) A^T, где dQ/dh = 1 / (dh/dQ) по трубам; для источников - строки
+        единичной матрицы. Заменяет N вычислений невязок на конечные разности.
+        """
+        q, _ = self.pipe_flows(heads)
+        _, dh_dq = self.headloss_for_flow(q)
+        g = np.where(self.pipe_constants["active"], 1.0 / dh_dq, 0.0)
+        jacobian = -(self.incidence @ sparse.diags(g) @ self.incidence.T).toarray()
+        fixed = np.flatnonzero(self.fixed_mask)
+        jacobian[fixed] = 0.0
+        jacobian[fixed, fixed] = 1.0
+        return jacobian
+
+    def unsupplied_nodes(self):
+        """
+        Индексы узлов, у которых нет пути до узла с фиксированным напором (компоненты
+        связности сети по действующим трубам без источника): напоры таких узлов не определены,
+        баланс потребления в них не сходится ни одним методом.
+        """
+        active = self.pipe_constants["active"]
+        n = self.node_ids.size
+        graph = sparse.coo_matrix(
+            (np.ones(int(active.sum())), (self.from_idx[active], self.to_idx[active])), shape=(n, n)
+        )
+        _, labels = csgraph.connected_components(graph, directed=False)
+        supplied = np.zeros(labels.max() + 1, dtype=bool)
+        supplied[labels[self.fixed_mask]] = True
+        return np.flatnonzero(~supplied[labels])
+
+    def solution_flows(self, heads):
+        """
+        Расходы по трубам для решения heads: расходы GGA (self.gga_flows), если решение
+        получено GGA, - баланс в узлах по ним выполнен точно; иначе (fsolve, scipy.optimize.root)
+        расходы по перепадам напоров pipe_flows. У почти пустых труб dQ/dh велико,
+        и расходы по перепадам нарушают баланс даже при очень точных напорах.
+        """
+        if self.gga_flows is not None and self.gga_flows.size == self.pipe_ids.size:
+            return self.gga_flows
+        return self.pipe_flows(heads)[0]
+
+    def solution_residuals(self, heads, flows=None):
+        """
+        Невязки решения по расходам solution_flows (или flows): баланс обычных узлов
+        (м3/с), для источников - отклонение напора (м), как в equations().
+        """
+        heads = np.asarray(heads, dtype=float)
+        flows = self.solution_flows(heads) if flows is None else flows
+        residuals = self.incidence @ flows - self.demands
+        residuals[self.fixed_mask] = heads[self.fixed_mask] - self.fixed_heads[self.fixed_mask]
+        return residuals
+
+    def residual_tolerance(self):
+        """
+        Допустимые невязки equations() по узлам для принятия решения: root_ftol (м3/с)
+        по балансу обычных узлов, head_tol (м) - отклонение напора источников.
+        """
+        tolerance = np.full(self.node_ids.size, self.root_ftol)
+        tolerance[self.fixed_mask] = self.head_tol
+        return tolerance
+
+    @timed('solve')
+    def run_fsolve(self, initial_heads):
+        """
+        Решение системы equations() методом scipy.optimize.fsolve.
+        Якобиан строится конечными разностями (плотная матрица N x N).
+        Расчет прерывается только бюджетом: застой по числу вычислений здесь не проверяется -
+        каждое построение якобиана занимает N вычислений без уменьшения невязки, и
+        hybr выходит из длинных плато (ring-400 без сокращения деревьев - 2483 вычисления).
+        """
+        self.gga_flows = None
+        monitor = ResidualMonitor(None, self.budget)
+        try:
+            solution_heads, info, ier, msg = fsolve(
+                self.monitored_equations(monitor),
+                initial_heads,
+                full_output=True,
+                xtol=self.equation_tol,
+                maxfev=self.maxfev
+            )
+        except SolveStopped as e:
+            self.function_evaluations = monitor.evaluations
+            logger.debug("fsolve остановлен: %s", e)
+            return monitor.best_heads, False, str(e)
+
+        self.function_evaluations = int(info['nfev'])
+        logger.debug("Результат fsolve: ier=%s, msg=%s, nfev=%s", ier, msg, info['nfev'])
+
+        return solution_heads, ier == 1, msg
+
+    @timed('solve')
+    def run_root(self, method, initial_heads):
+        """
+        Решение системы equations() методом scipy.optimize.root ('hybr', 'lm' - с
+        аналитическим якобианом equations_jacobian; 'krylov' - без матрицы якобиана).
+        Бюджет и застой - как в run_fsolve.
+        """
+        self.gga_flows = None
+        monitor = ResidualMonitor(self.stagnation_evaluations, self.budget)
+        options = {
+            'hybr': {'xtol': self.equation_tol, 'maxfev': self.maxfev},
+            'lm': {'xtol': self.equation_tol, 'maxiter': self.maxfev},
+            'krylov': {'fatol': self.root_ftol, 'maxiter': self.gga_maxiter},
+        }[method]
+        try:
+            solution = root(
+                self.monitored_equations(monitor),
+                np.asarray(initial_heads, dtype=float),
+                method=method,
+                jac=self.equations_jacobian if method in DENSE_METHODS else None,
+                options=options,
+            )
+        except SolveStopped as e:
+            self.function_evaluations = monitor.evaluations
+            logger.debug("%s остановлен: %s", method, e)
+            return monitor.best_heads, False, str(e)
+
+        self.function_evaluations = monitor.evaluations
+        logger.debug("Результат %s: success=%s, msg=%s, nfev=%s", method, solution.success, solution.message, monitor.evaluations)
+        return solution.x, bool(solution.success), str(solution.message)
+
+    @timed('assemble')
+    def prepare_gga(self):
+        """
+        Неизменная между итерациями (и шагами по времени) часть GGA, считается
+        один раз на топологию:
+        - матрицы Aj (обычные узлы x трубы) и Af (источники x трубы);
+        - вклады труб в матрицу Aj D^-1 Aj^T: на итерации меняются только значения,
+          шаблон и порядок исключения хранит SPDSystem (см. linalg.py).
+        """
+        if self.gga_setup is not None:
+            return self.gga_setup
+
+        junctions = ~self.fixed_mask
+        nj = int(junctions.sum())
+        active = self.pipe_constants["active"]
+        A = self.incidence[:, active]
+        Aj = A[junctions].tocsr()
+
+        # Вклады трубы p (from=i, to=j) в матрицу: (i,i), (j,j) со знаком +, (i,j), (j,i) со знаком -
+        jpos = np.full(self.node_ids.size, -1, dtype=np.int64)
+        jpos[junctions] = np.arange(nj)
+        f = jpos[self.from_idx[active]]
+        t = jpos[self.to_idx[active]]
+        p = np.arange(f.size)
+        rows = np.concatenate([f, t, f, t])
+        cols = np.concatenate([f, t, t, f])
+        signs = np.concatenate([np.ones(2 * f.size), -np.ones(2 * f.size)])
+        pipes = np.concatenate([p, p, p, p])
+        keep = (rows >= 0) & (cols >= 0)
+        rows, cols, signs, pipes = rows[keep], cols[keep], signs[keep], pipes[keep]
+
+        self.gga_setup = {
+            "junctions": junctions,
+            "active": active,
+            "A": A,
+            "Aj": Aj,
+            "AjT": Aj.T.tocsr(),
+            "system": SPDSystem(
+                nj, rows, cols, backend=self.linear_solver, preconditioner=self.preconditioner
+            ),
+            "signs": signs,
+            "pipes": pipes,
+        }
+        return self.gga_setup
+
+    def solve_gga_system(self, setup, dinv, rhs):
+        """
+        Решение (Aj diag(dinv) Aj^T) x = rhs линейным решателем из linalg.py.
+        Возвращает None, если система вырождена.
+        """
+        return setup["system"].solve(setup["signs"] * dinv[setup["pipes"]], rhs)
+
+    @timed('solve')
+    def run_gga(self, initial_heads, initial_flows=None):
+        """
+        Метод глобального градиента (Todini-Pilati, 1988).
+        Неизвестные: напоры в обычных узлах H и расходы в трубах Q.
+            h(Q) + Aj^T H + Af^T H0 = 0   (энергия по трубам)
+            Aj Q - d = 0                  (неразрывность в узлах)
+        На каждой итерации Ньютона решается разреженная СЛАУ
+            (Aj D^-1 Aj^T) dH = F2 - Aj D^-1 F1,   D = diag(dh/dQ)
+        Критерий сходимости: max|dH| <= equation_tol * max|H| - по наибольшей компоненте,
+        а не по евклидовой норме, как у fsolve(xtol): иначе допуск на отдельный узел растет
+        как sqrt(N), и на больших сетях итерации останавливались с погрешностью
+        энергии по трубам до 1 мм.
+
+        Шаг демпфируется линейным поиском: доля шага Ньютона (1, 1/2, ... до gga_min_step)
+        должна уменьшить невязку |D^-1 F1|^2 + |F2|^2 относительно наибольшей за последние
+        gga_line_search_memory итераций - иначе при плохом начальном приближении
+        итерации зацикливаются. Если невязка не уменьшается
+        stagnation_iterations итераций подряд (или исчерпан бюджет self.budget),
+        расчет прекращается сразу.
+
+        initial_flows: расходы по всем трубам для теплого старта (например, с прошлого шага).
+        Итоговые расходы сохраняются в self.gga_flows.
+        """
+        heads = np.array(initial_heads, dtype=float)
+        self.gga_flows = np.zeros(self.pipe_ids.size)
+        setup = self.prepare_gga()
+        junctions, active = setup["junctions"], setup["active"]
+        if not junctions.any():
+            self.gga_flows = self.pipe_flows(heads)[0]
+            self.iterations = 0
+            return heads, True, "Нет узлов с неизвестным напором"
+
+        A, Aj, AjT = setup["A"], setup["Aj"], setup["AjT"]
+        Af_T_H0 = A[self.fixed_mask].T @ self.fixed_heads[self.fixed_mask]
+        dj = self.demands[junctions]
+
+        if initial_flows is not None:
+            q = np.asarray(initial_flows, dtype=float)[active]
+        elif self.warm_start["used"]:
+            # Теплый старт: расходы, согласованные с начальными напорами
+            q = self.pipe_flows(heads)[0][active]
+        else:
+            # Начальное приближение по расходам: скорость 1 м/с от from к to
+            q = self.pipe_constants["area"][active]
+
+        all_q = np.zeros(self.pipe_ids.size)
+
+        def evaluate(q, Hj):
+            """Невязки F1 (энергия), F2 (неразрывность) и dinv = 1 / (dh/dQ) в точке (q, Hj)."""
+            self.counters["residual_evaluations"] += 1
+            all_q[active] = q
+            h_all, dh_all = self.headloss_for_flow(all_q)
+            return h_all[active] + AjT @ Hj + Af_T_H0, Aj @ q - dj, 1.0 / dh_all[active]
+
+        self.step_norms = []
+        Hj = heads[junctions]
+        F1, F2, dinv = evaluate(q, Hj)
+        best_merit, stalled = np.inf, 0
+        recent = []  # Невязки последних итераций (немонотонный линейный поиск)
+        for it in range(1, self.gga_maxiter + 1):
+            rhs = F2 - Aj @ (dinv * F1)
+            dH = self.solve_gga_system(setup, dinv, rhs)
+            if dH is None:
+                return heads, False, "Вырожденная система (есть узлы без связи с источником)"
+            dq = -dinv * (F1 + AjT @ dH)
+            self.iterations = it
+
+            if np.abs(dH).max() <= self.equation_tol * max(np.abs(Hj + dH).max(), 1.0):
+                q, Hj = q + dq, Hj + dH
+                heads[junctions] = Hj
+                all_q[active] = q
+                self.gga_flows = all_q
+                self.step_norms.append(float(np.linalg.norm(dH)))
+                msg = f"Метод глобального градиента сошелся за {it} итераций"
+                logger.debug(msg)
+                return heads, True, msg
+
+            # Линейный поиск (правило Армихо) по невязке с весами текущей итерации
+            merit = np.dot(dinv * F1, dinv * F1) + np.dot(F2, F2)
+            recent = (recent + [merit])[-self.gga_line_search_memory:]
+            step = 1.0
+            while True:
+                trial_q, trial_H = q + step * dq, Hj + step * dH
+                trial_F1, trial_F2, trial_dinv = evaluate(trial_q, trial_H)
+                trial_merit = np.dot(dinv * trial_F1, dinv * trial_F1) + np.dot(trial_F2, trial_F2)
+                if trial_merit <= (1.0 - 1e-4 * step) * max(recent) or step <= self.gga_min_step:
+                    break
+                step *= 0.5
+
+            q, Hj, F1, F2, dinv = trial_q, trial_H, trial_F1, trial_F2, trial_dinv
+            heads[junctions] = Hj
+            all_q[active] = q
+            self.gga_flows = all_q
+            self.step_norms.append(float(step * np.linalg.norm(dH)))
+
+            # Застой: невязка не уменьшилась хотя бы на 1% за stagnation_iterations итераций
+            if merit < 0.99 * best_merit:
+                best_merit, stalled = merit, 0
+            else:
+                stalled += 1
+                if stalled >= self.stagnation_iterations:
+                    return heads, False, f"Невязка не уменьшается ({self.stagnation_iterations} итераций подряд)"
+            reason = self.budget.exhausted() if self.budget is not None else None
+            if reason is not None:
+                return heads, False, reason
+
+        return heads, False, f"Превышено число итераций метода глобального градиента ({self.gga_maxiter})"
+
+    def result_arrays(self, heads):
+        """
+        Результаты расчета массивами (в порядке node_ids / pipe_ids):
+        {"nodes": {"head", "pressure"}, "pipes": {"flow_rate", "velocity", "head_loss"}}.
+        Расходы - solution_flows (у GGA - собственные, баланс в узлах точный),
+        потери напора - h(Q) по этим расходам.
+        """
+        heads = np.asarray(heads, dtype=float)
+
+        # Давления в узлах (ограничиваем неадекватные значения для БД)
+        pressures = np.clip(heads - self.elevations, -100.0, 2000.0)
+
+        flows = self.solution_flows(heads)
+        losses = self.headloss_for_flow(flows)[0]
+        areas = self.pipe_constants["area"]
+        velocities = np.divide(flows, areas, out=np.zeros_like(flows), where=areas > 0)
+        return {
+            "nodes": {"head": heads, "pressure": pressures},
+            "pipes": {"flow_rate": flows, "velocity": velocities, "head_loss": np.abs(losses)},
+        }
+
+    def results_payload(self):
+        """
+        Результаты расчета (self.results) для solve(include_results=True) - без повторного чтения БД:
+        по слоям - ids, значения и change - наибольшее изменение значений элемента
+        относительно прошлого расчета (None - прошлого расчета не было).
+        """
+        network = self.network
+        previous = {
+            "nodes": {"head": network.calculated_heads, "pressure": network.calculated_pressures},
+            "pipes": {
+                "flow_rate": network.calculated_flows,
+                "velocity": network.calculated_velocities,
+                "head_loss": network.calculated_head_losses,
+            },
+        }
+        payload = {}
+        for layer, ids in (("nodes", self.node_ids), ("pipes", self.pipe_ids)):
+            values = self.results[layer]
+            change = np.max([np.abs(values[name] - previous[layer][name]) for name in values], axis=0)
+            payload[layer] = {
+                "ids": ids.tolist(),
+                **{name: column.tolist() for name, column in values.items()},
+                "change": [None if np.isnan(c) else c for c in change.tolist()],
+            }
+        return payload
+
+    @timed('save')
+    def current_run(self, fingerprint):
+        """
+        Последний расчет проекта, если записанные им результаты соответствуют отпечатку
+        fingerprint и сеть после него не менялась (та же версия проекта); иначе None.
+        """
+        if not (self.record_runs and fingerprint):
+            return None
+        run = (
+            CalculationRun.objects.filter(project_id=self.project_id)
+            .only('id', 'created_at', 'fingerprint', 'revision').first()
+        )
+        if run is None or run.fingerprint != fingerprint:
+            return None
+        revision = Project.objects.filter(pk=self.project_id).values_list('revision', flat=True).first()
+        return run if run.revision == revision else None
+
+    def save_results(self, heads, method=None, fingerprint=None):
+        """
+        Запись результатов в БД пакетами (bulk_update по save_batch_size строк)
+        вместо отдельного UPDATE на каждый узел и трубу. Объекты для bulk_update
+        создаются только с pk и полями результатов - сеть из БД заново не читается.
+        При record_runs расчет добавляется в историю одной строкой (см. runs.py);
+        при write_element_results = False запись в историю - единственная.
+        Массивы результатов остаются в self.results (см. results_payload).
+        """
+        logger.debug("Сохранение результатов в БД")
+        self.results = self.result_arrays(heads)
+        self.run = None
         with transaction.atomic():
-            # Сохраняем Узлы
-            for i, node in enumerate(self.nodes):
-                head = float(heads[i])
-                elevation = float(getattr(node, 'elevation', 0.0) or 0.0)
-                pressure = head - elevation
-                
-                # Ограничиваем неадекватные значения для БД
-                pressure = max(pressure, -100.0)
-                pressure = min(pressure, 2000.0)
-                
-                node.calculated_pressure = pressure
-                node.save(update_fields=['calculated_pressure'])
-
-            # Сохраняем Трубы
-            for pipe in self.pipes:
-                idx_from = self.node_id_to_index[pipe.from_node_id]
-                idx_to = self.node_id_to_index[pipe.to_node_id]
-                h_from = float(heads[idx_from])
-                h_to = float(heads[idx_to])
-                
-                delta_h = h_from - h_to
-                head_loss = abs(delta_h)
-
-                # Пересчитываем финальные параметры потока
-                q_mag = self.flow_for_headloss(head_loss, pipe)
-                q_signed = q_mag if delta_h >= 0 else -q_mag
-
-                D_m = float(pipe.diameter) / 1000.0
-                area = np.pi * (D_m ** 2) / 4.0 if D_m > 0 else 1.0
-                velocity = q_signed / area if area > 0 else 0.0
-                
-                print(f" Pipe {pipe.id}: Q={q_signed:.4f} m3/s, V={velocity:.2f} m/s, Loss={head_loss:.2f} m")
-
-                pipe.calculated_flow_rate = q_signed
-                pipe.calculated_velocity = velocity
-                pipe.calculated_head_loss = head_loss
-                pipe.save(update_fields=['calculated_flow_rate', 'calculated_velocity', 'calculated_head_loss'])
\ No newline at end of file
+            if self.write_element_results:
+                self.update_elements()
+            if self.record_runs:
+                revision = Project.objects.filter(pk=self.project_id).values_list('revision', flat=True).first()
+                self.run = create_run(
+                    self.project_id, method or self.method, revision or 0,
+                    self.node_ids, self.pipe_ids, self.results, fingerprint=fingerprint,
+                )
+
+    def update_elements(self):
+        """Результаты self.results в поля calculated_* узлов и труб."""
+        node_results, pipe_results = self.results["nodes"], self.results["pipes"]
+
+        nodes = [
+            Node(pk=node_id, calculated_head=head, calculated_pressure=pressure)
+            for node_id, head, pressure in zip(
+                self.node_ids.tolist(), node_results["head"].tolist(), node_results["pressure"].tolist()
+            )
+        ]
+        pipes = [
+            Pipe(pk=pipe_id, calculated_flow_rate=q, calculated_velocity=v, calculated_head_loss=loss)
+            for pipe_id, q, v, loss in zip(
+                self.pipe_ids.tolist(), pipe_results["flow_rate"].tolist(),
+                pipe_results["velocity"].tolist(), pipe_results["head_loss"].tolist(),
+            )
+        ]
+
+        Node.objects.bulk_update(nodes, ['calculated_head', 'calculated_pressure'], batch_size=self.save_batch_size)
+        Pipe.objects.bulk_update(
+            pipes,
+            ['calculated_flow_rate', 'calculated_velocity', 'calculated_head_loss'],
+            batch_size=self.save_batch_size
+        )
+        Project.bump_revision(self.project_id)  # bulk_update не вызывает сигналы (см. signals.py)
+
+    # ------------------------------------------------------------------
+    # 5. РАСЧЕТ ВО ВРЕМЕНИ (EXTENDED PERIOD SIMULATION)
+    # ------------------------------------------------------------------
+    def demand_multipliers(self, step_count, timestep):
+        """
+        Множители потребления (шаги x узлы) по шаблонам узлов.
+        Узлы без шаблона - множитель 1.0; шаблон повторяется циклически.
+        """
+        multipliers = np.ones((step_count, self.node_ids.size))
+        pattern_ids = self.network.pattern_ids
+        times = np.arange(step_count) * timestep
+
+        for pattern in DemandPattern.objects.filter(project_id=self.project_id):
+            values = np.asarray(pattern.multipliers, dtype=float)
+            mask = pattern_ids == pattern.id
+            if values.size == 0 or not mask.any():
+                continue
+            idx = (times // max(pattern.timestep, 1)) % values.size
+            multipliers[:, mask] = values[idx][:, None]
+
+        return multipliers
+
+    @instrumented
+    def solve_extended(self, duration=24 * 3600, timestep=3600):
+        """
+        Расчет во времени: последовательность установившихся режимов с шагом timestep (с)
+        на интервале [0, duration]. Потребление = base_demand * множитель шаблона.
+        Каждый шаг - GGA с теплым стартом от напоров и расходов прошлого шага;
+        шаблон разреженности и порядок исключения (prepare_gga) считаются один раз.
+        Результаты всех шагов сохраняются одной записью ExtendedPeriodRun,
+        поля calculated_* узлов и труб не меняются.
+        """
+        logger.info("Расчет во времени проекта %s: старт", self.project_id)
+        duration, timestep = int(duration), int(timestep)
+        if timestep <= 0 or duration < 0:
+            return {"success": False, "message": "Длительность и шаг расчета должны быть положительными"}
+
+        try:
+            self.load_data()
+        except Exception as e:
+            logger.warning("Ошибка загрузки проекта %s: %s", self.project_id, e)
+            return {"success": False, "message": str(e)}
+
+        step_count = duration // timestep + 1
+        multipliers = self.demand_multipliers(step_count, timestep)
+        base_demands = self.demands.copy()
+
+        all_heads = np.empty((step_count, self.node_ids.size), dtype=np.float32)
+        all_flows = np.empty((step_count, self.pipe_ids.size), dtype=np.float32)
+        total_iterations = 0
+
+        heads = self.initial_guess()
+        flows = None
+        try:
+            for k in range(step_count):
+                self.demands = base_demands * multipliers[k]
+                heads, converged, msg = self.run_gga(heads, initial_flows=flows)
+                if not converged:
+                    return {"success": False, "message": f"Шаг {k} ({k * timestep} с): расчет не сошелся: {msg}"}
+
+                flows = self.gga_flows
+                total_iterations += self.iterations or 0
+                all_heads[k] = heads
+                all_flows[k] = flows
+
+                if self.cancel_check is not None and self.cancel_check():
+                    return {"success": False, "cancelled": True, "message": "Расчет отменен"}
+        finally:
+            self.demands = base_demands
+
+        pressures = np.clip(all_heads - self.elevations, -100.0, 2000.0)
+        with self.timer.phase('save'):
+            run = ExtendedPeriodRun.objects.create(
+                project_id=self.project_id,
+                duration=duration,
+                timestep=timestep,
+                step_count=step_count,
+                node_ids=pack_array(self.node_ids, dtype=np.int64),
+                pipe_ids=pack_array(self.pipe_ids, dtype=np.int64),
+                heads=pack_array(all_heads),
+                pressures=pack_array(pressures, dtype=np.float32),
+                flows=pack_array(all_flows),
+            )
+
+        logger.debug("Расчет во времени: %d шагов, %d итераций GGA", step_count, total_iterations)
+        return {
+            "success": True,
+            "message": f"Расчет во времени выполнен: {step_count} шагов",
+            "run_id": run.id,
+            "steps": step_count,
+            "iterations": total_iterations,
+        }
+
+    # ------------------------------------------------------------------
+    # 6. ПАКЕТНЫЙ РАСЧЕТ СЦЕНАРИЕВ
+    # ------------------------------------------------------------------
+    def scenario_matrices(self, scenarios):
+        """
+        Матрицы сценариев (после load_data) из описаний вида
+            {"demand_multiplier": 1.2, "demands": {node_id: Q}, "fixed_heads": {node_id: H}}
+        demand_multiplier применяется к базовому потреблению, demands - задает его явно,
+        fixed_heads - меняет напор существующих источников.
+        Возвращает (demands S x N, fixed_heads S x N).
+        """
+        count = len(scenarios)
+        demands = np.tile(self.demands, (count, 1))
+        fixed_heads = np.tile(self.fixed_heads, (count, 1))
+
+        for k, spec in enumerate(scenarios):
+            demands[k] *= float(spec.get('demand_multiplier', 1.0))
+
+            for node_id, value in (spec.get('demands') or {}).items():
+                idx = self.node_id_to_index.get(int(node_id))
+                if idx is None:
+                    raise ValueError(f"Сценарий {k}: узел {node_id} не найден в проекте")
+                demands[k, idx] = float(value)
+
+            for node_id, value in (spec.get('fixed_heads') or {}).items():
+                idx = self.node_id_to_index.get(int(node_id))
+                if idx is None or not self.fixed_mask[idx]:
+                    raise ValueError(f"Сценарий {k}: узел {node_id} не является источником")
+                fixed_heads[k, idx] = float(value)
+
+        return demands, fixed_heads
+
+    @timed('solve')
+    def solve_scenarios(self, demands, fixed_heads=None, initial_heads=None, initial_flows=None):
+        """
+        Пакетный расчет S сценариев на одной топологии методом GGA (после load_data).
+        Потери напора, производные и невязки считаются сразу для всех сценариев
+        двумерными массивами (сценарии x элементы); prepare_gga - общий для всех.
+        Линейные системы решаются по сценариям с общим шаблоном и порядком исключения.
+        Шаг демпфируется тем же линейным поиском, что и в run_gga, - по каждому сценарию
+        отдельно. Сошедшиеся сценарии из дальнейших итераций исключаются, как и сценарии,
+        невязка которых не уменьшается stagnation_iterations итераций подряд.
+
+        demands: S x N потребление; fixed_heads: S x N напоры (учитываются только у источников).
+        initial_heads / initial_flows: общее начальное приближение для всех сценариев
+        (например, решение при средних расходах); по умолчанию - холодный старт.
+        Возвращает (heads S x N, flows S x P, converged S).
+        """
+        demands = np.atleast_2d(np.asarray(demands, dtype=float))
+        count = demands.shape[0]
+        if fixed_heads is None:
+            fixed_heads = np.tile(self.fixed_heads, (count, 1))
+        fixed_heads = np.atleast_2d(np.asarray(fixed_heads, dtype=float))
+
+        setup = self.prepare_gga()
+        junctions, active = setup["junctions"], setup["active"]
+        A, Aj, AjT = setup["A"], setup["Aj"], setup["AjT"]
+        jidx = np.flatnonzero(junctions)
+
+        if initial_heads is None:
+            initial_heads = self.initial_guess(warm=False)
+        heads = np.tile(np.asarray(initial_heads, dtype=float), (count, 1))
+        heads[:, self.fixed_mask] = fixed_heads[:, self.fixed_mask]
+        flows = np.zeros((count, self.pipe_ids.size))
+        converged = np.zeros(count, dtype=bool)
+
+        if jidx.size == 0:
+            for k in range(count):
+                flows[k] = self.pipe_flows(heads[k])[0]
+            return heads, flows, np.ones(count, dtype=bool)
+
+        Af_T_H0 = (A[self.fixed_mask].T @ fixed_heads[:, self.fixed_mask].T).T
+        dj = demands[:, junctions]
+
+        if initial_flows is not None:
+            q = np.tile(np.asarray(initial_flows, dtype=float)[active], (count, 1))
+        else:
+            # Начальное приближение по расходам: скорость 1 м/с от from к to
+            q = np.tile(self.pipe_constants["area"][active], (count, 1))
+
+        def evaluate(rows, q, Hj):
+            """Невязки F1, F2 и dinv сценариев rows (строки q, Hj - в том же порядке)."""
+            self.counters["residual_evaluations"] += int(rows.size)
+            all_q = np.zeros((rows.size, self.pipe_ids.size))
+            all_q[:, active] = q
+            h_all, dh_all = self.headloss_for_flow(all_q)
+            F1 = h_all[:, active] + (AjT @ Hj.T).T + Af_T_H0[rows]
+            return F1, (Aj @ q.T).T - dj[rows], 1.0 / dh_all[:, active]
+
+        def merits(dinv, F1, F2):
+            return np.einsum('ij,ij->i', dinv * F1, dinv * F1) + np.einsum('ij,ij->i', F2, F2)
+
+        pending = np.arange(count)
+        F1, F2, dinv = evaluate(pending, q, heads[:, jidx])
+        best_merit = np.full(count, np.inf)
+        stalled = np.zeros(count, dtype=int)
+        recent = np.full((count, self.gga_line_search_memory), -np.inf)  # Невязки последних итераций
+        self.iterations = 0
+        for it in range(1, self.gga_maxiter + 1):
+            qp, Hj = q[pending], heads[np.ix_(pending, jidx)]
+            F1p, F2p, dinvp = F1[pending], F2[pending], dinv[pending]
+            rhs = F2p - (Aj @ (dinvp * F1p).T).T
+
+            dH = np.full(rhs.shape, np.nan)
+            for r in range(pending.size):
+                x = self.solve_gga_system(setup, dinvp[r], rhs[r])
+                if x is not None:
+                    dH[r] = x
+            failed = ~np.isfinite(dH).all(axis=1)
+            dH[failed] = 0.0
+            dq = -dinvp * (F1p + (AjT @ dH.T).T)
+
+            # Сходимость по полному шагу Ньютона (как в run_gga)
+            done = ~failed & (np.linalg.norm(dH, axis=1) <= self.equation_tol * np.maximum(
+                np.linalg.norm(Hj + dH, axis=1), 1.0
+            ))
+            q[pending[done]] = qp[done] + dq[done]
+            heads[np.ix_(pending[done], jidx)] = Hj[done] + dH[done]
+            converged[pending[done]] = True
+
+            # Линейный поиск по сценариям: шаг уменьшается только у тех, где невязка не падает
+            search = np.flatnonzero(~done & ~failed)
+            merit = merits(dinvp[search], F1p[search], F2p[search])
+            recent[pending[search], it % recent.shape[1]] = merit
+            limit = recent[pending[search]].max(axis=1)
+            step = np.ones(search.size)
+            trying = np.arange(search.size)
+            while trying.size:
+                rows, local = pending[search[trying]], search[trying]
+                trial_q = qp[local] + step[trying, None] * dq[local]
+                trial_H = Hj[local] + step[trying, None] * dH[local]
+                trial_F1, trial_F2, trial_dinv = evaluate(rows, trial_q, trial_H)
+                trial_merit = merits(dinvp[local], trial_F1, trial_F2)
+                accept = (trial_merit <= (1.0 - 1e-4 * step[trying]) * limit[trying]) | (step[trying] <= self.gga_min_step)
+                accepted = rows[accept]
+                q[accepted], heads[np.ix_(accepted, jidx)] = trial_q[accept], trial_H[accept]
+                F1[accepted], F2[accepted], dinv[accepted] = trial_F1[accept], trial_F2[accept], trial_dinv[accept]
+                trying = trying[~accept]
+                step[trying] *= 0.5
+
+            # Застой: невязка не уменьшилась хотя бы на 1% за stagnation_iterations итераций
+            rows = pending[search]
+            improved = merit < 0.99 * best_merit[rows]
+            best_merit[rows[improved]] = merit[improved]
+            stalled[rows] = np.where(improved, 0, stalled[rows] + 1)
+
+            pending = rows[stalled[rows] < self.stagnation_iterations]
+            self.iterations = it
+            if pending.size == 0:
+                break
+            if self.budget is not None and self.budget.exhausted() is not None:
+                break
+
+        flows[:, active] = q
+        logger.debug("Сценарии: %d из %d сошлись за %s итераций", int(converged.sum()), count, self.iterations)
+        return heads, flows, converged
+
+    # ------------------------------------------------------------------
+    # 7. АНАЛИЗ НЕОПРЕДЕЛЕННОСТИ ПОТРЕБЛЕНИЯ (МОНТЕ-КАРЛО)
+    # ------------------------------------------------------------------
+    @instrumented
+    def solve_monte_carlo(self, samples=1000, distributions=None, batch_size=100, workers=1, seed=None):
+        """
+        Монте-Карло по потреблению узлов (см. montecarlo.py). Результаты в БД узлов
+        и труб не записываются: возвращается статистика давлений (P5/P50/P95)
+        по узлам и огибающие скоростей по трубам.
+        """
+        logger.info("Монте-Карло проекта %s: старт", self.project_id)
+        try:
+            self.load_data()
+            with self.timer.phase('solve'):
+                stats = run_monte_carlo(
+                    self, samples, distributions, batch_size=batch_size, workers=workers, seed=seed
+                )
+        except ValueError as e:
+            return {"success": False, "message": str(e)}
+
+        if stats is None:
+            return {"success": False, "cancelled": True, "message": "Расчет отменен"}
+        if stats["converged_samples"] == 0:
+            return {"success": False, "message": "Ни одна выборка не сошлась"}
+
+        message = f"Выполнено {stats['converged_samples']} из {stats['samples']} выборок"
+        if stats["failed_samples"]:
+            # Несошедшиеся выборки в статистику не входят - сообщаем об этом явно
+            message += (
+                f"; не сошлись {stats['failed_samples']} ({stats['failure_rate']:.1%}),"
+                f" статистика - по сошедшимся"
+            )
+            logger.warning("Монте-Карло проекта %s: %s", self.project_id, message)
+        else:
+            logger.debug("Монте-Карло: %s", message)
+        return {"success": True, "message": message, **stats}
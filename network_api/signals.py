@@ -0,0 +1,39 @@
+# network_api/signals.py
+#
+# Версия сети проекта (Project.revision) растет при каждом сохранении или
+# удалении узла и трубы через ORM. Пакетные операции (bulk_create, bulk_update,
+# QuerySet.update) сигналов не вызывают - там Project.bump_revision
+# вызывается явно (см. HydraulicSolver.save_results). QuerySet.delete вызывает
+# post_delete для каждой строки: пакетные правки выполняют его внутри
+# revision_signals_suppressed и увеличивают версию один раз (см. batch.py).
+
+import threading
+from contextlib import contextmanager
+
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Node, Pipe, Project
+
+_state = threading.local()
+
+
+@contextmanager
+def revision_signals_suppressed():
+    """Внутри блока сохранение и удаление узлов и труб не меняют версию сети (в текущем потоке)."""
+    previous = getattr(_state, 'suppressed', False)
+    _state.suppressed = True
+    try:
+        yield
+    finally:
+        _state.suppressed = previous
+
+
+@receiver(post_save, sender=Node)
+@receiver(post_save, sender=Pipe)
+@receiver(post_delete, sender=Node)
+@receiver(post_delete, sender=Pipe)
+def bump_project_revision(sender, instance, **kwargs):
+    if getattr(_state, 'suppressed', False):
+        return
+    Project.bump_revision(instance.project_id)
@@ -0,0 +1,26 @@
+# network_api/storage.py
+#
+# Компактное хранение массивов результатов в БД (BinaryField / bytea):
+# numpy .npy (тип и форма внутри) + сжатие zlib.
+
+import io
+import zlib
+
+import numpy as np
+
+
+def pack_array(arr, dtype=None, compress=True):
+    """Массив numpy -> bytes для BinaryField."""
+    arr = np.ascontiguousarray(arr, dtype=dtype)
+    buffer = io.BytesIO()
+    np.save(buffer, arr, allow_pickle=False)
+    data = buffer.getvalue()
+    return zlib.compress(data, 1) if compress else data
+
+
+def unpack_array(blob):
+    """bytes из BinaryField -> массив numpy (сжатые и несжатые данные)."""
+    data = bytes(blob)
+    if not data.startswith(b'\x93NUMPY'):
+        data = zlib.decompress(data)
+    return np.load(io.BytesIO(data), allow_pickle=False)
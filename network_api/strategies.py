@@ -0,0 +1,185 @@
+# network_api/strategies.py
+#
+# Цепочка стратегий решения (метод 'auto' HydraulicSolver): стратегии
+# пробуются по очереди, пока одна не сойдется.
+#
+#   newton - GGA (демпфированный Ньютон с линейным поиском, см. run_gga);
+#   hybr, lm - scipy.optimize.root по невязкам equations() с аналитическим
+#              якобианом (плотная матрица N x N - только для сетей до dense_max_nodes);
+#   krylov - scipy.optimize.root (Ньютон-Крылов) без матрицы якобиана.
+#
+# Общий для всех попыток бюджет (время и число вычислений невязок) и
+# обнаружение застоя (невязка перестала уменьшаться) прерывают безнадежную
+# попытку сразу, а не после тысяч вычислений; через бюджет же во время
+# итераций проверяется отмена задачи. Каждая попытка попадает в отчет
+# расчета ("attempts").
+#
+# Успех по критерию метода (lm - минимум суммы квадратов, не обязательно корень)
+# принимается, только если невязки решения (solver.solution_residuals) в допуске
+# solver.residual_tolerance(). Сеть с узлами без связи с источником отклоняется
+# до первой попытки.
+
+import time
+
+import numpy as np
+
+STRATEGIES = ('newton', 'hybr', 'lm', 'krylov')
+DENSE_METHODS = ('hybr', 'lm')  # Плотный якобиан N x N
+
+
+class SolveStopped(Exception):
+    """Попытка прервана: исчерпан бюджет или невязка не уменьшается."""
+
+
+class SolveBudget:
+    """
+    Бюджет одного расчета на все попытки: time_limit (с) и max_evaluations
+    (вычислений невязок, по счетчику residual_evaluations решателя); None - без ограничения.
+    cancel_check - функция без аргументов (True - расчет отменен, см. jobs.py); она
+    обращается к БД и вызывается не чаще раза в cancel_interval секунд.
+    """
+
+    def __init__(self, counters, time_limit=None, max_evaluations=None, cancel_check=None, cancel_interval=0.5):
+        self.counters = counters
+        self.time_limit = time_limit
+        self.max_evaluations = max_evaluations
+        self.cancel_check = cancel_check
+        self.cancel_interval = cancel_interval
+        self.cancelled = False
+        self.started = time.perf_counter()
+        self.last_cancel_check = self.started
+        self.start_evaluations = counters["residual_evaluations"]
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    @property
+    def evaluations(self):
+        return self.counters["residual_evaluations"] - self.start_evaluations
+
+    def exhausted(self):
+        """Причина остановки (строка) или None, если бюджет не исчерпан."""
+        if self.time_limit is not None and self.elapsed > self.time_limit:
+            return f"Исчерпан бюджет времени расчета ({self.time_limit} с)"
+        if self.max_evaluations is not None and self.evaluations > self.max_evaluations:
+            return f"Исчерпан бюджет вычислений невязок ({self.max_evaluations})"
+        if self.cancel_check is not None and not self.cancelled:
+            now = time.perf_counter()
+            if now - self.last_cancel_check >= self.cancel_interval:
+                self.last_cancel_check = now
+                self.cancelled = bool(self.cancel_check())
+        if self.cancelled:
+            return "Расчет отменен"
+        return None
+
+    def check(self):
+        reason = self.exhausted()
+        if reason is not None:
+            raise SolveStopped(reason)
+
+
+class ResidualMonitor:
+    """
+    Наблюдение за невязками попытки fsolve / scipy.optimize.root: лучшее приближение,
+    бюджет и застой - лучшая невязка не уменьшилась хотя бы в 1/(1 - min_decrease)
+    раз за window вычислений (window = None - застой не проверяется).
+    """
+
+    def __init__(self, window, budget=None, min_decrease=0.01):
+        self.window = window
+        self.budget = budget
+        self.min_decrease = min_decrease
+        self.best_norm = np.inf
+        self.best_heads = None
+        self.reference = np.inf  # Лучшая невязка на начало текущего окна
+        self.since_progress = 0
+        self.evaluations = 0
+
+    def observe(self, heads, residuals):
+        self.evaluations += 1
+        norm = float(np.abs(residuals).max())
+        if norm < self.best_norm:
+            self.best_norm = norm
+            self.best_heads = np.array(heads, dtype=float)
+        if self.best_norm < (1.0 - self.min_decrease) * self.reference:
+            self.reference = self.best_norm
+            self.since_progress = 0
+        else:
+            self.since_progress += 1
+            if self.window is not None and self.since_progress > self.window:
+                raise SolveStopped(f"Невязка не уменьшается ({self.window} вычислений подряд)")
+        if self.budget is not None:
+            self.budget.check()
+
+
+def attempt_report(strategy, converged, message, started, evaluations, residual_norm=None, iterations=None):
+    return {
+        "strategy": strategy,
+        "converged": bool(converged),
+        "message": message,
+        "iterations": iterations,
+        "evaluations": evaluations,
+        "residual_norm": residual_norm,
+        "time": round(time.perf_counter() - started, 6),
+    }
+
+
+def run_strategies(solver, initial_heads):
+    """
+    Стратегии solver.strategies по очереди от initial_heads; каждая следующая
+    стартует с лучшего по невязке приближения (начального или прошлых попыток).
+    Возвращает (heads, converged, msg), отчет о попытках - в solver.attempts.
+    """
+    heads = np.asarray(initial_heads, dtype=float)
+    unsupplied = solver.unsupplied_nodes()
+    if unsupplied.size:
+        ids = ', '.join(str(i) for i in solver.node_ids[unsupplied[:10]].tolist())
+        return heads, False, f"Узлы без связи с источником ({unsupplied.size}): {ids}"
+
+    tolerance = solver.residual_tolerance()
+    best_norm = float(np.abs(solver.equations(heads)).max())
+    last_message = "Нет стратегий решения"
+    for strategy in solver.strategies:
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Неизвестная стратегия решения: {strategy}")
+        started = time.perf_counter()
+        evaluations = solver.counters["residual_evaluations"]
+
+        reason = solver.budget.exhausted() if solver.budget is not None else None
+        if reason is None and strategy in DENSE_METHODS and heads.size > solver.dense_max_nodes:
+            reason = f"Пропущена: узлов больше {solver.dense_max_nodes} (плотный якобиан)"
+        if reason is not None:
+            solver.attempts.append(attempt_report(strategy, False, reason, started, 0))
+            last_message = reason
+            continue
+
+        if strategy == 'newton':
+            result, converged, message = solver.run_gga(heads)
+            iterations = solver.iterations
+        else:
+            result, converged, message = solver.run_root(strategy, heads)
+            iterations = None
+
+        residual_norm = start_norm = None
+        if np.all(np.isfinite(result)):
+            # Невязка по расходам, которые будут сохранены (у GGA - собственные расходы)
+            residuals = np.abs(solver.solution_residuals(result))
+            residual_norm = float(residuals.max())
+            if converged and np.any(residuals > tolerance):
+                converged = False
+                message = f"{message}; невязка {residual_norm:.2e} вне допуска"
+            # Следующая стратегия получает только напоры - сравниваются невязки equations()
+            start_norm = float(np.abs(solver.equations(result)).max())
+        elif converged:
+            converged, message = False, f"{message}; решение не конечно"
+        solver.attempts.append(attempt_report(
+            strategy, converged, message, started,
+            solver.counters["residual_evaluations"] - evaluations, residual_norm, iterations,
+        ))
+        if converged:
+            return result, True, f"{strategy}: {message}"
+        last_message = f"{strategy}: {message}"
+        if start_norm is not None and start_norm < best_norm:
+            heads, best_norm = result, start_norm
+    return heads, False, last_message
@@ -1,7 +1,18 @@
-from django.test import TestCase
+import json
+
+import numpy as np
+from scipy import sparse
+from django.test import TestCase, override_settings
 from django.contrib.gis.geos import Point, LineString
-from .models import Project, Node, Pipe
-from .services import HydraulicSolver
+from rest_framework.test import APIClient
+from .models import Project, Node, Pipe, CalculationJob, DemandPattern
+from .serializers import NodeSerializer
+from .results import decode_binary
+from .services import HydraulicSolver, solution_cache
+from .linalg import SPDSystem, symbolic_cache
+from .network import NetworkArrays
+from .benchmark import generate_network, run_case
+from .diagnostics import metrics
 
 class PhysicsVerificationTest(TestCase):
     """
@@ -112,4 +123,1066 @@ class PhysicsVerificationTest(TestCase):
         
         # Проверяем, попадаем ли мы в диапазон 6.8 - 7.0 метров
         self.assertTrue(6.5 < pipe.calculated_head_loss < 7.2)
-        print(f"✅ Потери напора совпадают с табличными значениями!")
\ No newline at end of file
+        print(f"✅ Потери напора совпадают с табличными значениями!")
+
+    def test_04_incidence_matrix(self):
+        """
+        СЦЕНАРИЙ 4: Матрица инцидентности.
+        Суть: Цепочка Источник -> Узел A -> Узел B.
+        Ожидание: В каждом столбце матрицы (труба) ровно -1 (from) и +1 (to),
+        а невязки на точном решении (без потребления, все напоры равны) нулевые.
+        """
+        print("\n--- ТЕСТ 4: Матрица инцидентности ---")
+
+        source = Node.objects.create(project=self.project, node_type="Reservoir", fixed_head=40, geometry=Point(0,0))
+        node_a = Node.objects.create(project=self.project, node_type="Junction", geometry=Point(100,0))
+        node_b = Node.objects.create(project=self.project, node_type="Junction", geometry=Point(200,0))
+        Pipe.objects.create(
+            project=self.project, from_node=source, to_node=node_a,
+            length=100, diameter=100, roughness_coefficient=0.1, geometry=LineString((0,0), (100,0))
+        )
+        Pipe.objects.create(
+            project=self.project, from_node=node_a, to_node=node_b,
+            length=100, diameter=100, roughness_coefficient=0.1, geometry=LineString((100,0), (200,0))
+        )
+
+        solver = HydraulicSolver(self.project.id)
+        solver.load_data()
+
+        A = solver.incidence.toarray()
+        self.assertEqual(A.shape, (3, 2))
+        self.assertTrue((A.sum(axis=0) == 0).all())
+        self.assertTrue((A.min(axis=0) == -1).all())
+
+        residuals = solver.equations([40.0, 40.0, 40.0])
+        self.assertTrue((abs(residuals) < 1e-12).all())
+        print("✅ Матрица инцидентности построена корректно!")
+
+    def test_05_gga_matches_fsolve(self):
+        """
+        СЦЕНАРИЙ 5: Метод глобального градиента (GGA).
+        Суть: Кольцо из трех труб с двумя потребителями.
+        Ожидание: GGA и fsolve дают одинаковые расходы и давления.
+        """
+        print("\n--- ТЕСТ 5: GGA против fsolve ---")
+
+        source = Node.objects.create(project=self.project, node_type="Reservoir", fixed_head=60, geometry=Point(0,0))
+        node_a = Node.objects.create(project=self.project, node_type="Junction", base_demand=0.02, geometry=Point(100,0))
+        node_b = Node.objects.create(project=self.project, node_type="Junction", base_demand=0.03, geometry=Point(100,100))
+        pipes = [
+            Pipe.objects.create(
+                project=self.project, from_node=a, to_node=b,
+                length=length, diameter=diameter, roughness_coefficient=0.1, geometry=LineString((0,0), (100,0))
+            )
+            for a, b, length, diameter in [
+                (source, node_a, 200, 200), (node_a, node_b, 150, 100), (source, node_b, 300, 150),
+            ]
+        ]
+
+        results = {}
+        for method in ('fsolve', 'gga'):
+            result = HydraulicSolver(self.project.id).solve(method=method)
+            self.assertTrue(result['success'])
+            for pipe in pipes:
+                pipe.refresh_from_db()
+            node_b.refresh_from_db()
+            results[method] = [p.calculated_flow_rate for p in pipes] + [node_b.calculated_pressure]
+
+        for q_fsolve, q_gga in zip(results['fsolve'], results['gga']):
+            self.assertAlmostEqual(q_fsolve, q_gga, places=3)
+        print("✅ GGA совпадает с fsolve!")
+
+    def test_06_vectorized_flow_kernel(self):
+        """
+        СЦЕНАРИЙ 6: Векторный расчет расхода по потерям напора.
+        Суть: Набор труб с разными режимами (ноль, ламинарный, турбулентный, вырожденная труба).
+        Ожидание: flow_for_headloss_array совпадает с ручным расчетом: Пуазейль в ламинарном
+        режиме, неподвижная точка Q = sqrt(h g pi^2 D^5 / (8 f L)) с f по Свами-Джейну в турбулентном.
+        """
+        print("\n--- ТЕСТ 6: Векторное ядро расхода ---")
+
+        solver = HydraulicSolver(self.project.id)
+        abs_dh = [0.0, 1e-8, 1e-4, 0.5, 7.0, 50.0, 3.0]
+        lengths = [100, 100, 250, 100, 100, 1000, 0]
+        diameters = [100, 20, 50, 100, 100, 300, 100]
+        roughness = [0.1, 0.1, 0.05, 0.1, 0.1, 1.0, 0.1]
+
+        # Ламинарный режим: Q = h g pi D^4 / (128 nu L), nu = 1.004e-6 м2/с, g = 9.81 м/с2
+        expected = [
+            0.0,                    # нулевой перепад
+            3.837029871977e-12,     # ламинарный, Re ~ 2.4e-4
+            5.995359174963e-07,     # ламинарный, Re ~ 15
+            0.005084113666126,      # турбулентный, Re ~ 64 000
+            0.02012981291486,       # турбулентный, Re ~ 255 000
+            0.2327093467779,        # турбулентный, Re ~ 984 000
+            0.0,                    # L = 0 - вырожденная труба
+        ]
+
+        flows = solver.flow_for_headloss_array(
+            abs_dh, lengths, [d / 1000.0 for d in diameters], [e / 1000.0 for e in roughness]
+        )
+
+        for k, value in enumerate(expected):
+            self.assertAlmostEqual(flows[k], value, delta=solver.pipe_q_tol)
+        print("✅ Векторное ядро совпадает с ручным расчетом!")
+
+
+    @override_settings(HYDRAULIC_JOBS_EAGER=True)
+    def test_07_calculation_job(self):
+        """
+        СЦЕНАРИЙ 7: Асинхронная задача расчета.
+        Суть: POST /calculate/ возвращает задачу, результат - через /calculations/{id}/.
+        Ожидание: Задача выполнена, в ответе свежие трубы; завершенную задачу отменить нельзя.
+        """
+        print("\n--- ТЕСТ 7: Задача расчета ---")
+
+        source = Node.objects.create(project=self.project, node_type="Reservoir", fixed_head=50, geometry=Point(0,0))
+        consumer = Node.objects.create(project=self.project, node_type="Junction", base_demand=0.01, geometry=Point(100,0))
+        Pipe.objects.create(
+            project=self.project, from_node=source, to_node=consumer,
+            length=100, diameter=100, roughness_coefficient=0.1, geometry=LineString((0,0), (100,0))
+        )
+
+        client = APIClient()
+        response = client.post(f'/api/projects/{self.project.id}/calculate/', {'method': 'gga'}, format='json')
+        self.assertEqual(response.status_code, 202)
+        job_id = response.data['id']
+
+        response = client.get(f'/api/calculations/{job_id}/')
+        self.assertEqual(response.data['status'], CalculationJob.STATUS_SUCCESS)
+        pipes = response.data['data']['pipes']['features']
+        self.assertAlmostEqual(pipes[0]['properties']['calculated_flow_rate'], 0.01, places=4)
+
+        response = client.post(f'/api/calculations/{job_id}/cancel/')
+        self.assertEqual(response.status_code, 409)
+        print("✅ Задача расчета выполнена!")
+
+    def test_08_solution_cache(self):
+        """
+        СЦЕНАРИЙ 8: Кэш решений.
+        Суть: Повторный расчет неизмененной сети и сети, где изменилась только геометрия.
+        Ожидание: Оба раза решение берется из кэша (неизмененная сеть - без повторной
+        записи результатов); изменение потребления - новый расчет.
+        """
+        print("\n--- ТЕСТ 8: Кэш решений ---")
+
+        source = Node.objects.create(project=self.project, node_type="Reservoir", fixed_head=50, geometry=Point(0,0))
+        consumer = Node.objects.create(project=self.project, node_type="Junction", base_demand=0.01, geometry=Point(100,0))
+        Pipe.objects.create(
+            project=self.project, from_node=source, to_node=consumer,
+            length=100, diameter=100, roughness_coefficient=0.1, geometry=LineString((0,0), (100,0))
+        )
+
+        first = HydraulicSolver(self.project.id).solve()
+        self.assertFalse(first['cached'])
+        revision = Project.objects.get(pk=self.project.id).revision
+        second = HydraulicSolver(self.project.id).solve(include_results=True)
+        self.assertTrue(second['cached'])
+        self.assertNotIn('results', first)
+
+        # Результаты этого решения уже записаны: ни новой строки истории, ни новой версии сети
+        self.assertEqual(second['run'], first['run'])
+        self.assertEqual(self.project.calculation_runs.count(), 1)
+        self.assertEqual(Project.objects.get(pk=self.project.id).revision, revision)
+        self.assertEqual(len(second['results']['nodes']['ids']), 2)
+
+        # Перетаскивание узла на карте не влияет на гидравлику
+        consumer.geometry = Point(150, 20)
+        consumer.save()
+        self.assertTrue(HydraulicSolver(self.project.id).solve()['cached'])
+
+        consumer.base_demand = 0.02
+        consumer.save()
+        self.assertFalse(HydraulicSolver(self.project.id).solve()['cached'])
+        self.assertGreaterEqual(solution_cache.stats()['hits'], 2)
+        print("✅ Кэш решений работает!")
+
+    def test_09_warm_start(self):
+        """
+        СЦЕНАРИЙ 9: Теплый старт.
+        Суть: Повторный расчет после небольшого изменения потребления и добавления узла.
+        Ожидание: Старые напоры используются, новый узел интерполируется по соседям,
+        GGA сходится за несколько итераций.
+        """
+        print("\n--- ТЕСТ 9: Теплый старт ---")
+
+        source = Node.objects.create(project=self.project, node_type="Reservoir", fixed_head=50, geometry=Point(0,0))
+        node_a = Node.objects.create(project=self.project, node_type="Junction", base_demand=0.01, geometry=Point(100,0))
+        node_b = Node.objects.create(project=self.project, node_type="Junction", base_demand=0.01, geometry=Point(200,0))
+        for a, b in [(source, node_a), (node_a, node_b)]:
+            Pipe.objects.create(
+                project=self.project, from_node=a, to_node=b,
+                length=100, diameter=100, roughness_coefficient=0.1, geometry=LineString((0,0), (100,0))
+            )
+
+        cold = HydraulicSolver(self.project.id).solve(method='gga')
+        self.assertTrue(cold['success'])
+        self.assertFalse(cold['warm_start']['used'])
+        node_a.refresh_from_db()
+        self.assertIsNotNone(node_a.calculated_head)
+
+        node_c = Node.objects.create(project=self.project, node_type="Junction", base_demand=0.002, geometry=Point(300,0))
+        Pipe.objects.create(
+            project=self.project, from_node=node_b, to_node=node_c,
+            length=100, diameter=100, roughness_coefficient=0.1, geometry=LineString((200,0), (300,0))
+        )
+
+        warm = HydraulicSolver(self.project.id).solve(method='gga')
+        self.assertTrue(warm['success'])
+        self.assertEqual(warm['warm_start']['reused'], 2)
+        self.assertEqual(warm['warm_start']['interpolated'], 1)
+        self.assertLessEqual(warm['iterations'], cold['iterations'])
+        print(f"Итерации: холодный старт {cold['iterations']}, теплый {warm['iterations']}")
+        print("✅ Теплый старт работает!")
+
+    @override_settings(HYDRAULIC_JOBS_EAGER=True)
+    def test_10_extended_period(self):
+        """
+        СЦЕНАРИЙ 10: Расчет во времени.
+        Суть: Потребитель с шаблоном [1.0, 2.0] (по часу), расчет на 2 часа с шагом 1 час.
+        Ожидание: Расход в трубе по шагам 0.01, 0.02, 0.01; поля calculated_* не тронуты.
+        """
+        print("\n--- ТЕСТ 10: Расчет во времени ---")
+
+        pattern = DemandPattern.objects.create(project=self.project, name="Сутки", multipliers=[1.0, 2.0])
+        source = Node.objects.create(project=self.project, node_type="Reservoir", fixed_head=50, geometry=Point(0,0))
+        consumer = Node.objects.create(
+            project=self.project, node_type="Junction", base_demand=0.01, demand_pattern=pattern, geometry=Point(100,0)
+        )
+        pipe = Pipe.objects.create(
+            project=self.project, from_node=source, to_node=consumer,
+            length=100, diameter=100, roughness_coefficient=0.1, geometry=LineString((0,0), (100,0))
+        )
+
+        client = APIClient()
+        response = client.post(
+            f'/api/projects/{self.project.id}/simulate/', {'duration': 7200, 'timestep': 3600}, format='json'
+        )
+        self.assertEqual(response.status_code, 202)
+        job = CalculationJob.objects.get(pk=response.data['id'])
+        self.assertEqual(job.status, CalculationJob.STATUS_SUCCESS)
+        self.assertEqual(job.details['steps'], 3)
+
+        response = client.get(f"/api/simulations/{job.details['run_id']}/series/", {'pipe': pipe.id})
+        self.assertEqual(response.data['time'], [0, 3600, 7200])
+        for flow, expected in zip(response.data['flows'], [0.01, 0.02, 0.01]):
+            self.assertAlmostEqual(flow, expected, places=5)
+        response = client.get(f"/api/simulations/{job.details['run_id']}/series/", {'pipe': 'abc'})
+        self.assertEqual(response.status_code, 400)
+
+        pipe.refresh_from_db()
+        self.assertIsNone(pipe.calculated_flow_rate)
+        print("✅ Расчет во времени выполнен!")
+
+    def test_11_scenarios(self):
+        """
+        СЦЕНАРИЙ 11: Пакетный расчет сценариев.
+        Суть: Один потребитель, три сценария - базовый, x2 потребление, другой напор источника.
+        Ожидание: Расходы 0.01, 0.02, 0.01; в третьем сценарии давление выше на 10 м.
+        """
+        print("\n--- ТЕСТ 11: Сценарии ---")
+
+        source = Node.objects.create(project=self.project, node_type="Reservoir", fixed_head=50, geometry=Point(0,0))
+        consumer = Node.objects.create(project=self.project, node_type="Junction", base_demand=0.01, geometry=Point(100,0))
+        Pipe.objects.create(
+            project=self.project, from_node=source, to_node=consumer,
+            length=100, diameter=100, roughness_coefficient=0.1, geometry=LineString((0,0), (100,0))
+        )
+
+        scenarios = [
+            {"name": "База"},
+            {"name": "Пик", "demand_multiplier": 2.0},
+            {"name": "Насос", "fixed_heads": {str(source.id): 60}},
+        ]
+        response = APIClient().post(
+            f'/api/projects/{self.project.id}/scenarios/', {'scenarios': scenarios}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['status'], 'success')
+
+        results = response.data['scenarios']
+        consumer_idx = response.data['node_ids'].index(consumer.id)
+        for result, expected in zip(results, [0.01, 0.02, 0.01]):
+            self.assertAlmostEqual(result['flows'][0], expected, places=5)
+        self.assertAlmostEqual(
+            results[2]['pressures'][consumer_idx] - results[0]['pressures'][consumer_idx], 10.0, places=4
+        )
+        print("✅ Сценарии рассчитаны!")
+
+    @override_settings(HYDRAULIC_JOBS_EAGER=True)
+    def test_12_monte_carlo(self):
+        """
+        СЦЕНАРИЙ 12: Неопределенность потребления (Монте-Карло).
+        Суть: Один потребитель 0.01 м3/с, потребление равномерно в диапазоне x0.5..x1.5, 200 выборок.
+        Ожидание: Скорости в трубе внутри диапазона расходов 0.005..0.015; P5 < P50 < P95 давления.
+        """
+        print("\n--- ТЕСТ 12: Монте-Карло ---")
+
+        source = Node.objects.create(project=self.project, node_type="Reservoir", fixed_head=50, geometry=Point(0,0))
+        consumer = Node.objects.create(project=self.project, node_type="Junction", base_demand=0.01, geometry=Point(100,0))
+        Pipe.objects.create(
+            project=self.project, from_node=source, to_node=consumer,
+            length=100, diameter=100, roughness_coefficient=0.1, geometry=LineString((0,0), (100,0))
+        )
+
+        params = {
+            'samples': 200, 'batch_size': 50, 'workers': 1, 'seed': 7,
+            'distributions': {'by_type': {'Junction': {'distribution': 'uniform', 'low': 0.5, 'high': 1.5}}},
+        }
+        response = APIClient().post(f'/api/projects/{self.project.id}/montecarlo/', params, format='json')
+        self.assertEqual(response.status_code, 202)
+        job = CalculationJob.objects.get(pk=response.data['id'])
+        self.assertEqual(job.status, CalculationJob.STATUS_SUCCESS)
+        self.assertEqual(job.details['converged_samples'], 200)
+        self.assertEqual(job.details['failed_samples'], 0)
+        self.assertEqual(job.details['failure_rate'], 0.0)
+
+        area = 3.141592653589793 * 0.1 ** 2 / 4
+        velocity = job.details['velocity']
+        self.assertGreaterEqual(velocity['min'][0], 0.005 / area - 1e-6)
+        self.assertLessEqual(velocity['max'][0], 0.015 / area + 1e-6)
+
+        idx = job.details['node_ids'].index(consumer.id)
+        pressure = job.details['pressure']
+        self.assertLess(pressure['p5'][idx], pressure['p50'][idx])
+        self.assertLess(pressure['p50'][idx], pressure['p95'][idx])
+        print("✅ Монте-Карло выполнен!")
+
+    def test_13_topology_reduction(self):
+        """
+        СЦЕНАРИЙ 13: Выделение тупиковых ветвей.
+        Суть: Кольцо из трех узлов у источника и тупиковая ветвь из двух узлов.
+        Ожидание: Ветвь снимается (в ядре 4 узла), напоры совпадают с расчетом без выделения;
+        сохраненные расходы удовлетворяют балансу в каждом узле.
+        """
+        print("\n--- ТЕСТ 13: Тупиковые ветви ---")
+
+        source = Node.objects.create(project=self.project, node_type="Reservoir", fixed_head=50, geometry=Point(0,0))
+        ring = [
+            Node.objects.create(project=self.project, node_type="Junction", base_demand=0.005, geometry=Point(x, y))
+            for x, y in [(100, 0), (200, 0), (150, 100)]
+        ]
+        branch = [
+            Node.objects.create(project=self.project, node_type="Junction", base_demand=0.002, geometry=Point(x, 200))
+            for x in (150, 250)
+        ]
+        links = [(source, ring[0]), (ring[0], ring[1]), (ring[1], ring[2]), (ring[2], ring[0]),
+                 (branch[0], ring[2]), (branch[0], branch[1])]
+        for a, b in links:
+            Pipe.objects.create(
+                project=self.project, from_node=a, to_node=b,
+                length=100, diameter=100, roughness_coefficient=0.1, geometry=LineString((0,0), (100,0))
+            )
+
+        heads = {}
+        for reduce in (True, False):
+            solver = HydraulicSolver(self.project.id)
+            solver.use_cache = False
+            solver.use_topology_reduction = reduce
+            solver.load_data()
+            heads[reduce], converged, _ = solver.run_method('gga', solver.initial_guess(warm=False))
+            self.assertTrue(converged)
+            if reduce:
+                self.assertEqual(solver.reduction, {"core_nodes": 4, "tree_nodes": 2})
+
+        for reduced, full in zip(heads[True], heads[False]):
+            self.assertAlmostEqual(reduced, full, places=6)
+
+        # Сохраняются расходы GGA: баланс в каждом узле выполнен без погрешности подбора Q(h)
+        self.assertTrue(HydraulicSolver(self.project.id).solve(method='gga')['success'])
+        balance = {node.id: -node.base_demand for node in ring + branch}
+        for pipe in Pipe.objects.filter(project=self.project):
+            if pipe.to_node_id in balance:
+                balance[pipe.to_node_id] += pipe.calculated_flow_rate
+            if pipe.from_node_id in balance:
+                balance[pipe.from_node_id] -= pipe.calculated_flow_rate
+        for residual in balance.values():
+            self.assertAlmostEqual(residual, 0.0, places=12)
+        print("✅ Тупиковые ветви рассчитаны напрямую!")
+
+    def test_14_linear_solvers(self):
+        """
+        СЦЕНАРИЙ 14: Линейные решатели GGA.
+        Суть: Сетка 4x4 у источника, GGA с SuperLU, CG+Jacobi и CG+ILU.
+        Ожидание: Одинаковые напоры; порядок исключения берется из кэша при повторном расчете.
+        """
+        print("\n--- ТЕСТ 14: Линейные решатели ---")
+
+        source = Node.objects.create(project=self.project, node_type="Reservoir", fixed_head=50, geometry=Point(0,0))
+        grid = [
+            [Node.objects.create(project=self.project, node_type="Junction", base_demand=0.002, geometry=Point(c, r))
+             for c in range(4)]
+            for r in range(4)
+        ]
+        links = [(source, grid[0][0])]
+        links += [(grid[r][c], grid[r][c + 1]) for r in range(4) for c in range(3)]
+        links += [(grid[r][c], grid[r + 1][c]) for r in range(3) for c in range(4)]
+        for a, b in links:
+            Pipe.objects.create(
+                project=self.project, from_node=a, to_node=b,
+                length=100, diameter=150, roughness_coefficient=0.1, geometry=LineString((0,0), (100,0))
+            )
+
+        symbolic_cache.clear()
+        heads = {}
+        for backend, preconditioner in [('superlu', 'jacobi'), ('cg', 'jacobi'), ('cg', 'ilu')]:
+            solver = HydraulicSolver(self.project.id)
+            solver.linear_solver = backend
+            solver.preconditioner = preconditioner
+            solver.load_data()
+            heads[backend, preconditioner], converged, _ = solver.run_gga(solver.initial_guess(warm=False))
+            self.assertTrue(converged)
+
+        self.assertEqual(symbolic_cache.stats()['misses'], 1)
+        for other in (('cg', 'jacobi'), ('cg', 'ilu')):
+            for h_lu, h_cg in zip(heads['superlu', 'jacobi'], heads[other]):
+                self.assertAlmostEqual(h_lu, h_cg, places=6)
+
+        # Шаблон больше 46 000 неизвестных: ключи позиций не переполняются
+        side = 230
+        index = np.arange(side * side).reshape(side, side)
+        edges = np.concatenate([
+            np.stack([index[:, :-1].ravel(), index[:, 1:].ravel()], axis=1),
+            np.stack([index[:-1, :].ravel(), index[1:, :].ravel()], axis=1),
+        ])
+        f, t = edges[:, 0], edges[:, 1]
+        rows = np.concatenate([f, t, f, t, index.ravel()])
+        cols = np.concatenate([f, t, t, f, index.ravel()])
+        entries = np.concatenate([np.ones(2 * len(f)), -np.ones(2 * len(f)), np.full(side * side, 0.1)])
+        system = SPDSystem(side * side, rows, cols)
+        self.assertGreaterEqual(system.pattern["indices"].min(), 0)
+        rhs = np.ones(side * side)
+        x = system.solve(entries, rhs)
+        matrix = sparse.csr_matrix((entries, (rows, cols)), shape=(side * side, side * side))
+        self.assertLess(np.abs(matrix @ x - rhs).max(), 1e-8)
+        print("✅ Линейные решатели совпадают!")
+
+    def test_15_synthetic_benchmark(self):
+        """
+        СЦЕНАРИЙ 15: Синтетические сети для замеров.
+        Суть: Генерация сетей в памяти (без БД) и замер расчета.
+        Ожидание: Генерация воспроизводима; дерево и кольцевая магистраль сходятся, этапы замерены;
+        GGA сходится на случайном геометрическом графе из 1000 узлов (трубы в переходном режиме).
+        """
+        print("\n--- ТЕСТ 15: Синтетические сети ---")
+
+        nodes_a, pipes_a = generate_network('geometric', 50, seed=3)
+        nodes_b, pipes_b = generate_network('geometric', 50, seed=3)
+        self.assertEqual(
+            [(p.from_node_id, p.to_node_id, p.diameter) for p in pipes_a],
+            [(p.from_node_id, p.to_node_id, p.diameter) for p in pipes_b],
+        )
+
+        for kind in ('tree', 'ring'):
+            result = run_case(kind, 200, method='gga', seed=1)
+            self.assertTrue(result['converged'], result['message'])
+            self.assertEqual(result['nodes'], 200)
+            self.assertLess(result['max_residual'], 1e-6)
+            self.assertEqual(set(result['phases']), {'generate', 'build', 'initial_guess', 'solve', 'results'})
+            self.assertGreater(result['peak_memory_mb'], 0)
+
+        result = run_case('geometric', 1000, method='gga', track_memory=False)
+        self.assertTrue(result['converged'], result['message'])
+        self.assertLess(result['iterations'], 20)
+        self.assertLess(result['max_residual'], 1e-6)
+        print("✅ Замеры на синтетических сетях выполнены!")
+
+    @override_settings(HYDRAULIC_JOBS_EAGER=True, HYDRAULIC_TRACK_MEMORY=True)
+    def test_16_diagnostics(self):
+        """
+        СЦЕНАРИЙ 16: Замеры расчета.
+        Суть: Расчет через /calculate/ и запрос счетчиков /metrics/.
+        Ожидание: В ответе блок diagnostics с этапами, счетчиками, невязкой и памятью;
+        счетчик завершенных задач в формате Prometheus.
+        """
+        print("\n--- ТЕСТ 16: Замеры расчета ---")
+
+        source = Node.objects.create(project=self.project, node_type="Reservoir", fixed_head=50, geometry=Point(0,0))
+        consumer = Node.objects.create(project=self.project, node_type="Junction", base_demand=0.01, geometry=Point(100,0))
+        Pipe.objects.create(
+            project=self.project, from_node=source, to_node=consumer,
+            length=100, diameter=100, roughness_coefficient=0.1, geometry=LineString((0,0), (100,0))
+        )
+
+        metrics.clear()
+        client = APIClient()
+        response = client.post(f'/api/projects/{self.project.id}/calculate/', {'method': 'gga'}, format='json')
+        self.assertEqual(response.status_code, 202)
+        diagnostics = response.data['diagnostics']
+        self.assertTrue({'load', 'index', 'assemble', 'save'} <= set(diagnostics['phases']))
+        self.assertGreater(diagnostics['counters']['residual_evaluations'], 0)
+        self.assertLess(diagnostics['residual_norm'], 1e-6)
+        self.assertGreater(diagnostics['peak_memory_mb'], 0)
+
+        response = client.get('/api/metrics/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('hydraulic_jobs_total{kind="steady",status="success"} 1', response.content.decode())
+        print("✅ Замеры расчета получены!")
+
+    def test_17_network_arrays(self):
+        """
+        СЦЕНАРИЙ 17: Сеть в виде массивов.
+        Суть: Загрузка сети двумя запросами values_list (без геометрии) и расчет по массивам.
+        Ожидание: Незаданные напоры - NaN, id в порядке возрастания;
+        результаты расчета записываются в узлы и трубы по id.
+        """
+        print("\n--- ТЕСТ 17: Сеть в виде массивов ---")
+
+        source = Node.objects.create(project=self.project, node_type="Reservoir", fixed_head=50, geometry=Point(0,0))
+        consumer = Node.objects.create(project=self.project, node_type="Junction", base_demand=0.01, geometry=Point(100,0))
+        pipe = Pipe.objects.create(
+            project=self.project, from_node=source, to_node=consumer,
+            length=100, diameter=100, roughness_coefficient=0.1, geometry=LineString((0,0), (100,0))
+        )
+
+        with self.assertNumQueries(2):
+            network = NetworkArrays.load(self.project.id)
+        self.assertEqual(network.node_ids.tolist(), [source.id, consumer.id])
+        self.assertEqual(network.fixed_heads[0], 50)
+        self.assertTrue(np.isnan(network.fixed_heads[1]))
+        self.assertEqual(network.node_index([consumer.id, -1]).tolist(), [1, -1])
+
+        solver = HydraulicSolver(self.project.id)
+        result = solver.solve(method='gga')
+        self.assertTrue(result['success'], result['message'])
+
+        pipe.refresh_from_db()
+        consumer.refresh_from_db()
+        self.assertAlmostEqual(pipe.calculated_flow_rate, 0.01, places=6)
+        self.assertAlmostEqual(consumer.calculated_head, 50 - pipe.calculated_head_loss, places=6)
+        print("✅ Расчет по массивам выполнен!")
+
+    def test_18_streaming_geojson(self):
+        """
+        СЦЕНАРИЙ 18: Потоковая выдача слоя.
+        Суть: GET /api/nodes/ отдается потоком FeatureCollection по пачкам курсора.
+        Ожидание: Те же объекты, id и свойства, что у GeoFeatureModelSerializer.
+        """
+        print("\n--- ТЕСТ 18: Потоковый GeoJSON ---")
+
+        for x in range(5):
+            Node.objects.create(project=self.project, name=f"Узел {x}", base_demand=0.01, geometry=Point(x, 0))
+
+        client = APIClient()
+        with override_settings(HYDRAULIC_GEOJSON_CHUNK_SIZE=2):
+            response = client.get('/api/nodes/', {'project': self.project.id}, HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        data = json.loads(b''.join(response.streaming_content))
+
+        expected = NodeSerializer(Node.objects.order_by('pk'), many=True).data
+        self.assertEqual(data['type'], 'FeatureCollection')
+        self.assertEqual([f['id'] for f in data['features']], [f['id'] for f in expected['features']])
+        for feature, reference in zip(data['features'], expected['features']):
+            self.assertEqual(feature['properties'], dict(reference['properties']))
+            self.assertEqual(feature['geometry']['coordinates'], list(reference['geometry']['coordinates']))
+        print("✅ Слой выдан потоком!")
+
+    def test_19_binary_results(self):
+        """
+        СЦЕНАРИЙ 19: Результаты столбцами.
+        Суть: После расчета GET /api/projects/{id}/results/ для узлов и труб.
+        Ожидание: Двоичный пакет с id (int32) и значениями, равными полям calculated_* в БД.
+        """
+        print("\n--- ТЕСТ 19: Двоичные результаты ---")
+
+        source = Node.objects.create(project=self.project, node_type="Reservoir", fixed_head=50, geometry=Point(0,0))
+        consumer = Node.objects.create(project=self.project, node_type="Junction", base_demand=0.01, geometry=Point(100,0))
+        pipe = Pipe.objects.create(
+            project=self.project, from_node=source, to_node=consumer,
+            length=100, diameter=100, roughness_coefficient=0.1, geometry=LineString((0,0), (100,0))
+        )
+        self.assertTrue(HydraulicSolver(self.project.id).solve(method='gga')['success'])
+        consumer.refresh_from_db()
+        pipe.refresh_from_db()
+
+        client = APIClient()
+        url = f'/api/projects/{self.project.id}/results/'
+        response = client.get(url, {'fields': 'calculated_pressure', 'dtype': 'float64'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/octet-stream')
+        ids, values = decode_binary(response.content)
+        self.assertEqual(ids.tolist(), [source.id, consumer.id])
+        self.assertEqual(list(values), ['calculated_pressure'])
+        self.assertAlmostEqual(values['calculated_pressure'][1], consumer.calculated_pressure)
+
+        ids, values = decode_binary(client.get(url, {'layer': 'pipes'}).content)
+        self.assertEqual(ids.tolist(), [pipe.id])
+        self.assertAlmostEqual(float(values['calculated_flow_rate'][0]), pipe.calculated_flow_rate, places=6)
+
+        self.assertEqual(client.get(url, {'fields': 'geometry'}).status_code, 400)
+        print("✅ Результаты выданы столбцами!")
+
+    def test_20_network_etag(self):
+        """
+        СЦЕНАРИЙ 20: Сеть проекта одним запросом с ETag.
+        Суть: GET /api/projects/{id}/network/, повтор с If-None-Match, затем правка узла.
+        Ожидание: Повтор - 304; после правки и после расчета версия растет, ответ 200;
+        выбранные поля - только они в свойствах.
+        """
+        print("\n--- ТЕСТ 20: Сеть проекта и ETag ---")
+
+        source = Node.objects.create(project=self.project, node_type="Reservoir", fixed_head=50, geometry=Point(0,0))
+        consumer = Node.objects.create(project=self.project, node_type="Junction", base_demand=0.01, geometry=Point(100,0))
+        Pipe.objects.create(
+            project=self.project, from_node=source, to_node=consumer,
+            length=100, diameter=100, roughness_coefficient=0.1, geometry=LineString((0,0), (100,0))
+        )
+
+        client = APIClient()
+        url = f'/api/projects/{self.project.id}/network/'
+        response = client.get(url, {'node_fields': 'elevation,base_demand'})
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(len(data['nodes']['features']), 2)
+        self.assertEqual(len(data['pipes']['features']), 1)
+        self.assertEqual(set(data['nodes']['features'][0]['properties']), {'elevation', 'base_demand'})
+        etag = response['ETag']
+
+        response = client.get(url, {'node_fields': 'elevation,base_demand'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertNotEqual(client.get(url)['ETag'], etag)  # Другой набор полей - другой ETag
+
+        consumer.base_demand = 0.02
+        consumer.save()
+        response = client.get(url, {'node_fields': 'elevation,base_demand'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+
+        self.assertTrue(HydraulicSolver(self.project.id).solve(method='gga')['success'])
+        response = client.get(url, {'node_fields': 'elevation,base_demand'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(client.get(url, {'pipe_fields': 'geometry'}).status_code, 400)
+        print("✅ ETag сети работает!")
+
+    @override_settings(HYDRAULIC_JOBS_EAGER=True)
+    def test_21_results_from_solver(self):
+        """
+        СЦЕНАРИЙ 21: Результаты из ответа решателя.
+        Суть: Источник и две независимые ветви; после расчета меняем потребление одной ветви.
+        Ожидание: в задаче только сводка; mode=results - все элементы без геометрии (из
+        истории расчетов); mode=delta после повторного расчета - только узел и труба измененной ветви.
+        """
+        print("\n--- ТЕСТ 21: Результаты без повторного чтения сети ---")
+
+        source = Node.objects.create(project=self.project, node_type="Reservoir", fixed_head=50, geometry=Point(0,0))
+        branch_a = Node.objects.create(project=self.project, base_demand=0.01, geometry=Point(100,0))
+        branch_b = Node.objects.create(project=self.project, base_demand=0.01, geometry=Point(0,100))
+        pipe_a = Pipe.objects.create(
+            project=self.project, from_node=source, to_node=branch_a,
+            length=100, diameter=100, roughness_coefficient=0.1, geometry=LineString((0,0), (100,0))
+        )
+        Pipe.objects.create(
+            project=self.project, from_node=source, to_node=branch_b,
+            length=100, diameter=100, roughness_coefficient=0.1, geometry=LineString((0,0), (0,100))
+        )
+
+        client = APIClient()
+        job_id = client.post(f'/api/projects/{self.project.id}/calculate/', {'method': 'gga'}, format='json').data['id']
+        self.assertNotIn('results', CalculationJob.objects.get(pk=job_id).details)  # Только сводка
+        data = client.get(f'/api/calculations/{job_id}/', {'mode': 'results'}).data['data']
+        self.assertEqual(data['nodes']['ids'], [source.id, branch_a.id, branch_b.id])
+        self.assertAlmostEqual(data['pipes']['flow_rate'][0], 0.01, places=6)
+        self.assertNotIn('features', data['nodes'])
+
+        branch_a.base_demand = 0.02
+        branch_a.save()
+        job_id = client.post(f'/api/projects/{self.project.id}/calculate/', {'method': 'gga'}, format='json').data['id']
+        delta = client.get(f'/api/calculations/{job_id}/', {'mode': 'delta', 'tolerance': 1e-6}).data['data']
+        self.assertEqual(delta['nodes']['ids'], [branch_a.id])
+        self.assertEqual(delta['pipes']['ids'], [pipe_a.id])
+        self.assertAlmostEqual(delta['pipes']['flow_rate'][0], 0.02, places=6)
+        print("✅ Результаты получены из истории расчетов!")
+
+    def test_22_epanet_inp(self):
+        """
+        СЦЕНАРИЙ 22: Импорт и экспорт EPANET.
+        Суть: Загрузка .inp (единицы LPS, Хазен-Вильямс) через /inp/, расчет, выгрузка и повторная загрузка.
+        Ожидание: Узлы и трубы созданы с переводом единиц, закрытая труба и насос пропущены;
+        после выгрузки и загрузки в новый проект параметры совпадают.
+        """
+        print("\n--- ТЕСТ 22: EPANET .inp ---")
+        from django.core.files.uploadedfile import SimpleUploadedFile
+
+        inp = (
+            "[JUNCTIONS]\n;ID Elev Demand\nJ1 10 5\nJ2 12 2 ; комментарий\n"
+            "[RESERVOIRS]\nR1 60\n"
+            "[PIPES]\nP1 R1 J1 100 200 130\nP2 J1 J2 150 150 130\nP3 R1 J2 100 100 130 0 Closed\n"
+            "[PUMPS]\nU1 R1 J2 HEAD 1\n"
+            "[COORDINATES]\nJ1 1 1\nJ2 2 2\nR1 0 0\n"
+            "[VERTICES]\nP2 1.5 1.2\n"
+            "[OPTIONS]\nUnits LPS\nHeadloss H-W\n[END]\n"
+        )
+        client = APIClient()
+        url = f'/api/projects/{self.project.id}/inp/'
+        upload = SimpleUploadedFile('net.inp', inp.encode('utf-8'))
+        response = client.post(url, {'file': upload}, format='multipart')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual((response.data['nodes'], response.data['pipes']), (3, 2))
+        self.assertEqual(response.data['skipped'], {'closed pipes': 1, 'pumps': 1})
+
+        j1 = Node.objects.get(project=self.project, name='J1')
+        self.assertAlmostEqual(j1.base_demand, 0.005)
+        p2 = Pipe.objects.get(project=self.project, name='P2')
+        self.assertEqual(p2.from_node_id, j1.id)
+        self.assertEqual(len(p2.geometry.coords), 3)
+        self.assertGreater(p2.roughness_coefficient, 0)
+        self.assertTrue(HydraulicSolver(self.project.id).solve(method='gga')['success'])
+
+        exported = b''.join(client.get(url).streaming_content)
+        other = Project.objects.create(name="Копия")
+        response = client.post(
+            f'/api/projects/{other.id}/inp/', {'file': SimpleUploadedFile('copy.inp', exported)}, format='multipart'
+        )
+        self.assertEqual(response.status_code, 201, response.data)
+        copy = Pipe.objects.get(project=other, name='P2')
+        self.assertAlmostEqual(copy.roughness_coefficient, p2.roughness_coefficient, places=4)
+        self.assertEqual(copy.geometry.coords, p2.geometry.coords)
+        self.assertAlmostEqual(Node.objects.get(project=other, name='J1').base_demand, 0.005)
+        print("✅ Импорт и экспорт EPANET выполнены!")
+
+    def test_23_batch_edit(self):
+        """
+        СЦЕНАРИЙ 23: Пакетное редактирование.
+        Суть: Один POST /batch/ создает узлы и трубу между ними (по temp_id), меняет и удаляет
+        существующие элементы; затем пакет с ошибками.
+        Ожидание: Все правки применены, версия сети выросла; пакет с ошибками отклонен
+        целиком со списком всех ошибок; пакет удалений увеличивает версию ровно на 1.
+        """
+        print("\n--- ТЕСТ 23: Пакетное редактирование ---")
+
+        source = Node.objects.create(project=self.project, node_type="Reservoir", fixed_head=50, geometry=Point(0,0))
+        old = Node.objects.create(project=self.project, geometry=Point(5,5))
+        revision = Project.objects.get(pk=self.project.pk).revision
+
+        client = APIClient()
+        url = f'/api/projects/{self.project.id}/batch/'
+        pipe = {'length': 100, 'diameter': 100, 'roughness_coefficient': 0.1,
+                'geometry': {'type': 'LineString', 'coordinates': [[0, 0], [1, 0]]}}
+        response = client.post(url, {
+            'nodes': {
+                'create': [
+                    {'temp_id': 'a', 'base_demand': 0.01, 'geometry': {'type': 'Point', 'coordinates': [1, 0]}},
+                    {'temp_id': 'b', 'base_demand': 0.01, 'geometry': {'type': 'Point', 'coordinates': [2, 0]}},
+                ],
+                'update': [{'id': source.id, 'fixed_head': 60}],
+                'delete': [old.id],
+            },
+            'pipes': {'create': [
+                {'temp_id': 'p1', 'from_node': source.id, 'to_node': 'a', **pipe},
+                {'temp_id': 'p2', 'from_node': 'a', 'to_node': 'b', **pipe},
+            ]},
+        }, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        created = response.data['created']
+        p2 = Pipe.objects.get(pk=created['pipes']['p2'])
+        self.assertEqual((p2.from_node_id, p2.to_node_id), (created['nodes']['a'], created['nodes']['b']))
+        self.assertEqual(Node.objects.get(pk=source.id).fixed_head, 60)
+        self.assertFalse(Node.objects.filter(pk=old.id).exists())
+        self.assertGreater(response.data['revision'], revision)
+        self.assertTrue(HydraulicSolver(self.project.id).solve(method='gga')['success'])
+
+        response = client.post(url, {
+            'nodes': {'create': [{'temp_id': 'c', 'elevation': 'высоко'}], 'update': [{'id': 999999, 'elevation': 1}]},
+            'pipes': {'create': [{'temp_id': 'p3', 'from_node': source.id, 'to_node': 'нет', **pipe}]},
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(len(response.data['errors']), 2)  # Нет geometry у "c", нет узла 999999
+        self.assertEqual(Node.objects.filter(project=self.project).count(), 3)
+
+        # Удаление нескольких элементов (и каскадных труб) - одна новая версия сети
+        revision = Project.objects.get(pk=self.project.pk).revision
+        response = client.post(url, {
+            'nodes': {'delete': [created['nodes']['b']]},
+            'pipes': {'delete': [created['pipes']['p1']]},
+        }, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(response.data['revision'], revision + 1)
+        self.assertEqual(Pipe.objects.filter(project=self.project).count(), 0)
+        print("✅ Пакет правок применен одной транзакцией!")
+
+    @override_settings(HYDRAULIC_JOBS_EAGER=True)
+    def test_24_calculation_runs(self):
+        """
+        СЦЕНАРИЙ 24: История расчетов.
+        Суть: Два расчета с разным потреблением; второй - без записи в поля узлов и труб.
+        Ожидание: Каждый расчет - запись CalculationRun; результаты и разность расчетов
+        выдаются из истории; поля calculated_* после второго расчета не изменились,
+        а /results/ без записи в поля выдает последний расчет.
+        """
+        print("\n--- ТЕСТ 24: История расчетов ---")
+        from .models import CalculationRun
+
+        source = Node.objects.create(project=self.project, node_type="Reservoir", fixed_head=50, geometry=Point(0,0))
+        consumer = Node.objects.create(project=self.project, base_demand=0.01, geometry=Point(100,0))
+        pipe = Pipe.objects.create(
+            project=self.project, from_node=source, to_node=consumer,
+            length=100, diameter=100, roughness_coefficient=0.1, geometry=LineString((0,0), (100,0))
+        )
+
+        client = APIClient()
+        url = f'/api/projects/{self.project.id}/calculate/'
+        first = client.post(url, {'method': 'gga'}, format='json').data
+        self.assertEqual(CalculationRun.objects.filter(project=self.project).count(), 1)
+
+        consumer.base_demand = 0.02
+        consumer.save()
+        with override_settings(HYDRAULIC_WRITE_ELEMENT_RESULTS=False):
+            second = client.post(url, {'method': 'gga'}, format='json').data
+        self.assertAlmostEqual(Pipe.objects.get(pk=pipe.id).calculated_flow_rate, 0.01, places=6)
+
+        base_id, run_id = first['details']['run'], second['details']['run']
+        data = client.get(f'/api/runs/{run_id}/', {'layer': 'pipes', 'fields': 'flow_rates'}).data
+        self.assertEqual(data['ids'], [pipe.id])
+        self.assertAlmostEqual(data['values']['flow_rates'][0], 0.02, places=5)
+
+        diff = client.get(f'/api/runs/{run_id}/diff/', {'base': base_id, 'layer': 'pipes'}).data
+        self.assertAlmostEqual(diff['values']['flow_rates'][0], 0.01, places=5)
+        self.assertEqual(diff['added'], [])
+        self.assertGreater(diff['summary']['head_losses']['max_abs'], 0)
+
+        binary = client.get(f'/api/runs/{run_id}/', {'layer': 'nodes', 'encoding': 'binary'})
+        ids, values = decode_binary(binary.content)
+        self.assertEqual(ids.tolist(), [source.id, consumer.id])
+        self.assertAlmostEqual(float(values['heads'][0]), 50, places=4)
+        self.assertEqual(client.get(f'/api/runs/{run_id}/', {'layer': 'valves'}).status_code, 400)
+
+        results_url = f'/api/projects/{self.project.id}/results/'
+        ids, values = decode_binary(client.get(results_url, {'layer': 'pipes', 'dtype': 'float64'}).content)
+        self.assertAlmostEqual(float(values['calculated_flow_rate'][0]), 0.01, places=6)  # Поля из БД
+        with override_settings(HYDRAULIC_WRITE_ELEMENT_RESULTS=False):
+            ids, values = decode_binary(client.get(results_url, {'layer': 'pipes', 'dtype': 'float64'}).content)
+        self.assertEqual(ids.tolist(), [pipe.id])
+        self.assertAlmostEqual(float(values['calculated_flow_rate'][0]), 0.02, places=5)
+        self.assertGreater(float(values['calculated_head_loss'][0]), 0)
+        print("✅ Расчеты сохранены в историю и сравниваются без чтения сети!")
+
+    def test_25_vector_tiles(self):
+        """
+        СЦЕНАРИЙ 25: Векторные тайлы.
+        Суть: Источник и потребитель в одном тайле масштаба 15; запрос тайла, повтор
+        с If-None-Match, правка узла, тайл вне сетки.
+        Ожидание: Тайл MVT со слоями nodes и pipes; повтор - 304; после правки сети -
+        новый ETag; неверный тайл - 400.
+        """
+        print("\n--- ТЕСТ 25: Векторные тайлы ---")
+        import math
+
+        source = Node.objects.create(project=self.project, node_type="Reservoir", fixed_head=50, geometry=Point(37.6170, 55.7550))
+        consumer = Node.objects.create(project=self.project, base_demand=0.01, geometry=Point(37.6180, 55.7552))
+        Pipe.objects.create(
+            project=self.project, from_node=source, to_node=consumer, length=70, diameter=100,
+            roughness_coefficient=0.1, geometry=LineString((37.6170, 55.7550), (37.6180, 55.7552))
+        )
+        HydraulicSolver(self.project.id).solve(method='gga')
+
+        z, lon, lat = 15, 37.6175, 55.7551
+        x = int((lon + 180) / 360 * 2 ** z)
+        y = int((1 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2 * 2 ** z)
+        url = f'/api/projects/{self.project.id}/tiles/{z}/{x}/{y}.mvt'
+
+        client = APIClient()
+        response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/vnd.mapbox-vector-tile')
+        self.assertIn(b'nodes', response.content)
+        self.assertIn(b'pipes', response.content)
+        self.assertIn(b'calculated_pressure', response.content)
+
+        etag = response['ETag']
+        self.assertEqual(client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        consumer.base_demand = 0.02
+        consumer.save()
+        self.assertNotEqual(client.get(url)['ETag'], etag)
+
+        self.assertEqual(client.get(f'/api/projects/{self.project.id}/tiles/2/9/0.mvt').status_code, 400)
+        print("✅ Тайл собран в PostGIS и кэшируется по версии сети!")
+
+    def test_26_recalculate_projects(self):
+        """
+        СЦЕНАРИЙ 26: Пересчет многих проектов.
+        Суть: Два проекта - с сетью и пустой; пересчет пакетом, затем "прерывание"
+        (задача осталась в статусе running) и повторный запуск того же пакета.
+        Ожидание: Отчет с итогами по проектам; повторный запуск считает только
+        незавершенную задачу.
+        """
+        print("\n--- ТЕСТ 26: Пересчет проектов пакетом ---")
+        from io import StringIO
+        from django.core.management import call_command
+        from .recalculate import recalculate_projects, select_projects
+
+        network = Project.objects.create(name="Город")
+        source = Node.objects.create(project=network, node_type="Reservoir", fixed_head=50, geometry=Point(0,0))
+        consumer = Node.objects.create(project=network, base_demand=0.01, geometry=Point(100,0))
+        Pipe.objects.create(
+            project=network, from_node=source, to_node=consumer,
+            length=100, diameter=100, roughness_coefficient=0.1, geometry=LineString((0,0), (100,0))
+        )
+
+        projects = select_projects(ids=[network.id, self.project.id])
+        self.assertEqual([p.id for p in projects], [network.id, self.project.id])  # Крупные - первыми
+        report = recalculate_projects(projects, batch="nightly", workers=0)
+        self.assertEqual((report['success'], report['failed'], report['processed']), (1, 1, 2))
+        self.assertEqual(report['problems'][0]['project'], self.project.id)
+
+        job = CalculationJob.objects.get(params__batch="nightly", project=network)
+        CalculationJob.objects.filter(pk=job.pk).update(status=CalculationJob.STATUS_RUNNING)
+        report = recalculate_projects(select_projects(ids=[network.id, self.project.id]), batch="nightly", workers=0)
+        self.assertEqual((report['processed'], report['resumed'], report['success']), (1, 1, 1))
+
+        output = StringIO()
+        call_command('recalculate_projects', projects=[network.id], workers=0, batch="manual", stdout=output, stderr=StringIO())
+        self.assertIn("выполнено 1", output.getvalue())
+        self.assertEqual(CalculationJob.objects.get(params__batch="manual").status, CalculationJob.STATUS_SUCCESS)
+        print("✅ Пакет пересчитан и продолжен после прерывания!")
+
+    def test_27_solver_strategies(self):
+        """
+        СЦЕНАРИЙ 27: Цепочка стратегий решения (метод 'auto').
+        Суть: Синтетическая сеть с трубами в переходном режиме (2000 < Re < 4000);
+        та же сеть с крошечным бюджетом вычислений; аналитический якобиан;
+        кольцо с потреблением без связи с источником; fsolve по кольцевой сети без сокращения деревьев.
+        Ожидание: 'auto' сходится первой же стратегией (newton), попытки в отчете; при
+        исчерпании бюджета оставшиеся стратегии пропускаются; якобиан совпадает
+        с конечными разностями; сеть без источника у части узлов - отказ без попыток;
+        fsolve не прерывается на плато невязки между построениями якобиана.
+        """
+        print("\n--- ТЕСТ 27: Стратегии решения ---")
+        from .strategies import SolveBudget
+
+        result = run_case('geometric', 300, method='auto', seed=2, track_memory=False)
+        self.assertTrue(result['converged'], result['message'])
+        self.assertEqual(result['attempts'], ['newton'])
+        self.assertLess(result['max_residual'], 1e-6)
+
+        solver = HydraulicSolver(project_id=None)
+        solver.use_cache = False
+        solver.set_network(NetworkArrays.from_objects(*generate_network('geometric', 300, seed=2)))
+        solver.strategies = ('hybr', 'krylov')
+        solver.budget = SolveBudget(solver.counters, max_evaluations=5)
+        _, converged, message = solver.run_method('auto', solver.initial_guess(warm=False))
+        self.assertFalse(converged)
+        self.assertIn("бюджет", message)
+        self.assertEqual([a['strategy'] for a in solver.attempts], ['hybr', 'krylov'])
+        self.assertEqual(solver.attempts[1]['evaluations'], 0)
+
+        heads = solver.initial_guess(warm=False) + np.linspace(-1, 1, solver.node_ids.size)
+        jacobian = solver.equations_jacobian(heads)
+        base = solver.equations(heads)
+        for i in (0, 10, 100):
+            shifted = heads.copy()
+            shifted[i] += 1e-6
+            np.testing.assert_allclose(jacobian[:, i], (solver.equations(shifted) - base) / 1e-6, atol=1e-4)
+
+        source = Node.objects.create(project=self.project, node_type="Reservoir", fixed_head=50, geometry=Point(0,0))
+        consumer = Node.objects.create(project=self.project, base_demand=0.01, geometry=Point(100,0))
+        Pipe.objects.create(
+            project=self.project, from_node=source, to_node=consumer,
+            length=100, diameter=100, roughness_coefficient=0.1, geometry=LineString((0,0), (100,0))
+        )
+        response = HydraulicSolver(self.project.id).solve(method='auto')
+        self.assertTrue(response['success'])
+        self.assertEqual(response['attempts'][0]['strategy'], 'newton')
+
+        # Кольцо с потреблением без связи с источником: решения нет, отказ до попыток
+        # (lm иначе "сходится" к минимуму суммы квадратов с невязкой во все потребление)
+        loop = [
+            Node.objects.create(project=self.project, base_demand=0.001, geometry=Point(x, 500))
+            for x in (0, 100, 200)
+        ]
+        for a, b in zip(loop, loop[1:] + loop[:1]):
+            Pipe.objects.create(
+                project=self.project, from_node=a, to_node=b,
+                length=100, diameter=100, roughness_coefficient=0.1, geometry=LineString((0,0), (100,0))
+            )
+        solver = HydraulicSolver(self.project.id)
+        solver.use_cache = False
+        response = solver.solve(method='auto')
+        self.assertFalse(response['success'])
+        self.assertIn("без связи с источником", response['message'])
+        self.assertEqual(response['attempts'], [])
+
+        # Явный fsolve: конечно-разностный якобиан - N вычислений без уменьшения невязки,
+        # окно застоя по вычислениям останавливало сходящийся расчет
+        for reduction in (True, False):
+            result = run_case('ring', 400, method='fsolve', topology_reduction=reduction, track_memory=False)
+            self.assertTrue(result['converged'], result['message'])
+        print("✅ Стратегии решения переключаются, бюджет соблюдается!")
+
+    @override_settings(HYDRAULIC_JOBS_WORKER=True)
+    def test_28_calculation_worker(self):
+        """
+        СЦЕНАРИЙ 28: Воркер расчетов с очередью в БД.
+        Суть: Задача ставится в очередь без пула веб-процесса; рядом - "брошенная" задача
+        (running два часа назад) и задача пакета пересчета; запуск calculation_worker --once.
+        Ожидание: Задача из очереди выполнена, брошенная - в ошибке, задача пакета не тронута.
+        """
+        print("\n--- ТЕСТ 28: Воркер расчетов ---")
+        from datetime import timedelta
+        from io import StringIO
+        from django.core.management import call_command
+        from django.utils import timezone
+
+        source = Node.objects.create(project=self.project, node_type="Reservoir", fixed_head=50, geometry=Point(0,0))
+        consumer = Node.objects.create(project=self.project, base_demand=0.01, geometry=Point(100,0))
+        Pipe.objects.create(
+            project=self.project, from_node=source, to_node=consumer,
+            length=100, diameter=100, roughness_coefficient=0.1, geometry=LineString((0,0), (100,0))
+        )
+
+        client = APIClient()
+        job_id = client.post(f'/api/projects/{self.project.id}/calculate/', {}, format='json').data['id']
+        self.assertEqual(CalculationJob.objects.get(pk=job_id).status, CalculationJob.STATUS_QUEUED)
+
+        stale = CalculationJob.objects.create(
+            project=self.project, status=CalculationJob.STATUS_RUNNING,
+            started_at=timezone.now() - timedelta(hours=2),
+        )
+        batch = CalculationJob.objects.create(project=self.project, params={"batch": "nightly"})
+
+        output = StringIO()
+        call_command('calculation_worker', processes=1, once=True, stdout=output, stderr=StringIO())
+        self.assertIn("Выполнено задач: 1", output.getvalue())
+        self.assertEqual(CalculationJob.objects.get(pk=job_id).status, CalculationJob.STATUS_SUCCESS)
+        self.assertEqual(CalculationJob.objects.get(pk=stale.pk).status, CalculationJob.STATUS_FAILED)
+        self.assertEqual(CalculationJob.objects.get(pk=batch.pk).status, CalculationJob.STATUS_QUEUED)
+        print("✅ Воркер выполнил задачу из очереди, брошенная задача закрыта!")
+
+    @override_settings(HYDRAULIC_CANCEL_CHECK_INTERVAL=0)
+    def test_29_cancel_during_solve(self):
+        """
+        СЦЕНАРИЙ 29: Отмена задачи во время расчета.
+        Суть: Задача установившегося режима (fsolve) уже запущена, пользователь запросил отмену.
+        Ожидание: Отмена замечена в итерациях решателя: задача отменена, попытка прервана
+        с сообщением об отмене, результаты не записаны.
+        """
+        print("\n--- ТЕСТ 29: Отмена во время расчета ---")
+        from .jobs import perform_job
+        from .models import CalculationRun
+
+        source = Node.objects.create(project=self.project, node_type="Reservoir", fixed_head=50, geometry=Point(0,0))
+        consumer = Node.objects.create(project=self.project, base_demand=0.01, geometry=Point(100,0))
+        Pipe.objects.create(
+            project=self.project, from_node=source, to_node=consumer,
+            length=100, diameter=100, roughness_coefficient=0.1, geometry=LineString((0,0), (100,0))
+        )
+
+        job = CalculationJob.objects.create(
+            project=self.project, method='fsolve', status=CalculationJob.STATUS_RUNNING, cancel_requested=True,
+        )
+        perform_job(job)
+        job.refresh_from_db()
+        self.assertEqual(job.status, CalculationJob.STATUS_CANCELLED)
+        self.assertEqual(job.message, "Расчет отменен")
+        self.assertFalse(CalculationRun.objects.filter(project=self.project).exists())
+        self.assertIsNone(Node.objects.get(pk=consumer.id).calculated_pressure)
+
+        calls = []
+        solver = HydraulicSolver(self.project.id)
+        solver.use_cache = False
+        solver.cancel_check = lambda: calls.append(1) or len(calls) >= 2
+        result = solver.solve(method='fsolve')
+        self.assertTrue(result['cancelled'])
+        self.assertEqual(len(calls), 2)  # Вторая проверка - уже внутри итераций fsolve
+        print("✅ Отмена прерывает расчет, не дожидаясь его конца!")
@@ -0,0 +1,98 @@
+# network_api/tiles.py
+#
+# Векторные тайлы (Mapbox Vector Tile) слоев проекта:
+# GET /api/projects/{id}/tiles/{z}/{x}/{y}.mvt
+#
+# Тайл собирается одним запросом в PostGIS (ST_AsMVT / ST_AsMVTGeom): отбор
+# элементов по пересечению с границами тайла (&& - по GiST-индексу поля
+# geometry, который Django создает для геометрических полей), перевод в
+# Web Mercator, упрощение линий с допуском в доли пикселя тайла и
+# квантование в сетку extent. Результаты расчета (calculated_*) - атрибуты
+# элементов, стиль карты строится по ним без отдельных запросов.
+#
+# Слои тайла: "nodes" (точки) и "pipes" (линии). На мелких масштабах
+# (z < NODE_MIN_ZOOM) в слое "nodes" только источники - узлы с заданным напором.
+
+from django.db import connections
+
+from .models import Node, Pipe
+
+EXTENT = 4096         # Размер сетки тайла
+BUFFER = 64           # Запас за границей тайла (в единицах сетки), чтобы линии не рвались
+MAX_ZOOM = 24
+NODE_MIN_ZOOM = 13    # С этого масштаба в тайле все узлы
+SIMPLIFY_PIXELS = 0.5 # Допуск упрощения линий, в пикселях тайла
+
+WORLD_SIZE = 40075016.685578488  # Длина экватора в Web Mercator (м)
+
+NODE_ATTRIBUTES = ('node_type', 'calculated_head', 'calculated_pressure')
+PIPE_ATTRIBUTES = ('diameter', 'calculated_flow_rate', 'calculated_velocity', 'calculated_head_loss')
+
+TILE_SQL = """
+WITH bounds AS (
+    SELECT ST_TileEnvelope(%(z)s, %(x)s, %(y)s) AS tile,
+           ST_Transform(ST_Expand(ST_TileEnvelope(%(z)s, %(x)s, %(y)s), %(margin)s), %(srid)s) AS area
+),
+nodes AS (
+    SELECT n.id, {node_columns},
+           ST_AsMVTGeom(ST_Transform(n.geometry, 3857), bounds.tile, %(extent)s, %(buffer)s, true) AS geom
+    FROM {node_table} n, bounds
+    WHERE n.project_id = %(project)s AND n.geometry && bounds.area
+      AND (%(all_nodes)s OR n.fixed_head IS NOT NULL)
+),
+pipes AS (
+    SELECT p.id, {pipe_columns},
+           ST_AsMVTGeom(
+               ST_Simplify(ST_Transform(p.geometry, 3857), %(tolerance)s, true),
+               bounds.tile, %(extent)s, %(buffer)s, true
+           ) AS geom
+    FROM {pipe_table} p, bounds
+    WHERE p.project_id = %(project)s AND p.geometry && bounds.area
+)
+SELECT
+    (SELECT COALESCE(ST_AsMVT(nodes.*, 'nodes', %(extent)s, 'geom', 'id'), '') FROM nodes WHERE geom IS NOT NULL)
+ || (SELECT COALESCE(ST_AsMVT(pipes.*, 'pipes', %(extent)s, 'geom', 'id'), '') FROM pipes WHERE geom IS NOT NULL)
+"""
+
+
+def supports_tiles(using='default'):
+    """Тайлы строит PostGIS; на других базах эндпоинт недоступен."""
+    return getattr(connections[using].ops, 'postgis', False)
+
+
+def validate_tile(z, x, y):
+    """ValueError, если тайла z/x/y нет в схеме XYZ."""
+    if not 0 <= z <= MAX_ZOOM:
+        raise ValueError(f"Масштаб вне диапазона 0..{MAX_ZOOM}")
+    if not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        raise ValueError(f"Тайл {z}/{x}/{y} вне сетки масштаба")
+
+
+def tile_sql():
+    columns = lambda alias, names: ', '.join(f'{alias}.{name}' for name in names)
+    return TILE_SQL.format(
+        node_columns=columns('n', NODE_ATTRIBUTES),
+        pipe_columns=columns('p', PIPE_ATTRIBUTES),
+        node_table=Node._meta.db_table,
+        pipe_table=Pipe._meta.db_table,
+    )
+
+
+def render_tile(project_id, z, x, y, using='default'):
+    """Тайл MVT (bytes; пустой тайл - b'') слоев проекта."""
+    validate_tile(z, x, y)
+    pixel = WORLD_SIZE / 2 ** z / EXTENT  # Размер пикселя тайла в метрах Web Mercator
+    params = {
+        'project': project_id,
+        'z': z, 'x': x, 'y': y,
+        'extent': EXTENT,
+        'buffer': BUFFER,
+        'margin': BUFFER * pixel,
+        'srid': Node._meta.get_field('geometry').srid,
+        'tolerance': SIMPLIFY_PIXELS * pixel,
+        'all_nodes': z >= NODE_MIN_ZOOM,
+    }
+    with connections[using].cursor() as cursor:
+        cursor.execute(tile_sql(), params)
+        tile = cursor.fetchone()[0]
+    return bytes(tile) if tile is not None else b''
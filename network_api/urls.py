@@ -2,7 +2,10 @@
 
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import ProjectViewSet, NodeViewSet, PipeViewSet
+from .views import (
+    ProjectViewSet, NodeViewSet, PipeViewSet, CalculationJobViewSet,
+    DemandPatternViewSet, ExtendedPeriodRunViewSet, CalculationRunViewSet, metrics_view,
+)
 
 # Создаем роутер
 router = DefaultRouter()
@@ -12,11 +15,26 @@ router = DefaultRouter()
 # /projects/
 # /nodes/
 # /pipes/
+# /calculations/
+# /patterns/
+# /simulations/
+# /runs/
 router.register(r'projects', ProjectViewSet)
 router.register(r'nodes', NodeViewSet)
 router.register(r'pipes', PipeViewSet)
+router.register(r'calculations', CalculationJobViewSet)
+router.register(r'patterns', DemandPatternViewSet)
+router.register(r'simulations', ExtendedPeriodRunViewSet)
+router.register(r'runs', CalculationRunViewSet)
 
 # Подключаем все URLы, которые сгенерировал роутер
 urlpatterns = [
     path('', include(router.urls)),
+    # Векторные тайлы: путь с расширением .mvt - отдельным маршрутом, а не @action роутера
+    path(
+        'projects/<int:pk>/tiles/<int:z>/<int:x>/<int:y>.mvt',
+        ProjectViewSet.as_view({'get': 'tiles'}),
+        name='project-tiles',
+    ),
+    path('metrics/', metrics_view, name='metrics'),
 ]
\ No newline at end of file
@@ -1,12 +1,40 @@
 # network_api/views.py
 
 # ... (твои импорты)
+import hashlib
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.http import Http404, HttpResponse, StreamingHttpResponse
 from rest_framework import viewsets
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from .models import Project, Node, Pipe
-from .serializers import ProjectSerializer, NodeSerializer, PipeSerializer
+from .models import Project, Node, Pipe, CalculationJob, DemandPattern, ExtendedPeriodRun, CalculationRun
+from .serializers import (
+    ProjectSerializer, NodeSerializer, PipeSerializer, CalculationJobSerializer,
+    DemandPatternSerializer, ExtendedPeriodRunSerializer, CalculationRunSerializer,
+)
+from .storage import unpack_array
+from .montecarlo import parse_distribution
 from .services import HydraulicSolver
+from .jobs import submit_job, cancel_job
+from .diagnostics import metrics
+from .geojson import property_fields, stream_feature_collection
+from .batch import BatchEdit
+from .epanet import export_inp, import_inp
+from .results import DTYPES, ENCODINGS, encode_binary, encode_msgpack, load_results
+from .runs import BLOB_FIELDS, diff_runs, previous_run, run_arrays, run_results
+from .tiles import render_tile, supports_tiles
+
+def etag_matches(request, etag):
+    """Заголовок If-None-Match содержит etag (сравнение без учета W/, как требует RFC 9110)."""
+    header = request.headers.get('If-None-Match')
+    if not header:
+        return False
+    tags = [tag.strip().removeprefix('W/') for tag in header.split(',')]
+    return '*' in tags or etag in tags
+
 
 class ProjectViewSet(viewsets.ModelViewSet):
     queryset = Project.objects.all()
@@ -14,59 +42,523 @@ class ProjectViewSet(viewsets.ModelViewSet):
 
     # ... (стандартный код ViewSet) ...
 
-    # === ОБНОВЛЕННЫЙ ЭНДПОИНТ ДЛЯ РАСЧЕТА ===
+    # === ЭНДПОИНТ ДЛЯ РАСЧЕТА ===
     @action(detail=True, methods=['post'])
     def calculate(self, request, pk=None):
         """
-        Запуск гидравлического расчета.
+        Постановка гидравлического расчета в очередь.
         URL: POST /api/projects/{id}/calculate/
-        Возвращает: JSON с обновленными данными узлов и труб.
+        Тело (опционально): {"method": "auto" | "fsolve" | "gga"}
+        Возвращает: задачу расчета (id, status). Результат - GET /api/calculations/{id}/
         """
         project = self.get_object() # Получаем текущий проект
-        
-        # 1. Запускаем математику (наш сервис)
+        method = request.data.get('method') # Метод решения (по умолчанию - настройка сервиса)
+
+        if method and method not in HydraulicSolver.METHODS:
+            return Response({'status': 'error', 'message': f"Неизвестный метод расчета: {method}"}, status=400)
+
+        # Расчет выполняется в пуле процессов (см. jobs.py), запрос не ждет его окончания
+        job = CalculationJob.objects.create(project=project, method=method)
+        submit_job(job)
+
+        job.refresh_from_db()
+        return Response(CalculationJobSerializer(job).data, status=202)
+
+    @action(detail=True, methods=['post'])
+    def simulate(self, request, pk=None):
+        """
+        Постановка расчета во времени (EPS) в очередь.
+        URL: POST /api/projects/{id}/simulate/
+        Тело (опционально): {"duration": 86400, "timestep": 3600} - секунды
+        Возвращает: задачу расчета; после выполнения в details.run_id - id результатов
+        (GET /api/simulations/{run_id}/).
+        """
+        project = self.get_object()
+        try:
+            params = {
+                "duration": int(request.data.get('duration', 24 * 3600)),
+                "timestep": int(request.data.get('timestep', 3600)),
+            }
+        except (TypeError, ValueError):
+            return Response({'status': 'error', 'message': "duration и timestep должны быть целыми числами"}, status=400)
+        if params['timestep'] <= 0 or params['duration'] < 0:
+            return Response({'status': 'error', 'message': "Длительность и шаг расчета должны быть положительными"}, status=400)
+
+        job = CalculationJob.objects.create(project=project, kind=CalculationJob.KIND_EXTENDED, params=params)
+        submit_job(job)
+
+        job.refresh_from_db()
+        return Response(CalculationJobSerializer(job).data, status=202)
+
+    @action(detail=True, methods=['post'])
+    def montecarlo(self, request, pk=None):
+        """
+        Постановка анализа неопределенности потребления (Монте-Карло) в очередь.
+        URL: POST /api/projects/{id}/montecarlo/
+        Тело: {"samples": 1000, "batch_size": 100, "seed": 1,
+               "distributions": {"default": {"distribution": "normal", "cv": 0.1},
+                                 "by_type": {"Junction": {"distribution": "lognormal", "cv": 0.2}},
+                                 "by_node": {"<node_id>": {"distribution": "uniform", "low": 0.5, "high": 1.5}}}}
+        Возвращает: задачу расчета; после выполнения в details - P5/P50/P95 давлений
+        по узлам и огибающие скоростей по трубам (в порядке node_ids / pipe_ids).
+        """
+        project = self.get_object()
+        distributions = request.data.get('distributions') or {}
+        try:
+            params = {
+                "samples": int(request.data.get('samples', 1000)),
+                "batch_size": int(request.data.get('batch_size', 100)),
+                "workers": int(request.data.get('workers', getattr(settings, 'HYDRAULIC_MONTE_CARLO_WORKERS', 1))),
+                "seed": int(request.data['seed']) if request.data.get('seed') is not None else None,
+                "distributions": distributions,
+            }
+            if not isinstance(distributions, dict):
+                raise ValueError("distributions должен быть объектом")
+            for spec in [distributions.get('default', {}), *(distributions.get('by_type') or {}).values(),
+                         *(distributions.get('by_node') or {}).values()]:
+                parse_distribution(spec)
+        except (TypeError, ValueError, AttributeError) as e:
+            return Response({'status': 'error', 'message': f"Неверные параметры: {e}"}, status=400)
+        if params['samples'] <= 0 or params['batch_size'] <= 0 or params['workers'] <= 0:
+            return Response({'status': 'error', 'message': "samples, batch_size и workers должны быть положительными"}, status=400)
+
+        job = CalculationJob.objects.create(project=project, kind=CalculationJob.KIND_MONTE_CARLO, params=params)
+        submit_job(job)
+
+        job.refresh_from_db()
+        return Response(CalculationJobSerializer(job).data, status=202)
+
+
+    @action(detail=True, methods=['post'])
+    def scenarios(self, request, pk=None):
+        """
+        Пакетный расчет сценариев на текущей топологии (результаты в БД не записываются).
+        URL: POST /api/projects/{id}/scenarios/
+        Тело: {"scenarios": [{"name": "...", "demand_multiplier": 1.2,
+                              "demands": {"<node_id>": 0.01}, "fixed_heads": {"<node_id>": 55}}, ...]}
+        Возвращает: порядок id узлов и труб и по каждому сценарию массивы напоров, давлений
+        и расходов в этом порядке (null - сценарий не сошелся).
+        """
+        project = self.get_object()
+        specs = request.data.get('scenarios')
+        if not isinstance(specs, list) or not specs or not all(isinstance(spec, dict) for spec in specs):
+            return Response({'status': 'error', 'message': "Ожидается непустой список scenarios"}, status=400)
+
         solver = HydraulicSolver(project.id)
-        
         try:
-            result = solver.solve() # Магия происходит здесь
-            
-            if result['success']:
-                # 2. Если расчет прошел успешно, нам нужно вернуть СВЕЖИЕ данные.
-                # Мы заново достаем узлы и трубы из БД, так как сервис их обновил.
-                nodes = Node.objects.filter(project=project)
-                pipes = Pipe.objects.filter(project=project)
-
-                # 3. Превращаем объекты Python в JSON (сериализация)
-                nodes_data = NodeSerializer(nodes, many=True).data
-                pipes_data = PipeSerializer(pipes, many=True).data
-
-                # 4. Формируем красивый ответ
-                return Response({
-                    "status": "success",
-                    "message": result["message"],
-                    "data": {
-                        "nodes": nodes_data,
-                        "pipes": pipes_data
-                    }
-                }, status=200)
-            
+            solver.load_data()
+            demands, fixed_heads = solver.scenario_matrices(specs)
+        except (ValueError, TypeError, AttributeError) as e:
+            return Response({'status': 'error', 'message': str(e)}, status=400)
+
+        heads, flows, converged = solver.solve_scenarios(demands, fixed_heads)
+        pressures = np.clip(heads - solver.elevations, -100.0, 2000.0)
+
+        results = []
+        for k, spec in enumerate(specs):
+            ok = bool(converged[k])
+            results.append({
+                "name": spec.get('name', f"Сценарий {k + 1}"),
+                "converged": ok,
+                "heads": heads[k].tolist() if ok else None,
+                "pressures": pressures[k].tolist() if ok else None,
+                "flows": flows[k].tolist() if ok else None,
+            })
+
+        return Response({
+            "status": "success" if converged.all() else "partial",
+            "iterations": solver.iterations,
+            "node_ids": solver.node_ids.tolist(),
+            "pipe_ids": solver.pipe_ids.tolist(),
+            "scenarios": results,
+        })
+
+    @action(detail=True, methods=['get'])
+    def results(self, request, pk=None):
+        """
+        Результаты последнего расчета без геометрии - столбцами (см. results.py).
+        URL: GET /api/projects/{id}/results/?layer=nodes|pipes
+             &fields=calculated_pressure,...&dtype=float32|float64&encoding=binary|msgpack
+        Возвращает: двоичный пакет (application/octet-stream) или MessagePack (application/msgpack).
+        """
+        project = self.get_object()
+        params = request.query_params
+        encoding = params.get('encoding', 'binary')
+        dtype = params.get('dtype', 'float32')
+        fields = [field for field in params.get('fields', '').split(',') if field]
+
+        if encoding not in ENCODINGS or dtype not in DTYPES:
+            return Response({'status': 'error', 'message': "encoding: binary | msgpack, dtype: float32 | float64"}, status=400)
+        try:
+            layer = params.get('layer', 'nodes')
+            ids, values = load_results(project.id, layer, fields)
+            if encoding == 'msgpack':
+                return HttpResponse(encode_msgpack(layer, ids, values, DTYPES[dtype]), content_type='application/msgpack')
+            return HttpResponse(encode_binary(ids, values, DTYPES[dtype]), content_type='application/octet-stream')
+        except ValueError as e:
+            return Response({'status': 'error', 'message': str(e)}, status=400)
+
+    @action(detail=True, methods=['get'])
+    def network(self, request, pk=None):
+        """
+        Узлы и трубы проекта одним ответом (потоком, см. geojson.py).
+        URL: GET /api/projects/{id}/network/?node_fields=name,elevation&pipe_fields=diameter
+        (без *_fields - все поля). ETag - по версии сети проекта (Project.revision):
+        при совпадении If-None-Match ответ 304 без тела.
+        Возвращает: {"project", "revision", "nodes": FeatureCollection, "pipes": FeatureCollection}
+        """
+        project = self.get_object()
+        selected = {}
+        for layer, model in (('node_fields', Node), ('pipe_fields', Pipe)):
+            names = request.query_params.get(layer)
+            selected[layer] = [name for name in names.split(',') if name] if names is not None else None
+            try:
+                property_fields(model, 'geometry', selected[layer])
+            except ValueError as e:
+                return Response({'status': 'error', 'message': str(e)}, status=400)
+
+        variant = hashlib.sha256(repr(sorted(selected.items())).encode()).hexdigest()[:12]
+        etag = f'"{project.id}-{project.revision}-{variant}"'
+        if etag_matches(request, etag):
+            response = HttpResponse(status=304)
+        else:
+            options = {
+                "chunk_size": getattr(settings, 'HYDRAULIC_GEOJSON_CHUNK_SIZE', 2000),
+                "use_postgis": getattr(settings, 'HYDRAULIC_GEOJSON_POSTGIS', True),
+            }
+            nodes = stream_feature_collection(
+                Node.objects.filter(project=project).order_by('pk'), fields=selected['node_fields'], **options
+            )
+            pipes = stream_feature_collection(
+                Pipe.objects.filter(project=project).order_by('pk'), fields=selected['pipe_fields'], **options
+            )
+
+            def content():
+                yield f'{{"project":{project.id},"revision":{project.revision},"nodes":'.encode()
+                yield from nodes
+                yield b',"pipes":'
+                yield from pipes
+                yield b'}'
+
+            response = StreamingHttpResponse(content(), content_type='application/json')
+        response['ETag'] = etag
+        # Кэш браузера перепроверяет ответ при каждом запросе (If-None-Match)
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
+    def tiles(self, request, pk=None, z=None, x=None, y=None):
+        """
+        Векторный тайл (Mapbox Vector Tile) узлов и труб проекта с результатами расчета (см. tiles.py).
+        URL: GET /api/projects/{id}/tiles/{z}/{x}/{y}.mvt (маршрут - в urls.py)
+        Тайл кэшируется по версии сети проекта (Project.revision): после правки сети
+        или расчета ключ меняется, старые тайлы вытесняются по таймауту кэша.
+        """
+        project = self.get_object()
+        if not supports_tiles():
+            return Response({'status': 'error', 'message': "Векторные тайлы требуют PostGIS"}, status=501)
+        z, x, y = int(z), int(x), int(y)
+
+        etag = f'"{project.id}-{project.revision}-{z}-{x}-{y}"'
+        if etag_matches(request, etag):
+            response = HttpResponse(status=304)
+        else:
+            key = f'hydraulic:tile:{project.id}:{project.revision}:{z}:{x}:{y}'
+            tile = cache.get(key)
+            if tile is None:
+                try:
+                    tile = render_tile(project.id, z, x, y)
+                except ValueError as e:
+                    return Response({'status': 'error', 'message': str(e)}, status=400)
+                cache.set(key, tile, getattr(settings, 'HYDRAULIC_TILE_CACHE_TIMEOUT', 24 * 3600))
+            response = HttpResponse(tile, content_type='application/vnd.mapbox-vector-tile')
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
+    @action(detail=True, methods=['get', 'post'])
+    def inp(self, request, pk=None):
+        """
+        Обмен сетью в формате EPANET (см. epanet.py).
+        URL: GET  /api/projects/{id}/inp/ - выгрузка .inp (потоком);
+             POST /api/projects/{id}/inp/ - загрузка файла (multipart, поле "file") в проект.
+        Возвращает (POST): число созданных узлов и труб и пропущенные элементы.
+        """
+        project = self.get_object()
+        if request.method == 'GET':
+            response = StreamingHttpResponse(
+                (line.encode('utf-8') for line in export_inp(project)), content_type='text/plain; charset=utf-8'
+            )
+            response['Content-Disposition'] = f'attachment; filename="project_{project.id}.inp"'
+            return response
+
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({'status': 'error', 'message': "Ожидается файл .inp в поле file"}, status=400)
+        try:
+            report = import_inp(project, upload)
+        except ValueError as e:
+            return Response({'status': 'error', 'message': str(e)}, status=400)
+        return Response({'status': 'success', **report}, status=201)
+
+    @action(detail=True, methods=['post'])
+    def batch(self, request, pk=None):
+        """
+        Пакет правок узлов и труб одной транзакцией (см. batch.py).
+        URL: POST /api/projects/{id}/batch/
+        Тело: {"nodes": {"create": [...], "update": [...], "delete": [...]}, "pipes": {...}};
+        трубы могут ссылаться на создаваемые узлы по их temp_id.
+        Возвращает: {"created": {"nodes": {temp_id: id}, "pipes": {...}}, "updated", "deleted", "revision"}
+        или 400 со списком всех ошибок пакета (ничего не записывается).
+        """
+        project = self.get_object()
+        batch = BatchEdit(project, request.data)
+        errors = batch.validate()
+        if errors:
+            return Response({'status': 'error', 'message': "Пакет не применен", 'errors': errors}, status=400)
+        return Response({'status': 'success', **batch.apply()})
+
+
+# ViewSet для Задач расчета: статус, результат и отмена
+class CalculationJobViewSet(viewsets.ReadOnlyModelViewSet):
+    queryset = CalculationJob.objects.all()
+    serializer_class = CalculationJobSerializer
+    filterset_fields = ['project', 'status']
+
+    RESULT_MODES = ('full', 'results', 'delta')
+
+    def retrieve(self, request, *args, **kwargs):
+        """
+        Статус задачи. URL: GET /api/calculations/{id}/?mode=full|results|delta&tolerance=1e-6
+        После успешного расчета (установившийся режим) в поле "data":
+        - full (по умолчанию) - свежие узлы и трубы проекта (GeoJSON из БД);
+        - results - только id и результаты из истории расчетов (details.run), без запросов
+          к узлам и трубам:
+          {"nodes": {"ids", "head", "pressure"}, "pipes": {"ids", "flow_rate", "velocity", "head_loss"}};
+        - delta - то же, но только элементы, изменившиеся относительно прошлого расчета
+          больше чем на tolerance (и элементы без прошлого расчета).
+        Если расчет не записан в историю, results и delta отвечают как full.
+        """
+        job = self.get_object()
+        data = self.get_serializer(job).data
+        mode = request.query_params.get('mode', 'full')
+        if mode not in self.RESULT_MODES:
+            return Response({'status': 'error', 'message': f"mode: {' | '.join(self.RESULT_MODES)}"}, status=400)
+        try:
+            tolerance = float(request.query_params.get('tolerance', 1e-6))
+        except ValueError:
+            return Response({'status': 'error', 'message': "tolerance должен быть числом"}, status=400)
+
+        run_id = (job.details or {}).get('run')
+        run = CalculationRun.objects.filter(pk=run_id).first() if run_id and mode != 'full' else None
+        if job.status == CalculationJob.STATUS_SUCCESS and run is not None:
+            if mode == 'results':
+                data['data'] = run_results(run)
             else:
-                # Если математика не сошлась
-                return Response({
-                    "status": "error",
-                    "message": result["message"]
-                }, status=400)
+                data['data'] = run_results(run, previous_run(run), tolerance)
+        elif job.status == CalculationJob.STATUS_SUCCESS:
+            nodes = Node.objects.filter(project_id=job.project_id)
+            pipes = Pipe.objects.filter(project_id=job.project_id)
+            data['data'] = {
+                "nodes": NodeSerializer(nodes, many=True).data,
+                "pipes": PipeSerializer(pipes, many=True).data
+            }
+
+        return Response(data)
+
+    @action(detail=True, methods=['post'])
+    def cancel(self, request, pk=None):
+        """
+        Отмена задачи. URL: POST /api/calculations/{id}/cancel/
+        """
+        job = self.get_object()
+        if not cancel_job(job):
+            return Response({'status': 'error', 'message': "Задача уже завершена"}, status=409)
+
+        job.refresh_from_db()
+        return Response(self.get_serializer(job).data)
+
+
+# ViewSet для Результатов расчета во времени
+class ExtendedPeriodRunViewSet(viewsets.ReadOnlyModelViewSet):
+    queryset = ExtendedPeriodRun.objects.all()
+    serializer_class = ExtendedPeriodRunSerializer
+    filterset_fields = ['project']
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == 'list':
+            # Массивы результатов в списке не нужны
+            queryset = queryset.defer('node_ids', 'pipe_ids', 'heads', 'pressures', 'flows')
+        return queryset
+
+    def retrieve(self, request, *args, **kwargs):
+        """
+        Результаты одного шага. URL: GET /api/simulations/{id}/?step=0
+        Возвращает: {"nodes": {id: {"head", "pressure"}}, "pipes": {id: {"flow"}}}
+        """
+        run = self.get_object()
+        data = self.get_serializer(run).data
+        try:
+            step = int(request.query_params.get('step', 0))
+        except ValueError:
+            return Response({'status': 'error', 'message': "step должен быть целым числом"}, status=400)
+        if not 0 <= step < run.step_count:
+            return Response({'status': 'error', 'message': f"step вне диапазона 0..{run.step_count - 1}"}, status=400)
+
+        node_ids = unpack_array(run.node_ids).tolist()
+        pipe_ids = unpack_array(run.pipe_ids).tolist()
+        heads = unpack_array(run.heads)[step].tolist()
+        pressures = unpack_array(run.pressures)[step].tolist()
+        flows = unpack_array(run.flows)[step].tolist()
+
+        data['step'] = step
+        data['time'] = step * run.timestep
+        data['nodes'] = {nid: {"head": h, "pressure": p} for nid, h, p in zip(node_ids, heads, pressures)}
+        data['pipes'] = {pid: {"flow": q} for pid, q in zip(pipe_ids, flows)}
+        return Response(data)
+
+    @action(detail=True, methods=['get'])
+    def series(self, request, pk=None):
+        """
+        Временной ряд одного элемента.
+        URL: GET /api/simulations/{id}/series/?node=ID  или  ?pipe=ID
+        """
+        run = self.get_object()
+        times = [k * run.timestep for k in range(run.step_count)]
 
+        for param, ids_field, value_fields in (
+            ('node', 'node_ids', ('heads', 'pressures')),
+            ('pipe', 'pipe_ids', ('flows',)),
+        ):
+            element_id = request.query_params.get(param)
+            if element_id is None:
+                continue
+            try:
+                element_id = int(element_id)
+            except ValueError:
+                return Response({'status': 'error', 'message': f"{param} должен быть целым числом"}, status=400)
+            ids = unpack_array(getattr(run, ids_field))
+            position = np.flatnonzero(ids == element_id)
+            if position.size == 0:
+                return Response({'status': 'error', 'message': f"Элемент {element_id} не найден в расчете"}, status=404)
+            series = {field: unpack_array(getattr(run, field))[:, position[0]].tolist() for field in value_fields}
+            return Response({"time": times, param: element_id, **series})
+
+        return Response({'status': 'error', 'message': "Укажите параметр node или pipe"}, status=400)
+
+
+# ViewSet для Истории расчетов: результаты и сравнение без чтения узлов и труб
+class CalculationRunViewSet(viewsets.ReadOnlyModelViewSet):
+    queryset = CalculationRun.objects.all()
+    serializer_class = CalculationRunSerializer
+    filterset_fields = ['project']
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == 'list':
+            # Массивы результатов в списке не нужны
+            queryset = queryset.defer(*BLOB_FIELDS)
+        return queryset
+
+    def layer_params(self, request):
+        """(слой, поля, dtype, encoding) из параметров запроса; ValueError при ошибке."""
+        params = request.query_params
+        encoding = params.get('encoding', 'json')
+        dtype = params.get('dtype', 'float32')
+        if encoding not in ('json', 'binary') or dtype not in DTYPES:
+            raise ValueError("encoding: json | binary, dtype: float32 | float64")
+        fields = [field for field in params.get('fields', '').split(',') if field]
+        return params.get('layer', 'nodes'), fields, DTYPES[dtype], encoding
+
+    def retrieve(self, request, *args, **kwargs):
+        """
+        Результаты расчета по слою.
+        URL: GET /api/runs/{id}/?layer=nodes|pipes&fields=heads,...&encoding=json|binary&dtype=float32|float64
+        Поля: nodes - heads, pressures; pipes - flow_rates, velocities, head_losses.
+        Возвращает: {..., "layer", "ids", "values": {поле: [...]}} или двоичный пакет (см. results.py).
+        """
+        run = self.get_object()
+        try:
+            layer, fields, dtype, encoding = self.layer_params(request)
+            ids, values = run_arrays(run, layer, fields)
+        except ValueError as e:
+            return Response({'status': 'error', 'message': str(e)}, status=400)
+
+        if encoding == 'binary':
+            return HttpResponse(encode_binary(ids, values, dtype), content_type='application/octet-stream')
+        data = self.get_serializer(run).data
+        data['layer'] = layer
+        data['ids'] = ids.tolist()
+        data['values'] = {field: column.tolist() for field, column in values.items()}
+        return Response(data)
+
+    @action(detail=True, methods=['get'])
+    def diff(self, request, pk=None):
+        """
+        Сравнение с другим расчетом того же проекта.
+        URL: GET /api/runs/{id}/diff/?base=ID&layer=nodes|pipes&fields=...&encoding=json|binary
+        Возвращает: {"base", "run", "layer", "ids" (общие), "values": {поле: run - base},
+        "summary": {поле: {"max_abs", "mean_abs"}}, "added", "removed"};
+        binary - только ids и разности (см. results.py).
+        """
+        run = self.get_object()
+        try:
+            base = CalculationRun.objects.get(pk=int(request.query_params['base']), project_id=run.project_id)
+        except (KeyError, ValueError):
+            return Response({'status': 'error', 'message': "Укажите base - id расчета для сравнения"}, status=400)
+        except CalculationRun.DoesNotExist:
+            return Response({'status': 'error', 'message': "Расчет base не найден в проекте"}, status=404)
+        try:
+            layer, fields, dtype, encoding = self.layer_params(request)
+            diff = diff_runs(base, run, layer, fields)
         except ValueError as e:
-            # Ошибки валидации данных (например, нет узлов)
             return Response({'status': 'error', 'message': str(e)}, status=400)
-        except Exception as e:
-            # Любые другие непредвиденные ошибки
-            return Response({'status': 'error', 'message': f"Internal error: {str(e)}"}, status=500)
+
+        if encoding == 'binary':
+            return HttpResponse(encode_binary(diff['ids'], diff['values'], dtype), content_type='application/octet-stream')
+        return Response({
+            "base": base.id,
+            "run": run.id,
+            "layer": layer,
+            "ids": diff['ids'].tolist(),
+            "values": {field: column.tolist() for field, column in diff['values'].items()},
+            "summary": diff['summary'],
+            "added": diff['added'].tolist(),
+            "removed": diff['removed'].tolist(),
+        })
+
+
+# ViewSet для Шаблонов потребления
+class DemandPatternViewSet(viewsets.ModelViewSet):
+    queryset = DemandPattern.objects.all()
+    serializer_class = DemandPatternSerializer
+    filterset_fields = ['project']
+
+
+class StreamingGeoJSONListMixin:
+    """
+    Список объектов слоя (GET ?format=json) - потоком FeatureCollection (см. geojson.py)
+    вместо сборки всего ответа сериализатором в памяти. Другие форматы
+    (браузерный API) и постраничная выдача - обычным list.
+    """
+    geo_field = 'geometry'
+
+    def list(self, request, *args, **kwargs):
+        if self.paginator is not None or getattr(request.accepted_renderer, 'format', None) != 'json':
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset()).order_by('pk')
+        stream = stream_feature_collection(
+            queryset,
+            geo_field=self.geo_field,
+            chunk_size=getattr(settings, 'HYDRAULIC_GEOJSON_CHUNK_SIZE', 2000),
+            use_postgis=getattr(settings, 'HYDRAULIC_GEOJSON_POSTGIS', True),
+        )
+        return StreamingHttpResponse(stream, content_type='application/json')
 
 
 # ViewSet для Узлов
-class NodeViewSet(viewsets.ModelViewSet):
+class NodeViewSet(StreamingGeoJSONListMixin, viewsets.ModelViewSet):
     queryset = Node.objects.all()
     serializer_class = NodeSerializer
     
@@ -75,7 +567,17 @@ class NodeViewSet(viewsets.ModelViewSet):
     filterset_fields = ['project'] 
 
 # ViewSet для Труб
-class PipeViewSet(viewsets.ModelViewSet):
+class PipeViewSet(StreamingGeoJSONListMixin, viewsets.ModelViewSet):
     queryset = Pipe.objects.all()
     serializer_class = PipeSerializer
     filterset_fields = ['project']
+
+
+def metrics_view(request):
+    """
+    Счетчики расчетов процесса в текстовом формате Prometheus.
+    URL: GET /api/metrics/ (отключается настройкой HYDRAULIC_METRICS_ENABLED = False)
+    """
+    if not getattr(settings, 'HYDRAULIC_METRICS_ENABLED', True):
+        raise Http404
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')